@@ -1,22 +1,53 @@
 import streamlit as st
 import json
-
-from es.RupeeLogicEngine import RupeeLogicEngine, UserProfile, InvestmentGoal, Allocation
-from core.config import config
+import re
+import uuid
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from core.config import LLMUnavailable, config
+from core.extraction import (
+    apply_extracted,
+    describe_collected,
+    describe_fields,
+    describe_rejected,
+    missing_fields,
+)
+from core.recommendation import (
+    asks_what_would_change,
+    build_recommendation,
+    prompt_context,
+    what_would_change_answer,
+)
+from core.report import render_report
+from core.speculation import SpeculativeRecommendations
+from core.knowledge_base import knowledge_base
+from core.profiling import profile_request
+from core.tracing import tracer
+from core.session_store import chat_sessions, session_links
+from core.transcripts import ChatHistory, transcript_store
 
 # Page configuration
 st.title("💬 RupeeLogic Chat Assistant")
 st.markdown("Ask me about your investment portfolio in natural language!")
 
 
-# Load knowledge base
-@st.cache_data
-def load_knowledge_base():
-    with open("app/data/knowledge_base.json", "r") as f:
-        return json.load(f)
-
-
-knowledge_base = load_knowledge_base()
+# Load knowledge base (hot-reloaded by the registry when the file changes)
+kb = knowledge_base.data
+
+# The conversation id lives in the Streamlit session; the URL only carries a
+# signed, expiring link to it for this browser, so the conversation survives
+# reloads and worker restarts and moves between replicas (see core/session_store.py)
+browser = st.context.headers.get("User-Agent", "")
+if "sid" not in st.session_state:
+    sid = session_links.verify(st.query_params.get("session"), browser)
+    if sid is None or not re.fullmatch(r"[0-9a-f]{32}", sid):
+        sid = uuid.uuid4().hex
+    elif "messages" not in st.session_state:
+        chat_sessions.rehydrate(sid, st.session_state)
+    st.session_state.sid = sid
+sid = st.session_state.sid
+if session_links.needs_refresh(st.query_params.get("session"), sid, browser):
+    st.query_params["session"] = session_links.issue(sid, browser)
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -45,8 +76,28 @@ if "recommendation_generated" not in st.session_state:
 if "recommendation_context" not in st.session_state:
     st.session_state.recommendation_context = None
 
-# Display chat messages
-for message in st.session_state.messages:
+if "speculation" not in st.session_state:
+    st.session_state.speculation = SpeculativeRecommendations()
+
+if "chat_history" not in st.session_state:
+    st.session_state.chat_history = ChatHistory(
+        store=transcript_store,
+        archived=st.session_state.pop("restored_archived_messages", 0),
+    )
+
+# Traces of this session's turns carry its id (see core/tracing.py)
+script_ctx = get_script_run_ctx()
+session_id = script_ctx.session_id if script_ctx else None
+
+# Display chat messages: the latest ones, older turns a page at a time
+chat_history = st.session_state.chat_history
+chat_history.spill(sid, st.session_state.messages)
+hidden = chat_history.hidden_count(st.session_state.messages)
+if hidden and st.button(
+    f"⬆️ Show earlier messages ({hidden})", key="show_earlier_messages"
+):
+    chat_history.pages_shown += 1
+for message in chat_history.visible(sid, st.session_state.messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
@@ -64,7 +115,9 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
     ):
         # Handle follow-up questions about the recommendation
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
+            with st.spinner("Thinking..."), tracer.trace(
+                "chat_turn", session_id, stage="followup", sid=sid
+            ), profile_request("chat", st.query_params.get("profile")) as profile:
                 try:
                     followup_prompt = f"""
                         You are a financial advisor assistant answering follow-up questions about an investment recommendation.
@@ -76,12 +129,13 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
                         - ONLY use the information provided in the recommendation context below
                         - If asked about something not in the context, politely say you can only discuss the provided recommendations
                         - If asked a non-finance question, politely redirect to investment topics
+                        - If asked what would change the recommendation, use the "what_would_change" entries of the context
 
                         User's Profile:
                         {json.dumps(st.session_state.user_data, indent=2)}
 
                         Recommendation Context (Expert System Output):
-                        {st.session_state.recommendation_context}
+                        {prompt_context(st.session_state.recommendation_context)}
 
                         User's follow-up question: {prompt}
 
@@ -96,12 +150,34 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
                         {"role": "user", "content": followup_prompt},
                     ]
 
-                    answer = config.chat_llm(messages)
+                    answer = config.chat_llm(messages, call_type="followup")
+                    profile.tag(user_data=st.session_state.user_data, stage="followup")
                     st.markdown(answer)
                     st.session_state.messages.append(
                         {"role": "assistant", "content": answer}
                     )
 
+                except LLMUnavailable:
+                    if asks_what_would_change(prompt):
+                        # Answered from the rule thresholds, without the LLM
+                        answer = what_would_change_answer(
+                            st.session_state.recommendation_context
+                        )
+                        st.markdown(answer)
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": answer}
+                        )
+                    else:
+                        # The LLM is overloaded or down; the report above was rendered locally
+                        unavailable_message = (
+                            "I can't answer follow-up questions right now. Your full "
+                            "recommendation report is shown above - please try again in a moment."
+                        )
+                        st.warning(unavailable_message)
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": unavailable_message}
+                        )
+
                 except Exception as e:
                     error_message = (
                         f"I encountered an error: {str(e)}. Please try again."
@@ -113,8 +189,11 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
     else:
         # Extract information using GPT-4o-mini
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing your information..."):
+            with st.spinner("Analyzing your information..."), tracer.trace(
+                "chat_turn", session_id, stage="extraction", sid=sid
+            ) as turn, profile_request("chat", st.query_params.get("profile")) as profile:
                 # Create system prompt for information extraction
+                still_missing = missing_fields(st.session_state.user_data)
                 system_prompt = f"""
                     You are a financial advisor assistant helping users fill out their investment profile. 
 
@@ -123,36 +202,24 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
                     - DO NOT answer questions outside the investment/finance domain
                     - If user asks non-finance questions, politely redirect them to investment topics
 
-                    Current user data collected:
-                    {json.dumps(st.session_state.user_data, indent=2)}
-
                     Your tasks:
-                    1. Extract ANY financial information from the user's message and update the relevant fields
-                    2. Check which fields are still missing (have None values)
-                    3. If all required fields are filled, indicate that you're ready to generate recommendations
-                    4. If fields are missing, ask for the missing information in a friendly way
+                    1. Extract any of the missing fields below from the user's message
+                    2. If the user corrects a field already collected, extract its new value too
+                    3. If you extracted every missing field, confirm that you'll generate recommendations
+                    4. Otherwise, ask for the fields you could not extract in a friendly way
                     5. If user asks non-investment questions, politely say you can only help with investment advice
 
-                    Field descriptions:
-                    - age: User's age (integer between 18-80)
-                    - monthly_income: Monthly income in LKR (integer)
-                    - monthly_expenses: Monthly expenses in LKR (integer)
-                    - current_savings: Total savings in LKR (integer)
-                    - has_high_interest_debt: Whether they have credit card debt > 15% APR (true/false)
-                    - goal_type: One of: "Wealth Building", "Retirement", "Child Education", "Home Purchase", "Emergency Fund"
-                    - time_horizon: Investment timeline in years (integer, 1-20+)
-                    - risk_tolerance: One of: "Low", "Moderate", "High"
+                    Missing fields:
+                    {describe_fields(still_missing) or "- none"}
+
+                    Already collected (the user may correct these):
+                    {describe_collected(st.session_state.user_data) or "- none"}
 
                     Respond in JSON format:
                     {{
-                        "extracted_data": {{"field_name": value}},  // Only include fields you extracted from user message
-                        "updated_user_data": {{...}},  // Complete user data with updates
-                        "missing_fields": ["field1", "field2"],  // List of fields that are still None
-                        "all_fields_complete": true/false,
-                        "message_to_user": "Your friendly response asking for missing info or confirming you'll generate recommendations"
+                        "extracted_data": {{"field_name": value}},  // Only fields found in the user's message
+                        "message_to_user": "Your friendly reply"
                     }}
-
-                User message: {prompt}
                 """.strip()
 
                 try:
@@ -161,16 +228,27 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
                         {"role": "user", "content": prompt},
                     ]
 
-                    result = config.chat_llm_json(messages)
-
-                    # Update user data with extracted information
-                    if "updated_user_data" in result:
-                        st.session_state.user_data.update(result["updated_user_data"])
+                    with tracer.span("extraction") as span:
+                        result = config.chat_llm_json(messages, call_type="extraction")
+
+                        # Update user data with extracted information; values of the
+                        # wrong type or out of range are not stored and asked for again
+                        _, rejected = apply_extracted(
+                            st.session_state.user_data, result.get("extracted_data")
+                        )
+                        all_fields_complete = not missing_fields(st.session_state.user_data)
+                        span.set_attribute(
+                            "fields_extracted", len(result.get("extracted_data") or {})
+                        )
+                    turn.set_attribute("profile_complete", all_fields_complete)
+                    profile.tag(user_data=st.session_state.user_data, stage="extraction")
 
                     # Display assistant response
                     assistant_message = result.get(
                         "message_to_user", "Let me help you with that."
                     )
+                    if rejected:
+                        assistant_message += "\n\n" + describe_rejected(rejected)
                     st.markdown(assistant_message)
                     st.session_state.messages.append(
                         {"role": "assistant", "content": assistant_message}
@@ -178,213 +256,109 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
 
                     # If all fields are complete, run the expert system
                     if (
-                        result.get("all_fields_complete", False)
+                        all_fields_complete
                         and not st.session_state.recommendation_generated
                     ):
                         st.session_state.recommendation_generated = True
 
-                        # Run expert system
-                        with st.spinner("Running expert system analysis..."):
-                            engine = RupeeLogicEngine()
-                            engine.reset()
-
-                            # Declare facts
-                            engine.declare(
-                                UserProfile(
-                                    age=st.session_state.user_data["age"],
-                                    monthly_income=st.session_state.user_data[
-                                        "monthly_income"
-                                    ],
-                                    monthly_expenses=st.session_state.user_data[
-                                        "monthly_expenses"
-                                    ],
-                                    current_savings=st.session_state.user_data[
-                                        "current_savings"
-                                    ],
-                                    has_high_interest_debt=st.session_state.user_data[
-                                        "has_high_interest_debt"
-                                    ],
-                                    risk_tolerance=st.session_state.user_data[
-                                        "risk_tolerance"
-                                    ],
+                        # Use the speculative result if the last answer was precomputed
+                        precomputed = st.session_state.speculation.take(
+                            st.session_state.user_data
+                        )
+                        turn.set_attribute("speculation_hit", precomputed is not None)
+                        if precomputed is not None:
+                            context, final_recommendation = precomputed
+                        else:
+                            # Run expert system and render the report from a template
+                            with st.spinner("Running expert system analysis..."), tracer.span(
+                                "recommendation"
+                            ):
+                                context = build_recommendation(
+                                    st.session_state.user_data
                                 )
-                            )
-                            engine.declare(
-                                InvestmentGoal(
-                                    goal_type=st.session_state.user_data["goal_type"],
-                                    time_horizon=st.session_state.user_data[
-                                        "time_horizon"
-                                    ],
-                                )
-                            )
-
-                            # Run engine
-                            engine.run()
-
-                            # Get allocations and fired rules
-                            allocations = [
-                                f
-                                for f in engine.facts.values()
-                                if isinstance(f, Allocation)
-                            ]
-                            fired_rules = engine.fired_rules
-                            alternative_plans = engine.alternative_plans
-
-                            # Get asset details
-                            asset_details = knowledge_base["asset_classes"]
-
-                            # Prepare PRIMARY PLAN data for LLM
-                            primary_allocations = [
-                                a
-                                for a in allocations
-                                if a.get("plan_type") == "primary"
-                            ]
-                            if not primary_allocations:  # Fallback for old rules
-                                primary_allocations = allocations
-
-                            primary_plan_summary = []
-                            for alloc in primary_allocations:
-                                asset_info = asset_details.get(alloc["asset_class"], {})
-                                primary_plan_summary.append(
+                                final_recommendation = render_report(context)
+                        rules_fired = [rule_id for rule_id, _ in context["fired_rules"]]
+                        turn.set_attribute("rule_fired", rules_fired)
+                        profile.tag(
+                            rules_fired=rules_fired, speculation_hit=precomputed is not None
+                        )
+
+                        # Store recommendation context for follow-up questions
+                        st.session_state.recommendation_context = context
+
+                        # Display the recommendation
+                        st.markdown("---")
+                        report_placeholder = st.empty()
+                        with tracer.span("render"):
+                            report_placeholder.markdown(final_recommendation)
+
+                        # Optionally let the LLM polish the wording; the template report stays if it fails or times out
+                        if config.report_polish and config.llm_available:
+                            with st.spinner("Polishing your report..."), tracer.span(
+                                "report.polish"
+                            ) as span:
+                                polish_prompt = f"""
+                                    Improve the readability and tone of the investment recommendation report below.
+
+                                    IMPORTANT INSTRUCTIONS:
+                                    - Keep every section, table, plan, percentage, confidence level and LKR amount exactly as given
+                                    - DO NOT add information that is not in the report
+                                    - DO NOT hallucinate or make assumptions
+                                    - Return only the improved report in markdown format
+
+                                    Report:
+                                    {final_recommendation}
+                                    """.strip()
+
+                                messages = [
                                     {
-                                        "asset_class": asset_info.get(
-                                            "name", alloc["asset_class"]
-                                        ),
-                                        "percentage": alloc["percent"],
-                                        "confidence": alloc.get("confidence", 85),
-                                        "reason": alloc.get("reason", ""),
-                                        "reference": alloc.get("reference", ""),
-                                        "risk": asset_info.get("risk", ""),
-                                        "return": asset_info.get(
-                                            "typical_return",
-                                            asset_info.get("return", ""),
-                                        ),
-                                        "examples": asset_info.get("examples", ""),
-                                    }
-                                )
-
-                            # Prepare ALTERNATIVE PLANS data
-                            alternative_plans_summary = []
-                            for alt_plan in alternative_plans:
-                                plan_allocations = []
-                                for alloc in alt_plan["allocations"]:
-                                    asset_info = asset_details.get(
-                                        alloc["asset_class"], {}
-                                    )
-                                    plan_allocations.append(
-                                        {
-                                            "asset_class": asset_info.get(
-                                                "name", alloc["asset_class"]
-                                            ),
-                                            "percentage": alloc["percent"],
-                                            "reason": alloc.get("reason", ""),
-                                            "reference": alloc.get("reference", ""),
-                                            "risk": asset_info.get("risk", ""),
-                                            "return": asset_info.get(
-                                                "typical_return",
-                                                asset_info.get("return", ""),
-                                            ),
-                                            "examples": asset_info.get("examples", ""),
-                                        }
+                                        "role": "system",
+                                        "content": "You are a professional Sri Lankan investment advisor. Provide clear, actionable advice with specific LKR amounts based ONLY on the provided expert system data. Do not hallucinate.",
+                                    },
+                                    {"role": "user", "content": polish_prompt},
+                                ]
+
+                                try:
+                                    polished = config.chat_llm(
+                                        messages,
+                                        timeout=config.report_polish_timeout,
+                                        cache=True,
+                                        call_type="report",
                                     )
-                                alternative_plans_summary.append(
-                                    {
-                                        "plan_name": alt_plan["plan_name"],
-                                        "confidence": alt_plan["confidence"],
-                                        "allocations": plan_allocations,
-                                    }
-                                )
-
-                            # Calculate investment amounts
-                            monthly_investable = (
-                                st.session_state.user_data["monthly_income"]
-                                - st.session_state.user_data["monthly_expenses"]
-                            )
-
-                            # Store recommendation context for follow-up questions
-                            st.session_state.recommendation_context = {
-                                "user_profile": st.session_state.user_data,
-                                "monthly_investable": monthly_investable,
-                                "fired_rules": fired_rules,
-                                "primary_plan": primary_plan_summary,
-                                "alternative_plans": alternative_plans_summary,
+                                except Exception:
+                                    polished = None
+                                span.set_attribute("polished", bool(polished))
+
+                                if polished:
+                                    final_recommendation = polished
+                                    report_placeholder.markdown(final_recommendation)
+
+                        st.session_state.messages.append(
+                            {
+                                "role": "assistant",
+                                "content": f"---\n{final_recommendation}",
                             }
-
-                            # Generate final recommendation using GPT
-                            recommendation_prompt = f"""
-                                You are a professional financial advisor. Generate a comprehensive, user-friendly investment recommendation report.
-
-                                IMPORTANT INSTRUCTIONS:
-                                - Base your recommendations ONLY on the data provided below
-                                - DO NOT add information not present in the expert system output
-                                - DO NOT hallucinate or make assumptions
-                                - Show the PRIMARY PLAN with its confidence level FIRST
-                                - Then show ALTERNATIVE PLANS if available
-
-                                User Profile:
-                                {json.dumps(st.session_state.user_data, indent=2)}
-
-                                Monthly Investable Amount: LKR {monthly_investable:,}
-
-                                Expert System Recommendations (Rules that fired):
-                                {json.dumps(fired_rules, indent=2)}
-
-                                PRIMARY INVESTMENT PLAN (Recommended - {primary_plan_summary[0]["confidence"] if primary_plan_summary else 85}% Confidence):
-                                {json.dumps(primary_plan_summary, indent=2)}
-
-                                ALTERNATIVE INVESTMENT PLANS (Optional):
-                                {json.dumps(alternative_plans_summary, indent=2)}
-
-                                Create a detailed recommendation report in markdown format with:
-
-                                1. **Executive Summary** - Brief overview with confidence level
-                                
-                                2. **🎯 PRIMARY INVESTMENT PLAN (Recommended - XX% Confidence)**
-                                   - Show this plan prominently as the main recommendation
-                                   - Specific LKR amounts for each asset (from savings and monthly)
-                                   - Why this plan is recommended
-                                   - Risk levels and expected returns
-                                   - Where to invest (specific institutions)
-                                
-                                3. **🔄 ALTERNATIVE INVESTMENT PLANS** (if available)
-                                   - Show each alternative plan with its confidence level
-                                   - Explain when to consider each alternative
-                                   - Specific allocations for each alternative
-                                
-                                4. **Expert System Reasoning** - Explain which rules fired and why
-                                
-                                5. **Important Reminders** - Key investment principles
-
-                            Use proper markdown formatting with headers, bullet points, bold text, and tables where appropriate.
-                            Make it very user-friendly and easy to understand.
-                            Clearly differentiate between PRIMARY and ALTERNATIVE plans.
-                            """.strip()
-
-                            messages = [
-                                {
-                                    "role": "system",
-                                    "content": "You are a professional Sri Lankan investment advisor. Provide clear, actionable advice with specific LKR amounts based ONLY on the provided expert system data. Do not hallucinate.",
-                                },
-                                {"role": "user", "content": recommendation_prompt},
-                            ]
-
-                            final_recommendation = config.chat_llm(messages)
-
-                            # Display the recommendation
-                            st.markdown("---")
-                            st.markdown(final_recommendation)
-                            st.session_state.messages.append(
-                                {
-                                    "role": "assistant",
-                                    "content": f"---\n{final_recommendation}",
-                                }
-                            )
-
-                            # Add option to ask follow-up questions
-                            st.markdown("---")
-                            st.info(
-                                "💡 Feel free to ask any follow-up questions about your portfolio!"
-                            )
+                        )
+
+                        # Add option to ask follow-up questions
+                        st.markdown("---")
+                        st.info(
+                            "💡 Feel free to ask any follow-up questions about your portfolio!"
+                        )
+
+                    elif not st.session_state.recommendation_generated:
+                        # Precompute the possible recommendations while the user answers
+                        st.session_state.speculation.start(st.session_state.user_data)
+
+                except LLMUnavailable:
+                    unavailable_message = (
+                        "I can't reach the assistant right now. Please try again in a moment, "
+                        "or use Form Mode for an instant recommendation."
+                    )
+                    st.warning(unavailable_message)
+                    st.session_state.messages.append(
+                        {"role": "assistant", "content": unavailable_message}
+                    )
 
                 except Exception as e:
                     error_message = (
@@ -395,6 +369,9 @@ if prompt := st.chat_input("Tell me about your financial situation..."):
                         {"role": "assistant", "content": error_message}
                     )
 
+    # Save the turn so another worker can pick the conversation up
+    chat_sessions.save(sid, st.session_state)
+
 # Sidebar - show collected data
 with st.sidebar:
     st.markdown("### 📊 Collected Information")
@@ -436,4 +413,9 @@ with st.sidebar:
         }
         st.session_state.recommendation_generated = False
         st.session_state.recommendation_context = None
+        # Candidates for the old profile must not answer the new conversation
+        st.session_state.speculation.cancel()
+        st.session_state.speculation = SpeculativeRecommendations()
+        st.session_state.chat_history.clear(sid)
+        chat_sessions.delete(sid, st.session_state)
         st.rerun()
@@ -1,34 +1,463 @@
 import os
 import json
-from openai import OpenAI
+import hashlib
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+from openai import (
+    OpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
 from dotenv import load_dotenv
+from tenacity import (
+    Retrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from core.knowledge_base import knowledge_base
+from core.llm_cache import LLMResponseCache
+from core.metrics import LLM_SECONDS, LLM_TOKENS, watch_cache
+from core.tracing import tracer
+
+# Provider errors worth retrying; anything else is returned to the caller at once
+TRANSIENT_ERRORS = (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised when the scheduler refuses an LLM call; callers fall back to local output."""
+
+
+class QuotaExceeded(LLMUnavailable):
+    """Raised when the calling session has used up its LLM quota."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Take one token, waiting up to timeout seconds. Returns False if none came free."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and rejects calls for
+    `cooldown` seconds; then lets a single trial call through (half-open) and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return (
+                self._opened_at is not None
+                and time.monotonic() - self._opened_at < self.cooldown
+            )
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a half-open trial call without deciding the circuit's state."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+def _current_session_id():
+    """The Streamlit session making the call, or None outside a script run."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def _stop_at(deadline):
+    """tenacity stop condition: no retry whose backoff would end after deadline."""
+
+    def stop(retry_state):
+        return time.monotonic() + (retry_state.upcoming_sleep or 0) >= deadline
+
+    return stop
+
+
+class LLMScheduler:
+    """
+    Process-wide gate in front of the LLM provider, shared by all sessions.
+
+    Every call passes, in order: the circuit breaker, the caller's session
+    quota, a bounded concurrency slot and the token bucket. Transient provider
+    errors are retried with jittered exponential backoff; the slot is released
+    while waiting between attempts. Calls that cannot start within
+    queue_timeout seconds raise LLMUnavailable instead of queueing further.
+
+    A call given a deadline (a time.monotonic() value) gets one budget for the
+    whole request: queueing, attempts and backoff. No retry is started that
+    would only begin after it, and queueing stops waiting at it; the call itself
+    should bound each attempt by the time left (see Config._complete()).
+    """
+
+    def __init__(
+        self,
+        max_concurrency,
+        rate,
+        burst,
+        session_quota,
+        quota_window,
+        max_attempts,
+        queue_timeout,
+        breaker,
+    ):
+        self.max_concurrency = max_concurrency
+        self.session_quota = session_quota
+        self.quota_window = quota_window
+        self.max_attempts = max_attempts
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate, burst)
+        self._session_calls = defaultdict(deque)
+        self._next_prune = 0
+        self._lock = threading.Lock()
+
+    @property
+    def circuit_open(self):
+        return self.breaker.is_open
+
+    def _check_quota(self, session_id):
+        if session_id is None or self.session_quota <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_prune:
+                # Forget sessions that have been idle for a whole window
+                for sid in [
+                    sid
+                    for sid, calls in self._session_calls.items()
+                    if not calls or now - calls[-1] > self.quota_window
+                ]:
+                    del self._session_calls[sid]
+                self._next_prune = now + 60
+            calls = self._session_calls[session_id]
+            while calls and now - calls[0] > self.quota_window:
+                calls.popleft()
+            if len(calls) >= self.session_quota:
+                raise QuotaExceeded("Session LLM quota exceeded")
+            calls.append(now)
+
+    def _queue_timeout(self, deadline):
+        if deadline is None:
+            return self.queue_timeout
+        return max(0, min(self.queue_timeout, deadline - time.monotonic()))
+
+    def _attempt(self, call, deadline):
+        if not self._slots.acquire(timeout=self._queue_timeout(deadline)):
+            raise LLMUnavailable("LLM is busy")
+        try:
+            if not self._bucket.acquire(self._queue_timeout(deadline)):
+                raise LLMUnavailable("LLM rate limit reached")
+            return call()
+        finally:
+            self._slots.release()
+
+    def run(self, call, session_id=None, deadline=None):
+        """
+        Run call() (one provider request) under the scheduler's limits, giving up
+        at deadline (time.monotonic()) if one is set.
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable("LLM circuit is open")
+        try:
+            self._check_quota(session_id or _current_session_id())
+        except LLMUnavailable:
+            self.breaker.release_trial()
+            raise
+
+        stop = stop_after_attempt(self.max_attempts)
+        if deadline is not None:
+            stop = stop | _stop_at(deadline)
+        retrying = Retrying(
+            retry=retry_if_exception_type(TRANSIENT_ERRORS),
+            wait=wait_random_exponential(multiplier=0.5, max=8),
+            stop=stop,
+            reraise=True,
+        )
+        try:
+            result = retrying(self._attempt, call, deadline)
+        except TRANSIENT_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # Local back-pressure or a request error: says nothing about provider health
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self):
+        """Return scheduler state for diagnostics."""
+        with self._lock:
+            sessions = len(self._session_calls)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "circuit_open": self.breaker.is_open,
+            "sessions": sessions,
+        }
+
+
+def request_key(request):
+    """
+    Hash identifying an LLM request: model, temperature, response format and the
+    exact messages (the timeout is left out).
+    """
+    normalized = {key: value for key, value in request.items() if key != "timeout"}
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the
+    call, callers arriving while it is in flight wait for and share its result
+    (or its exception). Exceptions of the private_errors types are about the
+    leading caller rather than the call (e.g. its session's quota), so waiters
+    run the call again themselves instead. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self, private_errors=()):
+        self.private_errors = tuple(private_errors)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, call):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result()
+            except self.private_errors:
+                return self.do(key, call)
+
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
 
 class Config:
 
     def __init__(self):
         load_dotenv()
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Retries are handled by the scheduler, with jitter and a circuit breaker.
+        # OPENAI_BASE_URL can point at a compatible server, e.g. tools/mock_openai.py
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,
+        )
 
-    def chat_llm_json(self, messages):
+        # The chat report is rendered from a template; the LLM only polishes its wording
+        self.report_polish = os.getenv("RUPEELOGIC_REPORT_POLISH", "true").lower() == "true"
+        self.report_polish_timeout = float(os.getenv("RUPEELOGIC_REPORT_POLISH_TIMEOUT", "20"))
+
+        self.llm_scheduler = LLMScheduler(
+            max_concurrency=int(os.getenv("RUPEELOGIC_LLM_MAX_CONCURRENCY", "8")),
+            rate=float(os.getenv("RUPEELOGIC_LLM_RATE", "5")),
+            burst=int(os.getenv("RUPEELOGIC_LLM_BURST", "10")),
+            session_quota=int(os.getenv("RUPEELOGIC_LLM_SESSION_QUOTA", "30")),
+            quota_window=float(os.getenv("RUPEELOGIC_LLM_QUOTA_WINDOW", "3600")),
+            max_attempts=int(os.getenv("RUPEELOGIC_LLM_MAX_ATTEMPTS", "3")),
+            queue_timeout=float(os.getenv("RUPEELOGIC_LLM_QUEUE_TIMEOUT", "10")),
+            breaker=CircuitBreaker(
+                threshold=int(os.getenv("RUPEELOGIC_LLM_BREAKER_THRESHOLD", "5")),
+                cooldown=float(os.getenv("RUPEELOGIC_LLM_BREAKER_COOLDOWN", "30")),
+            ),
+        )
+        # Identical requests in flight at the same time share one upstream call;
+        # a quota rejection is the leading session's own and is not shared
+        self.single_flight = SingleFlight(private_errors=(QuotaExceeded,))
+
+        # Persistent cache for report responses; an empty path disables it
+        cache_path = os.getenv("RUPEELOGIC_LLM_CACHE", ".cache/llm_responses.sqlite")
+        self.llm_cache = None
+        if cache_path:
+            self.llm_cache = LLMResponseCache(
+                cache_path,
+                max_bytes=int(float(os.getenv("RUPEELOGIC_LLM_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            )
+            knowledge_base.subscribe(
+                lambda version: self.llm_cache.purge_stale(knowledge_base.fingerprint)
+            )
+            # Counters only: stats() queries the database, too slow for every scrape
+            watch_cache(
+                "llm_responses",
+                lambda: {"hits": self.llm_cache.hits, "misses": self.llm_cache.misses},
+            )
+
+    @property
+    def llm_available(self):
+        """False while the circuit breaker is open; skip optional LLM calls then."""
+        return not self.llm_scheduler.circuit_open
+
+    def _complete(self, timeout=None, call_type="other", **request):
+        """
+        Send one chat completion through single-flight and the scheduler,
+        recording its latency and token usage under call_type. timeout bounds
+        the whole request, retries included; each attempt gets the time left.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def create():
+            if deadline is None:
+                return self.client.chat.completions.create(**request)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMUnavailable("LLM request timed out")
+            return self.client.chat.completions.create(timeout=remaining, **request)
+
+        def send():
+            # Only the caller that sends the request counts its tokens, not coalesced waiters
+            response = self.llm_scheduler.run(create, deadline=deadline)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                LLM_TOKENS.inc(usage.prompt_tokens or 0, call_type=call_type, kind="prompt")
+                LLM_TOKENS.inc(usage.completion_tokens or 0, call_type=call_type, kind="completion")
+            return response
+
+        start = time.perf_counter()
+        outcome = "error"
+        with tracer.span("llm.request", call_type=call_type, model=request["model"]) as span:
+            try:
+                response = self.single_flight.do(request_key(request), send)
+                outcome = "ok"
+            except LLMUnavailable:
+                outcome = "unavailable"
+                raise
+            finally:
+                LLM_SECONDS.observe(
+                    time.perf_counter() - start, call_type=call_type, outcome=outcome
+                )
+                span.set_attribute("outcome", outcome)
+
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span.set_attribute("prompt_tokens", usage.prompt_tokens)
+                span.set_attribute("completion_tokens", usage.completion_tokens)
+        return response
+
+    def chat_llm_json(self, messages, timeout=None, call_type="other"):
         """Chat with llm - json output"""
-        response = self.client.chat.completions.create(
+        response = self._complete(
             model="gpt-4o-mini",
             messages=messages,
             response_format={"type": "json_object"},
             temperature=0.5,
+            timeout=timeout,
+            call_type=call_type,
         )
 
         return json.loads(response.choices[0].message.content)
-    
-    def chat_llm(self, messages):
-        """chat with llm"""
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.5,
-        )
 
-        return response.choices[0].message.content
-    
-config = Config()
\ No newline at end of file
+    def chat_llm(self, messages, timeout=None, cache=False, call_type="other"):
+        """
+        chat with llm
+
+        With cache=True the response is looked up in, and saved to, the
+        persistent response cache. Only use it for prompts fully determined by
+        the expert system output, such as the recommendation report.
+        call_type labels the request in the LLM metrics (extraction, report, followup).
+        """
+        request = {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.5}
+        use_cache = cache and self.llm_cache is not None
+        if use_cache:
+            key = request_key(request)
+            with tracer.span("llm_cache.lookup") as span:
+                content = self.llm_cache.get(key, knowledge_base.fingerprint)
+                span.set_attribute("cache_hit", content is not None)
+            if content is not None:
+                return content
+
+        response = self._complete(timeout=timeout, call_type=call_type, **request)
+        content = response.choices[0].message.content
+
+        if use_cache and content:
+            self.llm_cache.put(key, knowledge_base.fingerprint, request["model"], content)
+        return content
+
+config = Config()
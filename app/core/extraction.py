@@ -0,0 +1,148 @@
+"""
+Delta-only profile extraction for Chat Mode.
+
+The extraction prompt describes the fields that are still missing and lists
+the ones already collected, which the user may correct; the LLM only returns
+what it extracted from the latest message plus the reply to show. Which fields
+are missing, and whether the profile is complete, is worked out here rather
+than by the model.
+
+Extracted values are converted to the types the engine expects (whole
+numbers, booleans, one of the form's options) and checked against the form's
+ranges before they are stored; a value that fails is not stored and the user
+is asked for it again.
+"""
+
+import json
+import math
+
+from es.counterfactual import CHOICES, LIMITS
+
+# Profile fields collected in Chat Mode and how the LLM should read them
+FIELD_DESCRIPTIONS = {
+    "age": "User's age (integer between 18-80)",
+    "monthly_income": "Monthly income in LKR (integer)",
+    "monthly_expenses": "Monthly expenses in LKR (integer)",
+    "current_savings": "Total savings in LKR (integer)",
+    "has_high_interest_debt": "Whether they have credit card debt > 15% APR (true/false)",
+    "goal_type": 'One of: "Wealth Building", "Retirement", "Child Education", "Home Purchase", "Emergency Fund"',
+    "time_horizon": "Investment timeline in years (integer, 1-20+)",
+    "risk_tolerance": 'One of: "Low", "Moderate", "High"',
+}
+
+FIELD_LABELS = {
+    "age": "age",
+    "monthly_income": "monthly income",
+    "monthly_expenses": "monthly expenses",
+    "current_savings": "current savings",
+    "has_high_interest_debt": "high-interest debt",
+    "goal_type": "investment goal",
+    "time_horizon": "investment timeline",
+    "risk_tolerance": "risk tolerance",
+}
+
+_AMOUNT_SUFFIXES = {"k": 1_000, "m": 1_000_000, "mn": 1_000_000}
+_YES = ("true", "yes", "y")
+_NO = ("false", "no", "n", "none")
+
+
+def _whole_number(value):
+    """value as an int; strings may use thousands separators, LKR/Rs and k/m suffixes."""
+    if isinstance(value, bool):
+        raise ValueError("expected a number")
+    if isinstance(value, str):
+        text = value.strip().lower().replace(",", "").replace(" ", "")
+        for prefix in ("lkr", "rs.", "rs"):
+            if text.startswith(prefix):
+                text = text[len(prefix):]
+                break
+        multiplier = 1
+        for suffix, factor in _AMOUNT_SUFFIXES.items():
+            if text.endswith(suffix) and text[: -len(suffix)]:
+                text, multiplier = text[: -len(suffix)], factor
+                break
+        try:
+            value = float(text) * multiplier
+        except ValueError:
+            raise ValueError("expected a number") from None
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError("expected a number")
+    # The rule thresholds are whole numbers (years, LKR)
+    return int(round(value))
+
+
+def coerce_field(field, value):
+    """
+    value converted to the type the engine uses for field, e.g. "150,000" ->
+    150000 or "high" -> "High". Raises ValueError, with what was expected, if
+    it cannot be converted or is out of range.
+    """
+    if field == "has_high_interest_debt":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in _YES + _NO:
+            return value.strip().lower() in _YES
+        raise ValueError("expected yes or no")
+    if field in CHOICES:
+        for option in CHOICES[field]:
+            if isinstance(value, str) and value.strip().lower() == option.lower():
+                return option
+        raise ValueError("expected one of " + ", ".join(CHOICES[field]))
+    number = _whole_number(value)
+    low, high = LIMITS[field]
+    if number < low or (high is not None and number > high):
+        bounds = f"between {low} and {high}" if high is not None else f"at least {low}"
+        raise ValueError(f"expected a value {bounds}")
+    return number
+
+
+def missing_fields(user_data):
+    """Fields that have not been collected yet, in the order they are asked for."""
+    return [field for field in FIELD_DESCRIPTIONS if user_data.get(field) is None]
+
+
+def describe_fields(fields):
+    """Markdown list of field descriptions for the extraction prompt."""
+    return "\n".join(f"- {field}: {FIELD_DESCRIPTIONS[field]}" for field in fields)
+
+
+def describe_collected(user_data):
+    """Markdown list of the fields collected so far, their values and descriptions."""
+    return "\n".join(
+        f"- {field} = {json.dumps(user_data[field])}: {FIELD_DESCRIPTIONS[field]}"
+        for field in FIELD_DESCRIPTIONS
+        if user_data.get(field) is not None
+    )
+
+
+def apply_extracted(user_data, extracted):
+    """
+    Merge the fields the LLM extracted into user_data, converted with
+    coerce_field(); a field already collected is overwritten (a correction).
+    Unknown fields and nulls are ignored. Returns (updated field names,
+    {field: reason} for the values that were rejected and not stored).
+    """
+    updated = []
+    rejected = {}
+    if not isinstance(extracted, dict):
+        return updated, rejected
+    for field, value in extracted.items():
+        if field not in FIELD_DESCRIPTIONS or value is None:
+            continue
+        try:
+            user_data[field] = coerce_field(field, value)
+        except ValueError as e:
+            rejected[field] = f"{value!r}: {e}"
+            continue
+        updated.append(field)
+    return updated, rejected
+
+
+def describe_rejected(rejected):
+    """A request to the user to repeat the rejected fields, or "" if there are none."""
+    if not rejected:
+        return ""
+    problems = "; ".join(
+        f"{FIELD_LABELS[field]} ({reason})" for field, reason in rejected.items()
+    )
+    return f"I couldn't use some of your answers: {problems}. Could you tell me these again?"
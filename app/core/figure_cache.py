@@ -0,0 +1,99 @@
+import threading
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from cachetools import LRUCache
+
+from core.knowledge_base import knowledge_base
+from core.metrics import watch_cache
+
+# Named palettes so the palette can be part of a hashable cache key
+PALETTES = {
+    "Bold": px.colors.qualitative.Bold,
+    "Pastel": px.colors.qualitative.Pastel,
+}
+
+
+class FigureCache:
+    """
+    Process-wide cache of allocation pie charts.
+
+    Plan templates are static per rule, so the same handful of charts are
+    requested by every session. The plotly express figures are kept in an LRU
+    cache bounded by entry count (a pie is about 7 KB as JSON), and a hit
+    returns a copy, so callers may change it without touching the cached one.
+    Copying still validates the figure and costs about half of px.pie.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._figures = LRUCache(maxsize=max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def allocation_pie(self, names, values, palette="Bold", height=450):
+        """Return a donut chart for the given asset names and percentages."""
+        key = (tuple(names), tuple(values), palette, height)
+
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if fig is None:
+            fig = self._build_pie(names, values, palette, height)
+            with self._lock:
+                self._figures[key] = fig
+
+        return go.Figure(fig)
+
+    def clear(self):
+        """Drop all cached figures."""
+        with self._lock:
+            self._figures.clear()
+
+    def stats(self):
+        """Return cache counters for diagnostics."""
+        with self._lock:
+            return {
+                "entries": len(self._figures),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    @staticmethod
+    def _build_pie(names, values, palette, height):
+        df = pd.DataFrame({"Asset Class": list(names), "Allocation (%)": list(values)})
+        fig = px.pie(
+            df,
+            values="Allocation (%)",
+            names="Asset Class",
+            title="",
+            hole=0.4,
+            color_discrete_sequence=PALETTES[palette],
+        )
+        fig.update_traces(
+            textposition="outside",
+            textinfo="label+percent",
+            textfont_size=14,
+            marker=dict(line=dict(color="white", width=2)),
+        )
+        fig.update_layout(
+            showlegend=False,
+            height=height,
+            font=dict(size=13, family="Arial"),
+            margin=dict(t=30, b=30, l=30, r=30),
+        )
+        return fig
+
+
+figure_cache = FigureCache()
+
+# Asset names come from the knowledge base, so a new version invalidates all charts
+knowledge_base.subscribe(lambda version: figure_cache.clear())
+watch_cache("figures", figure_cache.stats)
@@ -0,0 +1,348 @@
+"""
+Compiled, memory-mapped knowledge base snapshots.
+
+The JSON knowledge base is compiled into a compact binary file made of a
+deduplicated string table, per-field string index columns and numeric columns.
+Worker processes map the file read-only, so every process shares one physical
+copy through the page cache; strings are only decoded when they are read.
+
+Compile a snapshot (from the app/ directory):
+
+    python -m core.kb_snapshot
+    python -m core.kb_snapshot data/knowledge_base.json data/knowledge_base.bin
+
+Then point workers at it with RUPEELOGIC_KB_SNAPSHOT=app/data/knowledge_base.bin.
+
+Layout (little-endian): header, string offsets (u32), asset string columns (u32
+string indexes), provider link ranges (u32), provider links (u32 name/url pairs),
+numeric columns (f64, 8-byte aligned), UTF-8 string blob.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+
+from core.knowledge_base import (
+    KnowledgeBaseError,
+    parse_lkr_amount,
+    parse_return_range,
+    validate_knowledge_base,
+)
+
+SNAPSHOT_MAGIC = b"RLKB"
+SNAPSHOT_FORMAT_VERSION = 1
+
+# magic, format version, reserved, source fingerprint, string count,
+# asset count, link count, index of the JSON string holding other sections
+_HEADER = struct.Struct("<4sHH16sIIII")
+
+# String fields stored as columns; anything else goes to a per-asset JSON extras string
+ASSET_FIELDS = (
+    "name",
+    "description",
+    "risk",
+    "liquidity",
+    "return",
+    "typical_return",
+    "min_investment",
+    "examples",
+)
+NUMERIC_COLUMNS = ("min_investment_lkr", "return_low", "return_high")
+
+_NONE = 0xFFFFFFFF
+_U32 = 4
+_F64 = 8
+
+
+def _align(offset, size):
+    return (offset + size - 1) // size * size
+
+
+def _plain_links(links):
+    return isinstance(links, list) and all(
+        isinstance(link, dict)
+        and set(link) == {"name", "url"}
+        and all(isinstance(v, str) for v in link.values())
+        for link in links
+    )
+
+
+def compile_snapshot(source_path, output_path):
+    """Compile the JSON knowledge base at source_path into a binary snapshot."""
+    with open(source_path, "rb") as f:
+        raw = f.read()
+    kb = json.loads(raw)
+    validate_knowledge_base(kb)
+    fingerprint = hashlib.sha256(raw).hexdigest()[:16]
+
+    strings = []
+    string_index = {}
+
+    def intern(value):
+        if value is None:
+            return _NONE
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    assets = kb["asset_classes"]
+    key_column = []
+    extras_column = []
+    field_columns = {field: [] for field in ASSET_FIELDS}
+    link_starts, link_counts, links = [], [], []
+    numeric = {column: [] for column in NUMERIC_COLUMNS}
+
+    for asset, details in assets.items():
+        key_column.append(intern(asset))
+        extras = {}
+
+        for field in ASSET_FIELDS:
+            value = details.get(field)
+            if value is not None and not isinstance(value, str):
+                extras[field] = value
+                value = None
+            field_columns[field].append(intern(value))
+
+        # A link range starting at _NONE means the asset has no provider_links field
+        provider_links = details.get("provider_links")
+        start = len(links)
+        if _plain_links(provider_links):
+            for link in provider_links:
+                links.append((intern(link["name"]), intern(link["url"])))
+        else:
+            if provider_links is not None:
+                extras["provider_links"] = provider_links
+            start = _NONE
+        link_starts.append(start)
+        link_counts.append(len(links) - start if start != _NONE else 0)
+
+        for field, value in details.items():
+            if field not in ASSET_FIELDS and field != "provider_links":
+                extras[field] = value
+        extras_column.append(intern(json.dumps(extras)) if extras else _NONE)
+
+        min_investment = parse_lkr_amount(details.get("min_investment"))
+        returns = parse_return_range(details.get("typical_return", details.get("return")))
+        numeric["min_investment_lkr"].append(
+            math.nan if min_investment is None else float(min_investment)
+        )
+        numeric["return_low"].append(math.nan if returns is None else returns[0])
+        numeric["return_high"].append(math.nan if returns is None else returns[1])
+
+    sections = {key: value for key, value in kb.items() if key != "asset_classes"}
+    sections_idx = intern(json.dumps(sections))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    u32_values = list(string_offsets) + key_column + extras_column
+    for field in ASSET_FIELDS:
+        u32_values += field_columns[field]
+    u32_values += link_starts + link_counts
+    for name_idx, url_idx in links:
+        u32_values += [name_idx, url_idx]
+
+    numeric_offset = _align(_HEADER.size + len(u32_values) * _U32, _F64)
+    padding = numeric_offset - (_HEADER.size + len(u32_values) * _U32)
+    f64_values = []
+    for column in NUMERIC_COLUMNS:
+        f64_values += numeric[column]
+
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_FORMAT_VERSION,
+        0,
+        fingerprint.encode("ascii"),
+        len(strings),
+        len(key_column),
+        len(links),
+        sections_idx,
+    )
+
+    # Write next to the target and rename, so mapped readers never see a partial file
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(struct.pack(f"<{len(u32_values)}I", *u32_values))
+        f.write(b"\0" * padding)
+        f.write(struct.pack(f"<{len(f64_values)}d", *f64_values))
+        f.write(b"".join(encoded))
+    os.replace(tmp_path, output_path)
+    return fingerprint
+
+
+class _AssetView(Mapping):
+    """Read-only view of one asset class row; fields are decoded on access."""
+
+    __slots__ = ("_snapshot", "_row")
+
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+
+    def _extras(self):
+        return self._snapshot._extras(self._row)
+
+    def __getitem__(self, field):
+        snapshot = self._snapshot
+        if field in ASSET_FIELDS:
+            idx = snapshot._columns[field][self._row]
+            if idx != _NONE:
+                return snapshot.string(idx)
+        elif field == "provider_links" and snapshot._link_starts[self._row] != _NONE:
+            start = snapshot._link_starts[self._row]
+            end = start + snapshot._link_counts[self._row]
+            links = snapshot._links
+            return [
+                {"name": snapshot.string(links[2 * i]), "url": snapshot.string(links[2 * i + 1])}
+                for i in range(start, end)
+            ]
+        return self._extras()[field]
+
+    def __iter__(self):
+        snapshot = self._snapshot
+        for field in ASSET_FIELDS:
+            if snapshot._columns[field][self._row] != _NONE:
+                yield field
+        if snapshot._link_starts[self._row] != _NONE:
+            yield "provider_links"
+        yield from self._extras()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _AssetClasses(Mapping):
+    """Read-only mapping of asset class key to _AssetView."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, asset):
+        return _AssetView(self._snapshot, self._snapshot._rows[asset])
+
+    def __iter__(self):
+        return iter(self._snapshot._rows)
+
+    def __len__(self):
+        return len(self._snapshot._rows)
+
+
+class KnowledgeBaseSnapshot(Mapping):
+    """
+    A memory-mapped knowledge base snapshot.
+
+    Behaves like the parsed JSON (kb["asset_classes"][asset]["name"] etc.) and
+    also exposes the numeric columns directly.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise KnowledgeBaseError("Knowledge base snapshots require a little-endian host")
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+
+        (
+            magic,
+            format_version,
+            _,
+            fingerprint,
+            string_count,
+            asset_count,
+            link_count,
+            sections_idx,
+        ) = _HEADER.unpack_from(buf)
+        if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+            raise KnowledgeBaseError(f"{path} is not a version {SNAPSHOT_FORMAT_VERSION} snapshot")
+        self.fingerprint = fingerprint.decode("ascii")
+
+        offset = _HEADER.size
+
+        def take(count, size, fmt):
+            nonlocal offset
+            view = buf[offset : offset + count * size].cast(fmt)
+            offset += count * size
+            return view
+
+        self._string_offsets = take(string_count + 1, _U32, "I")
+        keys = take(asset_count, _U32, "I")
+        self._extras_column = take(asset_count, _U32, "I")
+        self._columns = {field: take(asset_count, _U32, "I") for field in ASSET_FIELDS}
+        self._link_starts = take(asset_count, _U32, "I")
+        self._link_counts = take(asset_count, _U32, "I")
+        self._links = take(2 * link_count, _U32, "I")
+        offset = _align(offset, _F64)
+        self._numeric = {column: take(asset_count, _F64, "d") for column in NUMERIC_COLUMNS}
+        self._blob = buf[offset:]
+
+        self._rows = {self.string(keys[row]): row for row in range(asset_count)}
+        self._sections_idx = sections_idx
+        self._sections = None
+        self._extras_cache = {}
+        self._asset_classes = _AssetClasses(self)
+
+    def string(self, idx):
+        """Decode one entry of the string table."""
+        return str(self._blob[self._string_offsets[idx] : self._string_offsets[idx + 1]], "utf-8")
+
+    def _extras(self, row):
+        if row not in self._extras_cache:
+            idx = self._extras_column[row]
+            self._extras_cache[row] = {} if idx == _NONE else json.loads(self.string(idx))
+        return self._extras_cache[row]
+
+    def _other_sections(self):
+        if self._sections is None:
+            self._sections = json.loads(self.string(self._sections_idx))
+        return self._sections
+
+    def __getitem__(self, key):
+        if key == "asset_classes":
+            return self._asset_classes
+        return self._other_sections()[key]
+
+    def __iter__(self):
+        yield "asset_classes"
+        yield from self._other_sections()
+
+    def __len__(self):
+        return 1 + len(self._other_sections())
+
+    def _number(self, column, asset):
+        value = self._numeric[column][self._rows[asset]]
+        return None if math.isnan(value) else value
+
+    def min_investment_lkr(self, asset):
+        """Minimum investment in LKR, or None when it is not a fixed amount."""
+        value = self._number("min_investment_lkr", asset)
+        return None if value is None else int(value)
+
+    def return_range(self, asset):
+        """Typical return as (low, high) percentages, or None for N/A."""
+        low = self._number("return_low", asset)
+        return None if low is None else (low, self._number("return_high", asset))
+
+
+if __name__ == "__main__":
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+    parser = argparse.ArgumentParser(description="Compile knowledge_base.json into a snapshot")
+    parser.add_argument(
+        "source", nargs="?", default=os.path.join(data_dir, "knowledge_base.json")
+    )
+    parser.add_argument(
+        "output", nargs="?", default=os.path.join(data_dir, "knowledge_base.bin")
+    )
+    args = parser.parse_args()
+    fingerprint = compile_snapshot(args.source, args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output):,} bytes, fingerprint {fingerprint})")
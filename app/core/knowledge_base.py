@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections.abc import Mapping
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+KB_PATH = "app/data/knowledge_base.json"
+
+# Every asset class must describe itself well enough for the UI and the report
+REQUIRED_ASSET_FIELDS = ("name", "description", "risk", "liquidity", "return")
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseError(ValueError):
+    """Raised when a knowledge base file fails validation."""
+
+
+def validate_knowledge_base(kb):
+    """Check the structure of a parsed knowledge base; raise KnowledgeBaseError if invalid."""
+    if not isinstance(kb, Mapping):
+        raise KnowledgeBaseError("Knowledge base must be a JSON object")
+
+    asset_classes = kb.get("asset_classes")
+    if not isinstance(asset_classes, Mapping) or not asset_classes:
+        raise KnowledgeBaseError("'asset_classes' must be a non-empty object")
+
+    for asset, details in asset_classes.items():
+        if not isinstance(details, Mapping):
+            raise KnowledgeBaseError(f"Asset class '{asset}' must be an object")
+        missing = [field for field in REQUIRED_ASSET_FIELDS if field not in details]
+        if missing:
+            raise KnowledgeBaseError(
+                f"Asset class '{asset}' is missing fields: {', '.join(missing)}"
+            )
+
+
+def parse_lkr_amount(text):
+    """Parse an amount such as "LKR 10,000" or "LKR 5,000,000+"; None if not numeric."""
+    match = re.search(r"\d[\d,]*", text or "")
+    if match is None:
+        return None
+    return int(match.group().replace(",", ""))
+
+
+def parse_return_range(text):
+    """Parse a return such as "9-11%" or "10%" into (low, high); None if not numeric."""
+    numbers = re.findall(r"\d+(?:\.\d+)?", text or "")
+    if not numbers:
+        return None
+    return float(numbers[0]), float(numbers[-1])
+
+
+class _KnowledgeBaseFileHandler(FileSystemEventHandler):
+    """Forwards file system events for the knowledge base file to the registry."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ("created", "modified", "moved"):
+            return
+        paths = {event.src_path, getattr(event, "dest_path", "")}
+        if self.registry.abs_path in {os.path.abspath(p) for p in paths if p}:
+            self.registry.reload()
+
+
+class KnowledgeBaseRegistry:
+    """
+    Single source of truth for the knowledge base.
+
+    The parsed knowledge base is held together with a version counter in one
+    tuple, so readers always see a consistent (version, data) pair and a reload
+    swaps both at once. Reloads are validated first; an invalid file keeps the
+    previous version live. Downstream caches subscribe to be told when the
+    version changes.
+    """
+
+    def __init__(self, path=KB_PATH):
+        self.path = path
+        self.abs_path = os.path.abspath(path)
+        self._current = None  # (version, fingerprint, data)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._observer = None
+
+    def _load(self):
+        from core.kb_snapshot import SNAPSHOT_MAGIC, KnowledgeBaseSnapshot
+
+        with open(self.path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                raw = None
+            else:
+                f.seek(0)
+                raw = f.read()
+
+        if raw is None:
+            # Compiled snapshot: memory-mapped, shared with other worker processes
+            kb = KnowledgeBaseSnapshot(self.path)
+            validate_knowledge_base(kb)
+            return kb.fingerprint, kb
+
+        kb = json.loads(raw)
+        validate_knowledge_base(kb)
+        return hashlib.sha256(raw).hexdigest()[:16], kb
+
+    def snapshot(self):
+        """Return the live (version, fingerprint, data) tuple, loading it on first use."""
+        current = self._current
+        if current is None:
+            with self._lock:
+                if self._current is None:
+                    fingerprint, kb = self._load()
+                    self._current = (1, fingerprint, kb)
+                current = self._current
+        return current
+
+    @property
+    def data(self):
+        return self.snapshot()[2]
+
+    @property
+    def version(self):
+        return self.snapshot()[0]
+
+    @property
+    def fingerprint(self):
+        """Content hash of the live knowledge base, stable across processes."""
+        return self.snapshot()[1]
+
+    def reload(self):
+        """Re-read and validate the file; swap it in if it changed. Returns True on swap."""
+        try:
+            fingerprint, kb = self._load()
+        except (OSError, ValueError) as e:
+            # Editors often save in several steps; keep serving the last good version
+            logger.warning("Knowledge base reload skipped: %s", e)
+            return False
+
+        with self._lock:
+            version = self._current[0] if self._current else 0
+            if self._current and self._current[1] == fingerprint:
+                return False
+            self._current = (version + 1, fingerprint, kb)
+            listeners = list(self._listeners)
+
+        logger.info("Knowledge base reloaded (version %d)", version + 1)
+        for callback in listeners:
+            try:
+                callback(version + 1)
+            except Exception:
+                logger.exception("Knowledge base listener failed")
+        return True
+
+    def subscribe(self, callback):
+        """Register callback(version) to be invoked after every successful reload."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def start_watching(self):
+        """Watch the knowledge base file for changes. Safe to call repeatedly."""
+        with self._lock:
+            if self._observer is not None:
+                return
+            observer = Observer()
+            observer.daemon = True
+            observer.schedule(
+                _KnowledgeBaseFileHandler(self), os.path.dirname(self.abs_path)
+            )
+            observer.start()
+            self._observer = observer
+
+    def stop_watching(self):
+        with self._lock:
+            observer, self._observer = self._observer, None
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+# Workers can share one compiled snapshot (see core/kb_snapshot.py) instead of the JSON
+knowledge_base = KnowledgeBaseRegistry(os.getenv("RUPEELOGIC_KB_SNAPSHOT") or KB_PATH)
@@ -0,0 +1,125 @@
+import logging
+import sqlite3
+import time
+
+from core.sqlite_connections import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    kb_fingerprint TEXT NOT NULL,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class LLMResponseCache:
+    """
+    Persistent LLM response cache in a SQLite file, shared by every worker process.
+
+    Entries are keyed by request hash (see core.config.request_key, which covers
+    the model) and tagged with the knowledge base fingerprint they were produced
+    under; entries from any other knowledge base version are treated as misses
+    and purged on reload. The total size of cached content is kept under
+    max_bytes by evicting the least recently used entries.
+
+    Connections come from core.sqlite_connections (WAL mode, one per thread),
+    so concurrent readers and writers in several processes are safe. Cache errors are logged and treated
+    as misses; they never fail the request.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection = SQLiteConnections(path, _SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, kb_fingerprint):
+        """Return the cached content for key under this knowledge base, or None."""
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT content FROM responses WHERE key = ? AND kb_fingerprint = ?",
+                (key, kb_fingerprint),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+        except sqlite3.Error as e:
+            logger.warning("LLM cache read failed: %s", e)
+            return None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, kb_fingerprint, model, content):
+        """Store content for key, then evict least recently used entries over max_bytes."""
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, kb_fingerprint, model, content, size, now, now),
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("LLM cache write failed: %s", e)
+
+    def _evict(self, conn):
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def purge_stale(self, kb_fingerprint):
+        """Delete every entry produced under a different knowledge base."""
+        try:
+            self._connection().execute(
+                "DELETE FROM responses WHERE kb_fingerprint != ?", (kb_fingerprint,)
+            )
+        except sqlite3.Error as e:
+            logger.warning("LLM cache purge failed: %s", e)
+
+    def stats(self):
+        """Return cache counters for diagnostics."""
+        try:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            entries = size = None
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,382 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain objects updated under a lock, so
+recording is a dict lookup and an addition; they are cheap to leave on. The
+registry is rendered on demand, either over HTTP (RUPEELOGIC_METRICS_PORT,
+served at /metrics) or written periodically to a file (RUPEELOGIC_METRICS_FILE),
+e.g. for node_exporter's textfile collector.
+"""
+
+import bisect
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Sessions that reran the app within this many seconds count as active
+ACTIVE_SESSION_WINDOW = 300
+
+ENGINE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+# Shadow backend latency as a multiple of the serving backend's
+RATIO_BUCKETS = (0.003, 0.01, 0.03, 0.1, 0.3, 0.5, 1.0, 2.0, 3.0, 10.0, 30.0, 100.0, 300.0)
+
+_muted = threading.local()
+
+
+@contextlib.contextmanager
+def muted():
+    """Drop counter and histogram updates made by this thread inside the block."""
+    previous = getattr(_muted, "active", False)
+    _muted.active = True
+    try:
+        yield
+    finally:
+        _muted.active = previous
+
+
+def is_muted():
+    """True inside a muted() block on this thread."""
+    return getattr(_muted, "active", False)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_samples(items)
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if is_muted():
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirror a running total that is counted elsewhere (e.g. a cache's own hit count)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=ENGINE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if is_muted():
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors; renders them all as Prometheus text."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=ENGINE_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, callback):
+        """Run callback() before every render, to copy state owned elsewhere into gauges."""
+        with self._lock:
+            self._collectors.append(callback)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for callback in collectors:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+ENGINE_SECONDS = registry.histogram(
+    "rupeelogic_engine_seconds",
+    "Time spent constructing, resetting and running the expert system engine "
+    "(phase indexed: the rule index fast path).",
+    ("phase",),
+)
+RULE_FIRES = registry.counter(
+    "rupeelogic_rule_fires_total", "Expert system rule activations.", ("rule_id",)
+)
+SHADOW_RUNS = registry.counter(
+    "rupeelogic_shadow_runs_total",
+    "Requests replayed on the shadow inference backend, by backend and outcome "
+    "(match, mismatch, error, or dropped when the shadow queue was full).",
+    ("backend", "outcome"),
+)
+SHADOW_MISMATCHES = registry.counter(
+    "rupeelogic_shadow_mismatches_total",
+    "Shadow runs whose results differed from the serving backend's, by backend and "
+    "field (fired_rules, confidences, plans, alternative_plans, activated_rules).",
+    ("backend", "field"),
+)
+SHADOW_LATENCY_RATIO = registry.histogram(
+    "rupeelogic_shadow_latency_ratio",
+    "Shadow backend run time divided by the serving backend's, per replayed request.",
+    ("backend",),
+    buckets=RATIO_BUCKETS,
+)
+CACHE_REQUESTS = registry.counter(
+    "rupeelogic_cache_requests_total",
+    "Cache lookups since the process started, by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+LLM_SECONDS = registry.histogram(
+    "rupeelogic_llm_request_seconds",
+    "LLM request latency including scheduling and retries.",
+    ("call_type", "outcome"),
+    buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = registry.counter(
+    "rupeelogic_llm_tokens_total", "LLM tokens used.", ("call_type", "kind")
+)
+ACTIVE_SESSIONS = registry.gauge(
+    "rupeelogic_active_sessions",
+    f"Browser sessions that reran the app in the last {ACTIVE_SESSION_WINDOW} seconds.",
+)
+SESSION_BYTES = registry.gauge(
+    "rupeelogic_session_state_bytes",
+    "Approximate session state size over active sessions (stat: sum or max).",
+    ("stat",),
+)
+
+_sessions_seen = {}
+_sessions_lock = threading.Lock()
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate bytes held by obj: containers and instance attributes are followed."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen or isinstance(obj, (type, type(sys), type(deep_sizeof))):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def track_session(session_id, state=None):
+    """Record that a session just ran the app, and the size of its state if given."""
+    if session_id is None:
+        return
+    state_bytes = deep_sizeof(state) if state is not None else 0
+    with _sessions_lock:
+        _sessions_seen[session_id] = (time.monotonic(), state_bytes)
+
+
+def _collect_sessions():
+    cutoff = time.monotonic() - ACTIVE_SESSION_WINDOW
+    with _sessions_lock:
+        for session_id in [sid for sid, (seen, _) in _sessions_seen.items() if seen < cutoff]:
+            del _sessions_seen[session_id]
+        ACTIVE_SESSIONS.set(len(_sessions_seen))
+        sizes = [state_bytes for _, state_bytes in _sessions_seen.values()]
+        SESSION_BYTES.set(sum(sizes), stat="sum")
+        SESSION_BYTES.set(max(sizes, default=0), stat="max")
+
+
+registry.add_collector(_collect_sessions)
+
+
+def watch_cache(name, stats):
+    """Export the hits/misses from a cache's stats() callable as rupeelogic_cache_requests_total."""
+
+    def collect():
+        counters = stats()
+        CACHE_REQUESTS.set_total(counters["hits"], cache=name, result="hit")
+        CACHE_REQUESTS.set_total(counters["misses"], cache=name, result="miss")
+
+    registry.add_collector(collect)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _write_periodically(path, interval):
+    while True:
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(registry.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write metrics file: %s", e)
+        time.sleep(interval)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """Start the HTTP endpoint and/or file writer configured by env vars. Safe to call repeatedly."""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    port = os.getenv("RUPEELOGIC_METRICS_PORT")
+    if port:
+        try:
+            server = ThreadingHTTPServer(
+                (os.getenv("RUPEELOGIC_METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler
+            )
+        except OSError as e:
+            # Another worker on this host already serves the port
+            logger.warning("Metrics endpoint not started: %s", e)
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    path = os.getenv("RUPEELOGIC_METRICS_FILE")
+    if path:
+        interval = float(os.getenv("RUPEELOGIC_METRICS_INTERVAL", "15"))
+        threading.Thread(target=_write_periodically, args=(path, interval), daemon=True).start()
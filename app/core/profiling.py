@@ -0,0 +1,221 @@
+"""
+On-demand profiling of a single form submission or chat turn.
+
+Profiling is switched on for every request with RUPEELOGIC_PROFILE, or for one
+request with the ?profile= query parameter when RUPEELOGIC_PROFILE_QUERY=true.
+The value picks the profiler:
+
+- sampling (or 1/true): a background thread samples the request's stack every
+  RUPEELOGIC_PROFILE_INTERVAL_MS milliseconds; counts are samples.
+- deterministic: every Python and builtin call is recorded with
+  sys.setprofile; counts are microseconds of self time. Slower, but exact.
+
+Each profile is written to RUPEELOGIC_PROFILE_DIR (default .cache/profiles) as
+collapsed stacks ("frame;frame;frame count" lines, the input of flamegraph.pl
+and speedscope), plus a .json file with the page, the rules fired and the
+profile signature (a hash of the user's inputs, so slow profiles can be
+replayed and compared). File names carry the same tags.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MODES = {
+    "1": "sampling",
+    "true": "sampling",
+    "sampling": "sampling",
+    "deterministic": "deterministic",
+}
+
+
+def requested_mode(query_value=None):
+    """The profiler for this request ("sampling"/"deterministic"), or None."""
+    mode = MODES.get(os.getenv("RUPEELOGIC_PROFILE", "").lower())
+    if mode is None and query_value and os.getenv("RUPEELOGIC_PROFILE_QUERY", "false").lower() == "true":
+        mode = MODES.get(str(query_value).lower())
+    return mode
+
+
+def profile_signature(user_data):
+    """Short stable hash of the inputs that drove the request."""
+    encoded = json.dumps(user_data, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:10]
+
+
+def _frame_label(code):
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def _frame_stack(frame, root):
+    """Labels from root (the profiled code's frame) down to frame."""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        if frame is root:
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class _SamplingProfiler:
+    """Samples one thread's Python stack from a background thread."""
+
+    unit = "samples"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, caller):
+        target = threading.get_ident()
+
+        def sample():
+            while not self._stop.wait(self.interval):
+                frame = sys._current_frames().get(target)
+                if frame is not None:
+                    self.stacks[tuple(_frame_stack(frame, caller))] += 1
+
+        self._thread = threading.Thread(target=sample, name="rupeelogic-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class _DeterministicProfiler:
+    """Records self time per call stack of the current thread with sys.setprofile."""
+
+    unit = "microseconds"
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._paths = []
+        self._base = 0
+        self._last = 0
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        paths = self._paths
+        paths_len = len(paths)
+        if paths_len:
+            self.stacks[paths[-1]] += (now - self._last) // 1000
+        if event == "call":
+            paths.append(paths[-1] + (_frame_label(frame.f_code),))
+        elif event == "c_call":
+            name = getattr(arg, "__qualname__", getattr(arg, "__name__", repr(arg)))
+            paths.append(paths[-1] + (f"{name} (builtin)",))
+        elif paths_len > self._base:
+            # return, c_return and c_exception close the innermost call
+            paths.pop()
+        self._last = time.perf_counter_ns()
+
+    def start(self, caller):
+        self._paths = [(_frame_label(caller.f_code),)]
+        self._base = 1
+        self._last = time.perf_counter_ns()
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+
+
+class _NoopProfile:
+    def tag(self, **tags):
+        pass
+
+
+class RequestProfile:
+    """One profiled request; call tag() with what the request did before it ends."""
+
+    def __init__(self, page, mode):
+        self.page = page
+        self.mode = mode
+        self.tags = {}
+        if mode == "deterministic":
+            self.profiler = _DeterministicProfiler()
+        else:
+            interval = float(os.getenv("RUPEELOGIC_PROFILE_INTERVAL_MS", "2")) / 1000
+            self.profiler = _SamplingProfiler(interval)
+
+    def tag(self, rules_fired=None, user_data=None, **tags):
+        """Record the rules fired, the inputs (as a profile signature) and any extra tags."""
+        if rules_fired is not None:
+            self.tags["rules_fired"] = list(rules_fired)
+        if user_data is not None:
+            self.tags["profile_signature"] = profile_signature(user_data)
+            self.tags["goal_type"] = user_data.get("goal_type")
+            self.tags["risk_tolerance"] = user_data.get("risk_tolerance")
+        self.tags.update(tags)
+
+    def write(self, started, duration):
+        directory = os.getenv("RUPEELOGIC_PROFILE_DIR", ".cache/profiles")
+        rules = "+".join(self.tags.get("rules_fired") or ["none"])
+        name = "-".join(
+            [
+                time.strftime("%Y%m%d-%H%M%S", time.localtime(started)),
+                self.page,
+                re.sub(r"[^A-Za-z0-9+]+", "_", rules).strip("_").lower(),
+                self.tags.get("profile_signature", "nosig"),
+            ]
+        )
+        base = os.path.join(directory, name)
+        metadata = {
+            "page": self.page,
+            "mode": self.mode,
+            "unit": self.profiler.unit,
+            "started": started,
+            "duration_ms": round(duration * 1000, 3),
+            **self.tags,
+        }
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for stack, count in sorted(self.profiler.stacks.items()):
+                    if count:
+                        f.write(f"{';'.join(stack)} {count}\n")
+            with open(base + ".json", "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2, default=str)
+        except OSError as e:
+            logger.warning("Could not write profile: %s", e)
+            return None
+        logger.info("Profile written to %s.collapsed (%.0f ms)", base, duration * 1000)
+        return base
+
+
+@contextmanager
+def profile_request(page, query_value=None):
+    """
+    Profile the enclosed request if profiling is requested (see module docs).
+    Yields an object whose tag() records the rules fired and user inputs.
+    """
+    mode = requested_mode(query_value)
+    if mode is None:
+        yield _NoopProfile()
+        return
+
+    profile = RequestProfile(page, mode)
+    started = time.time()
+    start = time.perf_counter()
+    # This generator's frame, then contextlib's __enter__, then the profiled code
+    profile.profiler.start(sys._getframe(2))
+    try:
+        yield profile
+    finally:
+        # Also runs when Streamlit stops or reruns the script mid-request
+        profile.profiler.stop()
+        profile.write(started, time.perf_counter() - start)
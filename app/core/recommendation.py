@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import time
+
+from core.knowledge_base import knowledge_base
+from core.metrics import is_muted
+from core.tracing import tracer
+from es.RupeeLogicEngine import RULE_BASE, explain_fired_rules, what_would_change
+from es.backends import backend_from_name
+from es.counterfactual import describe_counterfactual
+from es.rulebase import whole_numbers
+from es.shadow import ShadowRunner
+
+# "experta" runs the reference engine; "indexed" gives the same results without
+# building a Rete network (see es/rule_index.py) and only serves once shadow
+# mode has shown the two agree on live traffic
+ENGINE_BACKEND = backend_from_name(os.getenv("RUPEELOGIC_ENGINE_BACKEND", "experta"))
+
+# Replay a sample of requests on a second backend and compare (es/shadow.py);
+# an empty RUPEELOGIC_SHADOW_BACKEND turns this off
+_shadow_backend = os.getenv("RUPEELOGIC_SHADOW_BACKEND", "indexed")
+shadow_runner = (
+    ShadowRunner(
+        backend_from_name(_shadow_backend),
+        float(os.getenv("RUPEELOGIC_SHADOW_SAMPLE_RATE", "0.1")),
+        ENGINE_BACKEND.name,
+        os.getenv("RUPEELOGIC_SHADOW_LOG", ".cache/shadow_mismatches.jsonl"),
+    )
+    if _shadow_backend and _shadow_backend != ENGINE_BACKEND.name
+    else None
+)
+
+# Follow-up questions about what it would take to get a different plan
+# Explicit questions about which profile changes would give a different plan
+_WHAT_WOULD_CHANGE = re.compile(
+    r"\bwhat (?:would|do|should|must) i (?:need to |have to )?change\b"
+    r"|\bwhat (?:would|will) it take to (?:get|qualify for) (?:a |an |the )?(?:[\w-]+ ){0,3}"
+    r"(?:plan|recommendation|portfolio)\b"
+    r"|\bhow (?:can|could|do|would) i (?:get|qualify for) (?:a |an |the )?"
+    r"(?:different|other|another) (?:plan|recommendation|portfolio)\b",
+    re.IGNORECASE,
+)
+
+
+def run_engine(user_data):
+    """
+    Run the expert system for a complete profile on the serving backend, with
+    numeric fields rounded to whole numbers. Returns its RecommendationResults
+    (the engine, or the rule index's run). Runs inside metrics.muted() are not
+    live requests (e.g. speculation) and are not replayed on the shadow backend.
+    """
+    user_data = whole_numbers(user_data)
+    start = time.perf_counter()
+    results = ENGINE_BACKEND.run(user_data)
+    if shadow_runner is not None and not is_muted():
+        shadow_runner.submit(user_data, results, time.perf_counter() - start)
+    return results
+
+
+def _allocation_summary(alloc, asset_details, with_confidence=False):
+    asset_info = asset_details.get(alloc["asset_class"], {})
+    summary = {
+        "asset_class": asset_info.get("name", alloc["asset_class"]),
+        "percentage": alloc["percent"],
+        "lump_sum": alloc["lump_sum"],
+        "monthly": alloc["monthly"],
+    }
+    if with_confidence:
+        summary["confidence"] = alloc.get("confidence", 85)
+    summary.update(
+        {
+            "reason": alloc.get("reason", ""),
+            "reference": alloc.get("reference", ""),
+            "risk": asset_info.get("risk", ""),
+            "return": asset_info.get("typical_return", asset_info.get("return", "")),
+            "examples": asset_info.get("examples", ""),
+        }
+    )
+    return summary
+
+
+def build_recommendation(user_data):
+    """
+    Run the engine and summarize its output for the report and follow-up questions.
+
+    Returns the recommendation context: user_profile, monthly_investable,
+    fired_rules, rules_version, primary_plan and alternative_plans. fired_rules
+    holds (rule_id, confidence) pairs; expand them with explain_fired_rules().
+    """
+    user_data = whole_numbers(user_data)
+    engine = run_engine(user_data)
+    asset_details = knowledge_base.data["asset_classes"]
+
+    with tracer.span("summary"):
+        # Prepare PRIMARY PLAN data
+        primary_plan_summary = [
+            _allocation_summary(alloc, asset_details, with_confidence=True)
+            for alloc in engine.primary_allocations()
+        ]
+
+        # Prepare ALTERNATIVE PLANS data
+        alternative_plans_summary = [
+            {
+                "plan_name": alt_plan["plan_name"],
+                "confidence": alt_plan["confidence"],
+                "allocations": [
+                    _allocation_summary(alloc, asset_details)
+                    for alloc in alt_plan["allocations"]
+                ],
+            }
+            for alt_plan in engine.alternative_plans
+        ]
+
+    return {
+        "user_profile": dict(user_data),
+        "monthly_investable": user_data["monthly_income"] - user_data["monthly_expenses"],
+        "fired_rules": [list(fired) for fired in engine.fired_rules],
+        "rules_version": RULE_BASE.version,
+        "primary_plan": primary_plan_summary,
+        "alternative_plans": alternative_plans_summary,
+    }
+
+
+def prompt_context(context):
+    """Compact JSON of a recommendation context for LLM prompts, with short rule explanations."""
+    rules = [
+        {
+            "rule": rule["rule_name"],
+            "confidence": rule["confidence"],
+            "condition": rule["condition"],
+            "action": rule["action"],
+        }
+        for rule in explain_fired_rules(context["fired_rules"])
+    ]
+    compact = {
+        **context,
+        "fired_rules": rules,
+        "what_would_change": [
+            describe_counterfactual(counterfactual)
+            for counterfactual in what_would_change(context["user_profile"])
+        ],
+    }
+    del compact["rules_version"]
+    return json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
+
+def asks_what_would_change(question):
+    """
+    True for follow-ups explicitly asking which profile changes would lead to a
+    different plan, e.g. "What would I need to change to get a growth plan?".
+    """
+    return _WHAT_WOULD_CHANGE.search(question) is not None
+
+
+def what_would_change_answer(context, limit=3):
+    """Markdown answer to a what-would-change question, computed from the rule thresholds."""
+    counterfactuals = what_would_change(context["user_profile"], limit)
+    if not counterfactuals:
+        return (
+            "None of the changes you could realistically make to your profile "
+            "would change this recommendation."
+        )
+    lines = ["These are the smallest changes to your profile that would change your plan:", ""]
+    lines += [f"- {describe_counterfactual(counterfactual)}" for counterfactual in counterfactuals]
+    return "\n".join(lines)
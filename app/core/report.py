@@ -0,0 +1,61 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+from core.knowledge_base import knowledge_base, parse_return_range
+from core.tracing import tracer
+from es.amounts import ROUNDING_STEP
+from es.RupeeLogicEngine import explain_fired_rules
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templates")
+
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    undefined=StrictUndefined,
+)
+_env.filters["lkr"] = lambda amount: f"{amount:,.0f}"
+# Knowledge base examples are a string or a list; the form shows the first five too
+_env.filters["examples"] = lambda examples: (
+    ", ".join(examples[:5]) if isinstance(examples, list) else examples
+)
+
+
+def expected_return(allocations):
+    """Weighted (low, high) annual return of a summarized plan; None if nothing is numeric."""
+    low = high = 0.0
+    found = False
+    for item in allocations:
+        returns = parse_return_range(item.get("return"))
+        if returns is None:
+            continue
+        found = True
+        low += returns[0] * item["percentage"] / 100
+        high += returns[1] * item["percentage"] / 100
+    return (low, high) if found else None
+
+
+def render_report(context):
+    """
+    Render the markdown recommendation report from a recommendation context
+    (see core.recommendation.build_recommendation) without calling the LLM.
+    """
+    profile = context["user_profile"]
+    monthly = max(context["monthly_investable"], 0)
+    primary_plan = context["primary_plan"]
+
+    with tracer.span("report.render"):
+        template = _env.get_template("report.md.j2")
+        return template.render(
+            user_profile=profile,
+            monthly_investable=context["monthly_investable"],
+            first_year_total=profile["current_savings"] + monthly * 12,
+            fired_rules=explain_fired_rules(context["fired_rules"]),
+            primary_confidence=primary_plan[0]["confidence"] if primary_plan else 85,
+            primary_return=expected_return(primary_plan),
+            primary_plan=primary_plan,
+            alternative_plans=context["alternative_plans"],
+            rounding_step=ROUNDING_STEP,
+            reminders=list(knowledge_base.data.get("investment_rules", {}).values()),
+        ).strip()
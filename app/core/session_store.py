@@ -0,0 +1,294 @@
+"""
+Server-side store for Chat Mode sessions.
+
+A conversation is identified by a random `sid` held in the server-side
+Streamlit session. So that it survives reloads and worker restarts and can be
+picked up by any replica behind a load balancer, the page URL carries a signed
+link to it (see SessionLinks) that expires soon after the conversation was last
+active and only opens in the browser it was issued to. After each turn the chat
+state is saved as a compact snapshot (zlib-compressed JSON); a session opened
+with a valid link but no state is rehydrated from it on its first run.
+
+The backend is chosen with RUPEELOGIC_SESSION_STORE as "<backend>:<argument>":
+"sqlite:<path>" (the default, ".cache/sessions.sqlite"), "memory:" (per
+process, for development) or "none:" to disable persistence. Other backends
+can be added with register_backend().
+"""
+
+import abc
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+
+from core.sqlite_connections import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 2
+
+# Session state saved per conversation; everything else is rebuilt on rehydration
+SNAPSHOT_KEYS = (
+    "user_data",
+    "messages",
+    "recommendation_generated",
+    "recommendation_context",
+)
+
+
+def encode_snapshot(state):
+    """Compact, versioned snapshot of the chat keys of a session state mapping."""
+    snapshot = {"version": SNAPSHOT_VERSION}
+    for key in SNAPSHOT_KEYS:
+        if key in state:
+            snapshot[key] = state[key]
+    if "chat_history" in state:
+        snapshot["archived_messages"] = state["chat_history"].archived
+    return zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_snapshot(data):
+    """The snapshot dict, or None if it is unreadable or from another version."""
+    try:
+        snapshot = json.loads(zlib.decompress(data))
+    except (zlib.error, ValueError) as e:
+        logger.warning("Discarding unreadable session snapshot: %s", e)
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+class SessionStore(abc.ABC):
+    """Backend interface: compressed snapshots keyed by sid."""
+
+    @abc.abstractmethod
+    def load(self, sid):
+        """The snapshot bytes saved for sid, or None."""
+
+    @abc.abstractmethod
+    def save(self, sid, data):
+        """Store snapshot bytes for sid, replacing any earlier ones."""
+
+    @abc.abstractmethod
+    def delete(self, sid):
+        """Forget sid's snapshot, if any."""
+
+
+class NullSessionStore(SessionStore):
+    def load(self, sid):
+        return None
+
+    def save(self, sid, data):
+        pass
+
+    def delete(self, sid):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, argument=""):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            return self._snapshots.get(sid)
+
+    def save(self, sid, data):
+        with self._lock:
+            self._snapshots[sid] = data
+
+    def delete(self, sid):
+        with self._lock:
+            self._snapshots.pop(sid, None)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Snapshots in a SQLite file shared by every worker process on the host
+    (WAL mode, one connection per thread). Sessions untouched for ttl_days are
+    deleted. Errors are logged; the chat keeps working from memory.
+    """
+
+    def __init__(self, path, ttl_days=7):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self._connection = SQLiteConnections(path, _SCHEMA)
+        self._next_purge = 0
+
+    def load(self, sid):
+        try:
+            row = self._connection().execute(
+                "SELECT data FROM sessions WHERE sid = ?", (sid,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Session load failed: %s", e)
+            return None
+        return row[0] if row else None
+
+    def save(self, sid, data):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (sid, data, now))
+            if now >= self._next_purge:
+                self._next_purge = now + 3600
+                conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+        except sqlite3.Error as e:
+            logger.warning("Session save failed: %s", e)
+
+    def delete(self, sid):
+        try:
+            self._connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        except sqlite3.Error as e:
+            logger.warning("Session delete failed: %s", e)
+
+
+_BACKENDS = {
+    "none": lambda argument: NullSessionStore(),
+    "memory": MemorySessionStore,
+    "sqlite": lambda argument: SQLiteSessionStore(
+        argument or ".cache/sessions.sqlite",
+        ttl_days=float(os.getenv("RUPEELOGIC_SESSION_TTL_DAYS", "7")),
+    ),
+}
+
+
+def register_backend(name, factory):
+    """Make RUPEELOGIC_SESSION_STORE="<name>:<argument>" build factory(argument)."""
+    _BACKENDS[name] = factory
+
+
+def store_from_url(url):
+    backend, _, argument = url.partition(":")
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown session store backend: {backend!r}")
+    return _BACKENDS[backend](argument)
+
+
+def _link_secret(path=".cache/session_secret"):
+    """
+    RUPEELOGIC_SESSION_SECRET, or a random secret kept in path and shared by the
+    worker processes on this host (replicas need the environment variable).
+    """
+    secret = os.getenv("RUPEELOGIC_SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        # Atomic and never overwrites: the first process to get here wins
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip().encode("utf-8")
+
+
+class SessionLinks:
+    """
+    Signed links to a conversation, "<sid>.<expires>.<signature>", for the page
+    URL. A link is valid until expires (ttl seconds after it was issued; the
+    chat reissues it while the conversation is in use) and only for the same
+    browser, identified by its User-Agent, which is part of the signature. A
+    link that leaks through history, screenshots or referrers stops working
+    once the conversation has been idle for ttl.
+    """
+
+    def __init__(self, secret, ttl):
+        self.secret = secret
+        self.ttl = ttl
+
+    def _signature(self, sid, expires, browser):
+        message = f"{sid}.{expires}.{browser}".encode("utf-8")
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, sid, browser, now=None):
+        expires = int((time.time() if now is None else now) + self.ttl)
+        return f"{sid}.{expires}.{self._signature(sid, expires, browser)}"
+
+    def verify(self, link, browser, now=None):
+        """The sid the link is for, or None if it is malformed, forged, expired or for another browser."""
+        if not isinstance(link, str):
+            return None
+        parts = link.split(".")
+        if len(parts) != 3 or not parts[1].isdigit():
+            return None
+        sid, expires, signature = parts[0], int(parts[1]), parts[2]
+        if not hmac.compare_digest(signature, self._signature(sid, expires, browser)):
+            return None
+        if expires <= (time.time() if now is None else now):
+            return None
+        return sid
+
+    def needs_refresh(self, link, sid, browser, now=None):
+        """True unless link is a valid link to sid issued within the last minute."""
+        now = time.time() if now is None else now
+        if self.verify(link, browser, now) != sid:
+            return True
+        return int(link.split(".")[1]) - now < self.ttl - 60
+
+
+class ChatSessions:
+    """Saves and rehydrates chat state through a SessionStore, skipping unchanged snapshots."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def rehydrate(self, sid, state):
+        """Fill a fresh session state from sid's snapshot. Returns True if one was found."""
+        data = self.store.load(sid)
+        snapshot = decode_snapshot(data) if data is not None else None
+        if snapshot is None:
+            return False
+        for key in SNAPSHOT_KEYS:
+            if key in snapshot:
+                state[key] = snapshot[key]
+        state["restored_archived_messages"] = snapshot.get("archived_messages", 0)
+        state["session_snapshot_digest"] = hashlib.sha1(data).hexdigest()
+        return True
+
+    def save(self, sid, state):
+        data = encode_snapshot(state)
+        digest = hashlib.sha1(data).hexdigest()
+        if state.get("session_snapshot_digest") == digest:
+            return
+        self.store.save(sid, data)
+        state["session_snapshot_digest"] = digest
+
+    def delete(self, sid, state):
+        self.store.delete(sid)
+        state.pop("session_snapshot_digest", None)
+
+
+session_links = SessionLinks(
+    _link_secret(), ttl=float(os.getenv("RUPEELOGIC_SESSION_LINK_TTL_MINUTES", "60")) * 60
+)
+
+chat_sessions = ChatSessions(
+    store_from_url(os.getenv("RUPEELOGIC_SESSION_STORE", "sqlite:.cache/sessions.sqlite"))
+)
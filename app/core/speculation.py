@@ -0,0 +1,128 @@
+"""
+Speculative recommendations for Chat Mode.
+
+Once the only questions left are one or two categorical ones (risk tolerance,
+goal type), there are at most 15 possible complete profiles. While the user
+types the answer, every candidate is run through the engine and the template
+report in a background thread, so the final answer is shown without waiting.
+"""
+
+import itertools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.knowledge_base import knowledge_base
+from core.metrics import RULE_FIRES, muted, watch_cache
+from core.recommendation import build_recommendation
+from core.report import render_report
+from core.tracing import tracer
+
+# Fields with a small, fixed set of answers (the values Chat Mode asks the LLM for)
+CANDIDATE_VALUES = {
+    "risk_tolerance": ("Low", "Moderate", "High"),
+    "goal_type": (
+        "Wealth Building",
+        "Retirement",
+        "Child Education",
+        "Home Purchase",
+        "Emergency Fund",
+    ),
+}
+MAX_SPECULATIVE_FIELDS = 2
+
+logger = logging.getLogger(__name__)
+
+# Shared by all sessions; engine runs are short and CPU-bound
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rupeelogic-speculate")
+
+# take() outcomes across all sessions, for the metrics exporter
+_counters = {"hits": 0, "misses": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(outcome):
+    with _counters_lock:
+        _counters[outcome] += 1
+
+
+def _stats():
+    with _counters_lock:
+        return dict(_counters)
+
+
+watch_cache("speculation", _stats)
+
+
+def _key(user_data):
+    return knowledge_base.version, json.dumps(user_data, sort_keys=True)
+
+
+def _precompute(user_data):
+    # Most candidates are never asked for: keep them out of the engine and
+    # rule fire metrics and off the shadow backend
+    with muted():
+        context = build_recommendation(user_data)
+        return context, render_report(context)
+
+
+class SpeculativeRecommendations:
+    """Per-session background recommendations, keyed by the complete profile they assume."""
+
+    def __init__(self):
+        self._futures = {}
+
+    def start(self, user_data):
+        """
+        Precompute every candidate completion of user_data if only speculative
+        fields are missing. Returns the number of candidates being computed.
+        """
+        missing = [field for field, value in user_data.items() if value is None]
+        if (
+            not missing
+            or len(missing) > MAX_SPECULATIVE_FIELDS
+            or any(field not in CANDIDATE_VALUES for field in missing)
+        ):
+            return 0
+
+        candidates = {}
+        for values in itertools.product(*(CANDIDATE_VALUES[field] for field in missing)):
+            candidate = {**user_data, **dict(zip(missing, values))}
+            candidates[_key(candidate)] = candidate
+
+        # Same profile as the last turn: the earlier speculation still applies
+        if candidates.keys() != self._futures.keys():
+            self.cancel()
+            for key, candidate in candidates.items():
+                self._futures[key] = _executor.submit(_precompute, candidate)
+        return len(self._futures)
+
+    def take(self, user_data):
+        """
+        Return the precomputed (context, report) for the complete user_data, or
+        None if it was not speculated. Drops all other candidates.
+        """
+        future = self._futures.pop(_key(user_data), None)
+        self.cancel()
+        if future is None:
+            _count("misses")
+            return None
+        _count("hits")
+        with tracer.span("speculation.wait") as span:
+            span.set_attribute("already_done", future.done())
+            try:
+                context, report = future.result()
+            except Exception:
+                logger.exception("Speculative recommendation failed")
+                return None
+        # The candidate's run was muted; count the rules that answered the user
+        for rule_id, _ in context["fired_rules"]:
+            RULE_FIRES.inc(rule_id=rule_id)
+        return context, report
+
+    def cancel(self):
+        """Forget all candidates, cancelling the ones that have not started."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
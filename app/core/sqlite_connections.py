@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteConnections:
+    """
+    One connection per thread to a SQLite file shared by every worker process
+    on the host. The directory is created and the schema applied on first use;
+    the database runs in WAL mode with a busy timeout, so concurrent readers and
+    writers in several processes are safe. Call the object to get the calling
+    thread's connection; it raises sqlite3.Error, which the stores log.
+    """
+
+    def __init__(self, path, schema, timeout=5):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
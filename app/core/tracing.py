@@ -0,0 +1,236 @@
+"""
+Lightweight span tracing for Chat Mode turns.
+
+A turn is traced as a tree of spans (extraction, engine construct/reset/run or
+the rule index's engine.indexed, summary, report rendering, LLM requests, ...) with attributes such as the rule
+fired, prompt tokens and cache hits. Sampling is decided per Streamlit session,
+so a sampled session is traced on every turn; every span carries the session
+id. Finished spans are exported as JSON lines to a file or to the console:
+
+    RUPEELOGIC_TRACE_SAMPLE_RATE=1 streamlit run app/main.py
+    cd app && python -m core.tracing ../.cache/traces.jsonl
+
+Outside a sampled trace, tracer.span() returns a shared no-op span, so
+instrumented code (the engine is also used by Form Mode and speculation
+threads) costs a context variable lookup.
+"""
+
+import argparse
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("rupeelogic_current_span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "session_id",
+        "attributes",
+        "start",
+        "duration",
+        "_started",
+    )
+
+    def __init__(self, name, trace_id, parent_id, session_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.session_id = session_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileExporter:
+    """Appends one JSON line per finished span; safe across threads and worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # One write per line in append mode keeps lines from different processes whole
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning("Could not write trace span: %s", e)
+
+
+class ConsoleExporter:
+    """Writes one JSON line per finished span to stderr."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            print(line, file=self.stream, flush=True)
+
+
+class Tracer:
+    def __init__(self, sample_rate=0.0, exporter=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def sampled(self, session_id):
+        """Deterministic per-session sampling decision."""
+        if self.exporter is None or self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        bucket = zlib.crc32(str(session_id).encode("utf-8")) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+    @contextmanager
+    def trace(self, name, session_id, **attributes):
+        """Root span of a new trace, if session_id is sampled; otherwise a no-op span."""
+        if not self.sampled(session_id):
+            yield NOOP_SPAN
+            return
+        span = Span(name, uuid.uuid4().hex, None, session_id, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Child of the current span; a no-op span when no trace is active."""
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        span = Span(name, parent.trace_id, parent.span_id, parent.session_id, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def _activate(self, span):
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_attribute("error", type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self.exporter.export(span)
+
+
+def _tracer_from_env():
+    sample_rate = float(os.getenv("RUPEELOGIC_TRACE_SAMPLE_RATE", "0"))
+    if os.getenv("RUPEELOGIC_TRACE_EXPORTER", "file").lower() == "console":
+        exporter = ConsoleExporter()
+    else:
+        exporter = FileExporter(os.getenv("RUPEELOGIC_TRACE_FILE", ".cache/traces.jsonl"))
+    return Tracer(sample_rate, exporter)
+
+
+tracer = _tracer_from_env()
+
+
+def format_traces(spans):
+    """Render exported spans as indented trees, one per trace, in start order."""
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+
+    lines = []
+    for trace_spans in sorted(traces.values(), key=lambda s: min(x["start"] for x in s)):
+        span_ids = {span["span_id"] for span in trace_spans}
+        children = defaultdict(list)
+        for span in trace_spans:
+            # Spans whose parent was never exported (e.g. a crashed worker) become roots
+            parent_id = span["parent_id"] if span["parent_id"] in span_ids else None
+            children[parent_id].append(span)
+
+        def walk(parent_id, depth):
+            for span in sorted(children.get(parent_id, []), key=lambda s: s["start"]):
+                attributes = " ".join(f"{k}={v}" for k, v in span["attributes"].items())
+                lines.append(
+                    f"{'  ' * depth}{span['name']:<{40 - 2 * depth}} "
+                    f"{span['duration_ms']:>10.1f} ms  {attributes}".rstrip()
+                )
+                walk(span["span_id"], depth + 1)
+
+        lines.append(f"trace {trace_spans[0]['trace_id']}  session {trace_spans[0]['session_id']}")
+        walk(None, 1)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print exported trace spans as trees")
+    parser.add_argument("path", help="JSON lines file written by the file exporter")
+    parser.add_argument("--session", help="Only show traces of this Streamlit session id")
+    parser.add_argument("--last", type=int, default=None, help="Only show the last N traces")
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    if args.session:
+        spans = [span for span in spans if span["session_id"] == args.session]
+    if args.last:
+        recent = []
+        for span in sorted(spans, key=lambda s: s["start"]):
+            if span["trace_id"] not in recent:
+                recent.append(span["trace_id"])
+        keep = set(recent[-args.last:])
+        spans = [span for span in spans if span["trace_id"] in keep]
+    print(format_traces(spans))
+
+
+if __name__ == "__main__":
+    main()
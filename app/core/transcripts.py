@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from core.sqlite_connections import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_created ON messages (created);
+"""
+
+
+class TranscriptStore:
+    """
+    Older chat messages spilled out of session state into a SQLite file.
+
+    Each message is stored zlib-compressed under (session_id, seq), seq being
+    its position in the conversation, so a page of earlier messages is one
+    indexed range query. Connections come from core.sqlite_connections;
+    errors are logged rather than raised.
+    """
+
+    def __init__(self, path, retention_days=30):
+        self.path = path
+        self.retention = retention_days * 86400
+        self._connection = SQLiteConnections(path, _SCHEMA)
+        self._next_purge = 0
+
+    def append(self, session_id, first_seq, messages):
+        """Store messages as seq first_seq, first_seq + 1, ... Returns False on failure."""
+        now = time.time()
+        rows = [
+            (session_id, first_seq + i, zlib.compress(json.dumps(message).encode("utf-8")), now)
+            for i, message in enumerate(messages)
+        ]
+        try:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", rows)
+            if now >= self._next_purge:
+                self._next_purge = now + 3600
+                conn.execute("DELETE FROM messages WHERE created < ?", (now - self.retention,))
+        except sqlite3.Error as e:
+            logger.warning("Transcript write failed: %s", e)
+            return False
+        return True
+
+    def load(self, session_id, start, stop):
+        """Messages with start <= seq < stop, in order."""
+        try:
+            rows = self._connection().execute(
+                "SELECT data FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start, stop),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Transcript read failed: %s", e)
+            return []
+        return [json.loads(zlib.decompress(data)) for (data,) in rows]
+
+    def delete(self, session_id):
+        try:
+            self._connection().execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        except sqlite3.Error as e:
+            logger.warning("Transcript delete failed: %s", e)
+
+
+def _store_from_env():
+    path = os.getenv("RUPEELOGIC_TRANSCRIPTS", ".cache/transcripts.sqlite")
+    if not path:
+        return None
+    return TranscriptStore(
+        path, retention_days=float(os.getenv("RUPEELOGIC_TRANSCRIPT_RETENTION_DAYS", "30"))
+    )
+
+
+# Shared by all sessions; None when spilling is disabled
+transcript_store = _store_from_env()
+
+# Messages rendered (and, with a store, kept in session state) per chat session
+HISTORY_LIMIT = int(os.getenv("RUPEELOGIC_CHAT_HISTORY_LIMIT", "20"))
+
+
+class ChatHistory:
+    """
+    Bounds a session's chat history. Messages beyond the latest HISTORY_LIMIT
+    are spilled to the transcript store (or, without one, just not rendered)
+    and shown a page at a time on request. Transcripts are keyed by the
+    conversation id passed to spill/visible/clear.
+    """
+
+    def __init__(self, limit=HISTORY_LIMIT, store=None, archived=0):
+        self.limit = limit
+        self.store = store
+        self.archived = archived  # Messages moved to the store, i.e. seq of messages[0]
+        self.pages_shown = 0
+
+    def spill(self, session_id, messages):
+        """Move messages older than the limit out of the messages list, if a store is configured."""
+        excess = len(messages) - self.limit
+        if self.store is None or session_id is None or excess <= 0:
+            return
+        if self.store.append(session_id, self.archived, messages[:excess]):
+            del messages[:excess]
+            self.archived += excess
+
+    def hidden_count(self, messages):
+        """Earlier messages not rendered yet."""
+        return max(self.archived + len(messages) - self.limit * (self.pages_shown + 1), 0)
+
+    def visible(self, session_id, messages):
+        """The messages to render: the latest page plus the earlier pages asked for."""
+        start = max(self.archived + len(messages) - self.limit * (self.pages_shown + 1), 0)
+        earlier = []
+        if start < self.archived and self.store is not None and session_id is not None:
+            earlier = self.store.load(session_id, start, self.archived)
+        return earlier + messages[max(start - self.archived, 0):]
+
+    def clear(self, session_id):
+        if self.store is not None and session_id is not None and self.archived:
+            self.store.delete(session_id)
+        self.archived = 0
+        self.pages_shown = 0
@@ -0,0 +1,88 @@
+"""
+LKR amount breakdown for recommended plans.
+
+Plans are expressed in percentages; this module turns them into the amounts a
+user actually invests, from current savings (lump sum) and from the monthly
+surplus. The split is deterministic:
+
+- A share smaller than the asset's minimum investment (from the knowledge base)
+  is dropped and its percentage is redistributed over the remaining assets in
+  proportion to their own percentages. The share furthest below its minimum is
+  dropped first, and the check repeats until every funded asset is affordable.
+- If nothing in the plan is affordable on its own share, the whole amount goes
+  to the largest allocation whose minimum it covers (or stays uninvested).
+- Amounts are rounded down to ROUNDING_STEP LKR using the largest-remainder
+  method, so they always add up to the total rounded down to that step.
+"""
+
+from core.knowledge_base import knowledge_base, parse_lkr_amount
+
+ROUNDING_STEP = 100  # LKR
+
+_minimums = (None, {})  # (knowledge base version, asset -> minimum LKR)
+
+
+def minimum_investments():
+    """Minimum investment per asset class in LKR, or None when it is not a fixed amount."""
+    global _minimums
+    version, _, kb = knowledge_base.snapshot()
+    if _minimums[0] != version:
+        assets = kb["asset_classes"]
+        if hasattr(kb, "min_investment_lkr"):
+            minimums = {asset: kb.min_investment_lkr(asset) for asset in assets}
+        else:
+            minimums = {
+                asset: parse_lkr_amount(details.get("min_investment"))
+                for asset, details in assets.items()
+            }
+        _minimums = (version, minimums)
+    return _minimums[1]
+
+
+def split_amount(allocations, total, step=ROUNDING_STEP):
+    """Split total LKR across allocations by percent; returns one int amount per allocation."""
+    units = int(max(total, 0) // step)
+    minimums = minimum_investments()
+    floors = [minimums.get(a["asset_class"]) or 0 for a in allocations]
+    weights = {i: a["percent"] for i, a in enumerate(allocations) if a["percent"] > 0}
+
+    while weights:
+        weight_sum = sum(weights.values())
+        shares = {i: units * step * w / weight_sum for i, w in weights.items()}
+        below = [i for i, share in shares.items() if share < floors[i]]
+        if not below:
+            break
+        del weights[min(below, key=lambda i: shares[i] / floors[i])]
+
+    if not weights:
+        affordable = [
+            i
+            for i, a in enumerate(allocations)
+            if a["percent"] > 0 and floors[i] <= units * step
+        ]
+        if affordable and units:
+            weights = {max(affordable, key=lambda i: allocations[i]["percent"]): 1}
+
+    amounts = [0] * len(allocations)
+    if not weights or not units:
+        return amounts
+
+    weight_sum = sum(weights.values())
+    exact = {i: units * w / weight_sum for i, w in weights.items()}
+    for i, value in exact.items():
+        amounts[i] = int(value)
+    leftover = units - sum(amounts)
+    by_remainder = sorted(exact, key=lambda i: exact[i] - amounts[i], reverse=True)
+    for i in by_remainder[:leftover]:
+        amounts[i] += 1
+    return [amount * step for amount in amounts]
+
+
+def plan_amounts(allocations, current_savings, monthly_investable):
+    """(lump_sum, monthly) LKR amounts for each allocation of one plan."""
+    return tuple(
+        zip(
+            split_amount(allocations, current_savings),
+            split_amount(allocations, monthly_investable),
+        )
+    )
@@ -0,0 +1,114 @@
+"""
+Inference backends: interchangeable ways of running the rules for a profile.
+
+A backend's run(user_data) takes a complete profile and returns
+RecommendationResults (fired_rules, plans, alternative_plans, activated_rules);
+the rest of the app only reads those. "experta" builds and runs the Rete
+engine, the reference implementation; "indexed" runs the rule index fast path
+(es/rule_index.py). Other backends can be added with register_backend() and
+checked against the serving one on live traffic with es/shadow.py before they
+are switched on.
+"""
+
+import abc
+
+from es.RupeeLogicEngine import InvestmentGoal, RupeeLogicEngine, UserProfile
+from es.rule_index import rule_index
+
+
+class InferenceBackend(abc.ABC):
+    """Backend interface: run(user_data) -> RecommendationResults."""
+
+    name = None
+
+    @abc.abstractmethod
+    def run(self, user_data):
+        """Run the rules for a complete profile and return its RecommendationResults."""
+
+
+class ExpertaBackend(InferenceBackend):
+    """A fresh RupeeLogicEngine per run, with the profile declared as facts."""
+
+    name = "experta"
+
+    def run(self, user_data):
+        engine = RupeeLogicEngine()
+        engine.reset()
+
+        engine.declare(
+            UserProfile(
+                age=user_data["age"],
+                monthly_income=user_data["monthly_income"],
+                monthly_expenses=user_data["monthly_expenses"],
+                current_savings=user_data["current_savings"],
+                has_high_interest_debt=user_data["has_high_interest_debt"],
+                risk_tolerance=user_data["risk_tolerance"],
+            )
+        )
+        engine.declare(
+            InvestmentGoal(
+                goal_type=user_data["goal_type"],
+                time_horizon=user_data["time_horizon"],
+            )
+        )
+
+        engine.run()
+        return engine
+
+
+class IndexedBackend(InferenceBackend):
+    """The rule index: same results as the engine without building a Rete network."""
+
+    name = "indexed"
+
+    def __init__(self, index=rule_index):
+        self.index = index
+
+    def run(self, user_data):
+        return self.index.run(user_data)
+
+
+_BACKENDS = {
+    "experta": ExpertaBackend,
+    "indexed": IndexedBackend,
+}
+
+
+def register_backend(name, factory):
+    """Make backend_from_name(name) return factory(); the result must set .name."""
+    _BACKENDS[name] = factory
+
+
+def backend_from_name(name):
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name!r}")
+    return _BACKENDS[name]()
+
+
+def result_signature(results):
+    """
+    What a run decided, as plain JSON-friendly values keyed by comparison field:
+    fired_rules (ids in firing order), confidences (rule id -> confidence),
+    plans (primary allocations with amounts), alternative_plans and
+    activated_rules (ids in agenda order, which orders ranked_plans() ties).
+    """
+    return {
+        "fired_rules": [record.rule_id for record in results.fired_rules],
+        "confidences": {record.rule_id: record.confidence for record in results.fired_rules},
+        "plans": results.primary_allocations(),
+        "alternative_plans": results.alternative_plans,
+        "activated_rules": [rule.id for rule in results.activated_rules],
+    }
+
+
+def compare_results(expected, actual):
+    """
+    The fields on which two runs' results differ, as [{field, expected, actual}];
+    empty when they agree.
+    """
+    expected, actual = result_signature(expected), result_signature(actual)
+    return [
+        {"field": field, "expected": expected[field], "actual": actual[field]}
+        for field in expected
+        if expected[field] != actual[field]
+    ]
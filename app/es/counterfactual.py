@@ -0,0 +1,290 @@
+"""
+"What would change my plan?" answers computed from the rule thresholds.
+
+Which rules fire is a pure function of the profile (see
+rulebase.select_fired()). CounterfactualExplainer replays that selection over
+the compiled conditions, without running the engine, and for each rule that is
+not part of the current recommendation works out the smallest profile change
+that would make it so:
+
+1. each failing condition of the target rule is satisfied by moving one of the
+   fields it reads to the nearest value that passes (derived fields are linear
+   in their inputs, so their thresholds are mapped back onto the inputs);
+2. if the target is exclusive, each rule that would fire before it (any rule
+   of higher salience) is broken through its cheapest condition, keeping the
+   target matched.
+
+A change costs its relative size (a categorical change costs 1). Only changes a
+user can make and would aim for are proposed (see FEASIBLE): age only goes up,
+finances only improve and debt can only be paid off. Profile values are whole
+numbers (years, LKR), so strict bounds move by one; what_would_change()
+rounds fractional values (rulebase.whole_numbers()) before explaining.
+"""
+
+import math
+
+from es.rulebase import DERIVED_FIELDS, select_fired
+
+# Values of the categorical fields; these mirror the form's options
+CHOICES = {
+    "goal_type": (
+        "Wealth Building",
+        "Retirement",
+        "Child Education",
+        "Home Purchase",
+        "Emergency Fund",
+    ),
+    "risk_tolerance": ("Low", "Moderate", "High"),
+    "has_high_interest_debt": (True, False),
+}
+
+# Inclusive bounds of the numeric fields; None is unbounded
+LIMITS = {
+    "age": (18, 80),
+    "monthly_income": (0, None),
+    "monthly_expenses": (0, None),
+    "current_savings": (0, None),
+    "time_horizon": (1, None),
+}
+
+# Changes a user can make and would aim for: time only moves forward, income
+# and savings grow, expenses shrink and debt gets paid off
+FEASIBLE = {
+    "age": lambda old, new: new >= old,
+    "monthly_income": lambda old, new: new >= old,
+    "current_savings": lambda old, new: new >= old,
+    "monthly_expenses": lambda old, new: new <= old,
+    "has_high_interest_debt": lambda old, new: not new,
+}
+
+FIELD_LABELS = {
+    "age": "age",
+    "monthly_income": "monthly income",
+    "monthly_expenses": "monthly expenses",
+    "current_savings": "current savings",
+    "has_high_interest_debt": "high-interest debt",
+    "risk_tolerance": "risk tolerance",
+    "goal_type": "goal",
+    "time_horizon": "time horizon",
+}
+
+_LKR_FIELDS = ("monthly_income", "monthly_expenses", "current_savings")
+
+
+def _format_value(field, value):
+    if field in _LKR_FIELDS:
+        return f"LKR {value:,.0f}"
+    if field in ("age", "time_horizon"):
+        return f"{value} years"
+    return str(value)
+
+
+def describe_change(change):
+    """One profile change as a phrase, e.g. "risk tolerance Moderate → High"."""
+    field = change["field"]
+    if field == "has_high_interest_debt":
+        return "pay off your high-interest debt"
+    return (
+        f"{FIELD_LABELS.get(field, field)} "
+        f"{_format_value(field, change['from'])} → {_format_value(field, change['to'])}"
+    )
+
+
+def describe_counterfactual(counterfactual):
+    """A counterfactual as a sentence naming the changes and the plan they lead to."""
+    changes = ", ".join(describe_change(change) for change in counterfactual["changes"])
+    return f"{changes[:1].upper()}{changes[1:]} → {counterfactual['plan_name']}"
+
+
+def _change_cost(field, old, new):
+    if field in CHOICES:
+        return 1.0
+    return abs(new - old) / max(abs(old), 1)
+
+
+def _rank(profile, changed):
+    """(fields changed, total cost): fewer changes first, then smaller ones."""
+    fields = [field for field in profile if changed[field] != profile[field]]
+    return len(fields), sum(_change_cost(f, profile[f], changed[f]) for f in fields)
+
+
+def _thresholds(condition, field, profile):
+    """The values of field at which condition can flip, given the rest of the profile."""
+    if condition.field == field:
+        values = condition.value if condition.op == "in" else (condition.value,)
+        return [value for value in values if isinstance(value, (int, float))]
+    inputs, derive = DERIVED_FIELDS[condition.field]
+    args = {name: profile.get(name) for name in inputs}
+    if any(value is None for value in args.values()):
+        return []
+    # Derived fields are linear in each input: derived = slope * value + intercept
+    intercept = derive(**{**args, field: 0})
+    slope = derive(**{**args, field: 1}) - intercept
+    if not slope:
+        return []
+    return [(condition.value - intercept) / slope]
+
+
+class CounterfactualExplainer:
+    """Nearest profile changes that change which rules fire, from a RuleBase's conditions."""
+
+    def __init__(self, rule_base):
+        self.rule_base = rule_base
+        # rule id -> base field -> the rule's conditions reading that field
+        self._reading = {}
+        for rule in rule_base:
+            reading = self._reading[rule.id] = {}
+            for condition in rule.conditions:
+                for field in condition.inputs:
+                    reading.setdefault(field, []).append(condition)
+
+    def recommended_rules(self, profile):
+        """The rules the engine fires for a flat profile dict, in firing order."""
+        return select_fired([rule for rule in self.rule_base if rule.matches(profile)])
+
+    def _nearest(self, profile, field, conditions, passes):
+        """
+        (value, cost) of the value of field nearest its current one for which
+        passes(changed_profile) holds, trying the thresholds of conditions; None if none does.
+        """
+        current = profile.get(field)
+        if current is None:
+            return None
+        if field in CHOICES:
+            candidates = CHOICES[field]
+        else:
+            low, high = LIMITS.get(field, (None, None))
+            candidates = {low, high}
+            for condition in conditions:
+                for threshold in _thresholds(condition, field, profile):
+                    base = math.floor(threshold)
+                    candidates.update((base - 1, base, base + 1, base + 2))
+            candidates = [
+                value
+                for value in candidates
+                if value is not None
+                and (low is None or value >= low)
+                and (high is None or value <= high)
+            ]
+        feasible = FEASIBLE.get(field)
+        ranked = sorted(
+            (_change_cost(field, current, value), value)
+            for value in candidates
+            if value != current and (feasible is None or feasible(current, value))
+        )
+        for cost, value in ranked:
+            if passes({**profile, field: value}):
+                return value, cost
+        return None
+
+    def _cheapest_fix(self, profile, conditions, passes):
+        """The cheapest single-field change (field, value, cost) making passes() hold."""
+        best = None
+        fields = {field for condition in conditions for field in condition.inputs}
+        for field in sorted(fields):
+            relevant = [c for c in conditions if field in c.inputs]
+            found = self._nearest(profile, field, relevant, passes)
+            if found is not None and (best is None or found[1] < best[2]):
+                best = (field, found[0], found[1])
+        return best
+
+    def _satisfy(self, profile, target):
+        """profile changed so that target's conditions hold, or None."""
+        changed = dict(profile)
+        reading = self._reading[target.id]
+        for _ in range(len(target.conditions)):
+            failing = [condition for condition in target.conditions if not condition(changed)]
+            if not failing:
+                return changed
+            fix = None
+            for field in failing[0].inputs:
+                found = self._nearest(
+                    changed,
+                    field,
+                    reading[field],
+                    lambda p, tests=reading[field]: all(c(p) for c in tests),
+                )
+                if found is not None and (fix is None or found[1] < fix[2]):
+                    fix = (field, found[0], found[1])
+            if fix is None:
+                return None
+            changed[fix[0]] = fix[1]
+        return changed if target.matches(changed) else None
+
+    def _clear(self, changed, target):
+        """
+        changed further changed so that target fires, by breaking the rules
+        that would fire before it, or None.
+        """
+        for _ in range(len(self.rule_base)):
+            fired = self.recommended_rules(changed)
+            if target in fired:
+                return changed
+            # target is exclusive and gated by the Plan of the first rule to fire
+            blocker = fired[0]
+            fix = None
+            for condition in blocker.conditions:
+                found = self._cheapest_fix(
+                    changed,
+                    [condition],
+                    lambda p, condition=condition: not condition(p) and target.matches(p),
+                )
+                if found is not None and (fix is None or found[2] < fix[2]):
+                    fix = found
+            if fix is None:
+                return None
+            changed = {**changed, fix[0]: fix[1]}
+        return None
+
+    def explain(self, profile, limit=3):
+        """
+        The nearest changes to profile that change the recommendation, cheapest
+        first, at most one per resulting recommendation. Each is a dict:
+        rule_id and plan_name of the rule the change brings in, rule_ids (every
+        rule that would fire), changes ([{field, from, to}]) and cost.
+        """
+        current = self.recommended_rules(profile)
+        current_ids = tuple(rule.id for rule in current)
+
+        # Satisfying a target is a lower bound on reaching it (breaking the rules
+        # in its way only adds changes), so targets are finished cheapest bound
+        # first and the search stops once limit outcomes beat every remaining bound
+        bounded = []
+        for target in self.rule_base:
+            if target in current:
+                continue
+            changed = self._satisfy(profile, target)
+            if changed is not None:
+                bounded.append((_rank(profile, changed), target.number, target, changed))
+        bounded.sort(key=lambda entry: entry[:2])
+
+        best = {}  # outcome -> counterfactual
+        for rank, _, target, changed in bounded:
+            if limit is not None and len(best) >= limit:
+                kept = sorted(counterfactual["rank"] for counterfactual in best.values())
+                if kept[limit - 1] <= rank:
+                    break
+            changed = self._clear(changed, target)
+            if changed is None:
+                continue
+            fired = tuple(rule.id for rule in self.recommended_rules(changed))
+            rank = _rank(profile, changed)
+            if fired == current_ids or (fired in best and best[fired]["rank"] <= rank):
+                continue
+            best[fired] = {
+                "rule_id": target.id,
+                "plan_name": target.name,
+                "rule_ids": list(fired),
+                "changes": [
+                    {"field": field, "from": profile[field], "to": changed[field]}
+                    for field in profile
+                    if changed[field] != profile[field]
+                ],
+                "cost": round(rank[1], 3),
+                "rank": rank,
+            }
+
+        results = sorted(best.values(), key=lambda counterfactual: counterfactual["rank"])
+        for counterfactual in results:
+            del counterfactual["rank"]
+        return results[:limit] if limit is not None else results
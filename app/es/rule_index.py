@@ -0,0 +1,93 @@
+"""
+Rule index fast path.
+
+Most rules test goal_type, risk_tolerance or both, so for a given pair of
+values only a few rules can match at all. RuleIndex works out, for every
+combination of the form's goal types and risk tolerances, the candidate rules
+whose tests on those fields pass, in salience order, each with the conditions
+left to check. A run evaluates only those and fires them the way the engine
+does (rulebase.select_fired()), recording the results through the same
+RecommendationResults code as RupeeLogicEngine, so fired rules, confidences,
+plans, alternative plans and ranked plans are identical to a full engine run.
+
+Values outside the form options are looked up without the index. Rules that
+can never fire (es/rulespace.py) are not indexed, as in the engine.
+"""
+
+import itertools
+
+from core.metrics import ENGINE_SECONDS
+from core.tracing import tracer
+from es.counterfactual import CHOICES
+from es.rulebase import GOAL_FIELDS, PROFILE_FIELDS, select_fired
+from es.RupeeLogicEngine import LIVE_RULES, RecommendationResults
+
+INDEX_FIELDS = ("goal_type", "risk_tolerance")
+
+
+class IndexedRun(RecommendationResults):
+    """The results of one profile run through a RuleIndex; same interface as the engine's."""
+
+    def __init__(self, user_data):
+        self.profile = {field: user_data[field] for field in PROFILE_FIELDS + GOAL_FIELDS}
+        self.fired_rules = []  # FiredRule(rule_id, confidence) per fired rule
+        self.alternative_plans = []
+        self.plans = []  # Primary plan dicts, in firing order
+        self.activated_rules = []  # Every rule that matched, in the engine's agenda order
+
+    def user_profile(self):
+        return self.profile
+
+
+class RuleIndex:
+    """Candidate rules per (goal_type, risk_tolerance), highest salience first."""
+
+    def __init__(self, rules):
+        # Stable sort: equal saliences keep file order, as in select_fired()
+        self.rules = sorted(rules, key=lambda rule: -rule.salience)
+        self._index = {
+            key: self._candidates(key)
+            for key in itertools.product(*(CHOICES[field] for field in INDEX_FIELDS))
+        }
+
+    def _candidates(self, key):
+        values = dict(zip(INDEX_FIELDS, key))
+        candidates = []
+        for rule in self.rules:
+            if all(
+                condition.check_value(values[condition.field])
+                for condition in rule.conditions
+                if condition.field in values
+            ):
+                remaining = tuple(c for c in rule.conditions if c.field not in values)
+                candidates.append((rule, remaining))
+        return candidates
+
+    def candidates(self, profile):
+        """[(rule, conditions left to check)] for the profile's goal type and risk tolerance."""
+        key = tuple(profile.get(field) for field in INDEX_FIELDS)
+        candidates = self._index.get(key)
+        return candidates if candidates is not None else self._candidates(key)
+
+    def matched(self, profile):
+        """The rules whose conditions hold for a flat profile dict, highest salience first."""
+        return [
+            rule
+            for rule, remaining in self.candidates(profile)
+            if all(condition(profile) for condition in remaining)
+        ]
+
+    def run(self, user_data):
+        """Run the rules for a complete profile; returns an IndexedRun."""
+        with ENGINE_SECONDS.time(phase="indexed"), tracer.span("engine.indexed") as span:
+            result = IndexedRun(user_data)
+            matched = self.matched(result.profile)
+            # The engine's agenda lists activations lowest salience first
+            result.activated_rules = matched[::-1]
+            for rule in select_fired(matched):
+                result.plans.append(result.record_firing(rule, result.profile))
+            span.set_attribute("rules_fired", [plan["rule_id"] for plan in result.plans])
+        return result
+
+
+rule_index = RuleIndex(LIVE_RULES)
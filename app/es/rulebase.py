@@ -0,0 +1,344 @@
+"""
+Data-driven rule base.
+
+The investment rules live in app/data/rules.json. "format" is the file schema
+version understood by this loader; "version" is the revision of the rules
+themselves and must be bumped whenever a rule changes. Each rule has:
+
+- id, number, name, salience: identity and priority (higher fires first)
+- exclusive: only fires while no plan has been recommended yet
+- when: conditions, each {"field", "op", "value"}, all of which must hold
+- description, condition, action, notes: explanation shown to the user;
+  runs only record (rule id, confidence) and RuleBase.explain() looks the
+  strings up when a report is rendered
+- evidence: inputs to the Bayesian confidence score; a value of
+  {"from_profile": field, "default": value} is read from the user's profile
+- primary: the primary plan's allocations
+- alternatives: alternative plans with a fixed "confidence" or a
+  "confidence_offset" below the primary confidence (never under 50)
+
+The loader validates the file and compiles it once: conditions become
+predicate closures and plans become pre-built allocation objects, so firing a
+rule only computes the confidence. RupeeLogicEngine generates its experta rules
+from the compiled rules.
+"""
+
+import json
+import operator
+from collections import namedtuple
+
+RULES_PATH = "app/data/rules.json"
+RULES_FORMAT_VERSION = 1
+
+PROFILE_FIELDS = (
+    "age",
+    "monthly_income",
+    "monthly_expenses",
+    "current_savings",
+    "has_high_interest_debt",
+    "risk_tolerance",
+)
+GOAL_FIELDS = ("goal_type", "time_horizon")
+
+# Whole numbers (years, LKR); the rule thresholds and es/rulespace.py assume so
+NUMERIC_FIELDS = ("age", "monthly_income", "monthly_expenses", "current_savings", "time_horizon")
+
+# Fields computed from other profile fields: name -> (inputs, function)
+DERIVED_FIELDS = {
+    "monthly_surplus": (
+        ("monthly_income", "monthly_expenses"),
+        lambda monthly_income, monthly_expenses: monthly_income - monthly_expenses,
+    ),
+    "emergency_fund_gap": (
+        ("monthly_expenses", "current_savings"),
+        lambda monthly_expenses, current_savings: monthly_expenses * 6 - current_savings,
+    ),
+}
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda actual, expected: actual in expected,
+}
+
+ALLOCATION_FIELDS = ("asset_class", "percent", "reason", "reference")
+
+
+class RuleBaseError(ValueError):
+    """Raised when the rules file fails validation."""
+
+
+class FiredRule(namedtuple("FiredRule", ("rule_id", "confidence"))):
+    """What a run records per fired rule; the explanation strings stay in the rule base."""
+
+    __slots__ = ()
+
+
+def bayesian_confidence(user_profile, rule_conditions):
+    """
+    Simple method to Calculate confidence using identified user inputs
+    """
+    base_confidence = 0.5  # Prior probability
+
+    # Evidence weights
+    evidence_scores = []
+
+    # Age match score
+    if "age_range" in rule_conditions:
+        min_age, max_age = rule_conditions["age_range"]
+        age = user_profile["age"]
+        if min_age <= age <= max_age:
+            # Perfect match in middle of range
+            age_center = (min_age + max_age) / 2
+            age_match = 1 - abs(age - age_center) / (max_age - min_age)
+            evidence_scores.append(age_match * 0.3)  # 30% weight
+
+    # Risk tolerance exact match
+    if rule_conditions.get("risk_tolerance") == user_profile.get("risk_tolerance"):
+        evidence_scores.append(0.25)  # 25% weight
+
+    # Time horizon match
+    if "time_horizon_min" in rule_conditions:
+        min_horizon = rule_conditions["time_horizon_min"]
+        if min_horizon > 0 and user_profile["time_horizon"] >= min_horizon:
+            horizon_score = min(user_profile["time_horizon"] / min_horizon, 1.0)
+            evidence_scores.append(horizon_score * 0.25)  # 25% weight
+        elif min_horizon == 0:
+            # For rules with no minimum time horizon (like short-term goals)
+            evidence_scores.append(0.25)  # Full weight since any horizon qualifies
+
+    # Goal alignment
+    if rule_conditions.get("goal_type") == user_profile.get("goal_type"):
+        evidence_scores.append(0.2)  # 20% weight
+
+    # Simplified: Combine evidence with base confidence
+    confidence = base_confidence + sum(evidence_scores)
+
+    return min(max(confidence * 100, 50), 95)  # Clamp between 50-95%
+
+
+def field_value(profile, field):
+    """Read a (possibly derived) field from a flat profile dict; None if unknown."""
+    if field in DERIVED_FIELDS:
+        inputs, derive = DERIVED_FIELDS[field]
+        args = [profile.get(name) for name in inputs]
+        if any(arg is None for arg in args):
+            return None
+        return derive(*args)
+    return profile.get(field)
+
+
+def whole_numbers(profile):
+    """A copy of profile with fractional numeric fields rounded, e.g. from Chat Mode."""
+    return {
+        field: int(round(value)) if field in NUMERIC_FIELDS and isinstance(value, float) else value
+        for field, value in profile.items()
+    }
+
+
+def select_fired(matched):
+    """
+    The rules the engine fires, in firing order, given the rules whose
+    conditions hold. Like the agenda, this walks them highest salience first
+    (ties go to the first in file order): a non-exclusive rule always fires,
+    and an exclusive rule fires only while no Plan has been declared, i.e.
+    if no rule has fired before it.
+    """
+    fired = []
+    for rule in sorted(matched, key=lambda rule: -rule.salience):
+        if not rule.exclusive or not fired:
+            fired.append(rule)
+    return fired
+
+
+class Condition:
+    """One compiled `field op value` test."""
+
+    __slots__ = ("field", "op", "value", "_compare")
+
+    def __init__(self, field, op, value):
+        if field not in PROFILE_FIELDS + GOAL_FIELDS and field not in DERIVED_FIELDS:
+            raise RuleBaseError(f"Unknown field '{field}'")
+        if op not in OPERATORS:
+            raise RuleBaseError(f"Unknown operator '{op}'")
+        self.field = field
+        self.op = op
+        self.value = tuple(value) if op == "in" else value
+        self._compare = OPERATORS[op]
+
+    @property
+    def inputs(self):
+        """The base profile fields this condition reads."""
+        if self.field in DERIVED_FIELDS:
+            return DERIVED_FIELDS[self.field][0]
+        return (self.field,)
+
+    def check_value(self, actual):
+        """Test an already-resolved field value. Unknown or mistyped values never match."""
+        if actual is None:
+            return False
+        try:
+            return bool(self._compare(actual, self.value))
+        except TypeError:
+            return False
+
+    def __call__(self, profile):
+        return self.check_value(field_value(profile, self.field))
+
+    def __repr__(self):
+        return f"{self.field} {self.op} {self.value!r}"
+
+
+class AlternativePlan:
+    """A pre-built alternative plan; only its confidence depends on the user."""
+
+    __slots__ = ("plan_name", "description", "confidence", "confidence_offset", "allocations")
+
+    def __init__(self, spec):
+        self.plan_name = spec["plan_name"]
+        self.description = spec.get("description")
+        self.confidence = spec.get("confidence")
+        self.confidence_offset = spec.get("confidence_offset")
+        if (self.confidence is None) == (self.confidence_offset is None):
+            raise RuleBaseError(
+                f"'{self.plan_name}' needs exactly one of confidence or confidence_offset"
+            )
+        self.allocations = _compile_allocations(spec["allocations"], self.plan_name)
+
+    def instantiate(self, primary_confidence):
+        """Return the plan dict for a fired rule with the given primary confidence."""
+        if self.confidence is not None:
+            confidence = self.confidence
+        else:
+            confidence = round(max(primary_confidence - self.confidence_offset, 50))
+        plan = {"plan_name": self.plan_name, "confidence": confidence}
+        if self.description is not None:
+            plan["description"] = self.description
+        # Allocation dicts are built once at load time and shared; treat them as read-only
+        plan["allocations"] = self.allocations
+        return plan
+
+
+def _compile_allocations(specs, owner):
+    allocations = []
+    for spec in specs:
+        missing = [field for field in ALLOCATION_FIELDS if field not in spec]
+        if missing:
+            raise RuleBaseError(f"Allocation in '{owner}' is missing: {', '.join(missing)}")
+        allocations.append({field: spec[field] for field in ALLOCATION_FIELDS})
+    if sum(a["percent"] for a in allocations) != 100:
+        raise RuleBaseError(f"Allocations in '{owner}' must add up to 100%")
+    return allocations
+
+
+class CompiledRule:
+    """A validated rule with compiled predicates and pre-built plans."""
+
+    def __init__(self, spec):
+        self.id = spec["id"]
+        self.number = spec["number"]
+        self.name = spec["name"]
+        self.salience = spec["salience"]
+        self.exclusive = spec["exclusive"]
+        self.description = spec["description"]
+        self.condition = spec["condition"]
+        self.action = spec["action"]
+        self.notes = "\n".join(spec.get("notes", []))
+        self.conditions = tuple(
+            Condition(c["field"], c["op"], c["value"]) for c in spec["when"]
+        )
+        self.evidence = {
+            key: tuple(value) if isinstance(value, list) else value
+            for key, value in spec["evidence"].items()
+        }
+        self.primary = _compile_allocations(spec["primary"], self.id)
+        self.alternatives = tuple(AlternativePlan(alt) for alt in spec["alternatives"])
+
+    def matches(self, profile):
+        """True if every condition holds for the flat profile dict."""
+        for condition in self.conditions:
+            if not condition(profile):
+                return False
+        return True
+
+    def evidence_for(self, user_profile):
+        """Resolve the confidence inputs against the user's profile."""
+        resolved = {}
+        for key, value in self.evidence.items():
+            if isinstance(value, dict):
+                value = user_profile.get(value["from_profile"], value.get("default"))
+            resolved[key] = value
+        return resolved
+
+    def confidence(self, user_profile):
+        return bayesian_confidence(user_profile, self.evidence_for(user_profile))
+
+    def explain(self, confidence):
+        """The explanation record for this rule having fired with the given confidence."""
+        return {
+            "rule_number": self.number,
+            "rule_name": self.name,
+            "salience": self.salience,
+            "confidence": round(confidence),
+            "description": self.description,
+            "condition": self.condition,
+            "action": self.action,
+        }
+
+    def alternative_plans(self, confidence):
+        return [alt.instantiate(confidence) for alt in self.alternatives]
+
+    def __repr__(self):
+        return f"<CompiledRule {self.number} {self.id} salience={self.salience}>"
+
+
+class RuleBase:
+    """The compiled rules, in file order, with lookup by id; also the catalog of rule explanations."""
+
+    def __init__(self, version, rules):
+        self.version = version
+        self.rules = tuple(rules)
+        self.by_id = {rule.id: rule for rule in self.rules}
+        if len(self.by_id) != len(self.rules):
+            raise RuleBaseError("Rule ids must be unique")
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __getitem__(self, rule_id):
+        return self.by_id[rule_id]
+
+    def explain(self, fired_rules):
+        """
+        Expand (rule_id, confidence) records into explanation dicts (rule_number,
+        rule_name, salience, confidence, description, condition, action).
+        Records for rules no longer in the rule base are skipped.
+        """
+        return [
+            self.by_id[rule_id].explain(confidence)
+            for rule_id, confidence in fired_rules
+            if rule_id in self.by_id
+        ]
+
+
+def load_rulebase(path=RULES_PATH):
+    """Load, validate and compile the rules file."""
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+
+    if spec.get("format") != RULES_FORMAT_VERSION:
+        raise RuleBaseError(
+            f"Unsupported rules file format {spec.get('format')!r}, expected {RULES_FORMAT_VERSION}"
+        )
+    try:
+        rules = [CompiledRule(rule) for rule in spec["rules"]]
+    except KeyError as e:
+        raise RuleBaseError(f"Rule is missing required key {e}") from e
+    return RuleBase(spec["version"], rules)
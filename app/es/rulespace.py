@@ -0,0 +1,450 @@
+"""
+Static analysis of the rule space.
+
+Every condition compares one field (or derived field) with a constant, so the
+thresholds in rules.json cut each field into intervals on which every
+condition is constant. The product of those intervals partitions all possible
+profiles into regions in which the same rules match, and evaluating the rules
+once per region gives, exactly:
+
+- dead rules: rules that fire for no profile at all, either because their
+  conditions can never hold together (unsatisfiable) or because wherever they
+  hold, a higher-priority rule fires instead (shadowed everywhere);
+- shadowed regions: for each pair of rules, where one matches but the other
+  fires instead, described as the intersection of their conditions;
+- salience ties between exclusive rules that can match together, where the
+  engine's choice between them is arbitrary;
+- coverage: which rules fire in each (goal_type, risk_tolerance) region, and how
+  much of the space falls through to rules without conditions (the default).
+
+Fields linked by a derived field (income, expenses and savings, through
+monthly_surplus and emergency_fund_gap) are analysed together: a combination of
+their intervals is a region only if a whole-number profile lands in all of
+them, which is decided by propagating bounds through the linear derived fields.
+Numeric fields are whole numbers >= 0, which is all the engine sees: profiles
+are rounded at the boundary (rulebase.whole_numbers()) before the rules run, so
+a rule that only a fractional value could satisfy is rightly dead. Categorical
+fields take their form options, the values the rules test, and any other value.
+Shares are of regions, not of users.
+
+Print the report with `cd app && python -m es.rulespace` (--json for the raw
+report). RupeeLogicEngine and the rule index only load live_rules().
+"""
+
+import argparse
+import itertools
+import json
+import math
+from collections import Counter
+
+from es.counterfactual import CHOICES
+from es.rulebase import DERIVED_FIELDS, RULES_PATH, RuleBaseError, load_rulebase, select_fired
+
+OTHER = "<other>"  # Any categorical value that no rule or form option mentions
+
+# Coverage is reported per combination of these fields' values
+COVERAGE_FIELDS = ("goal_type", "risk_tolerance")
+COVERAGE_TOP = 6  # Rules listed per region in the text report
+
+
+def _ceil(value):
+    return value if math.isinf(value) else math.ceil(value)
+
+
+def _floor(value):
+    return value if math.isinf(value) else math.floor(value)
+
+
+def _numeric_cells(thresholds, low):
+    """Whole-number intervals (lo, hi) from low up, on which no threshold falls inside."""
+    points = sorted({p for t in thresholds for p in (math.floor(t), math.ceil(t)) if p >= low})
+    cells = []
+    start = low
+    for point in points:
+        if start <= point - 1:
+            cells.append((start, point - 1))
+        cells.append((point, point))
+        start = point + 1
+    cells.append((start, math.inf))
+    return cells
+
+
+def _linear_form(field):
+    """(constant, {input: coefficient}) of a derived field; it must be linear in its inputs."""
+    inputs, derive = DERIVED_FIELDS[field]
+    zero = dict.fromkeys(inputs, 0)
+    constant = derive(**zero)
+    coefficients = {name: derive(**{**zero, name: 1}) - constant for name in inputs}
+    probe = {name: i + 2 for i, name in enumerate(inputs)}
+    if derive(**probe) != constant + sum(coefficients[name] * probe[name] for name in inputs):
+        raise RuleBaseError(f"Derived field '{field}' is not linear in its inputs")
+    return constant, {name: a for name, a in coefficients.items() if a}
+
+
+def _propagate(bounds, forms):
+    """
+    Narrow whole-number bounds {field: (lo, hi)} in place until every derived
+    field's bounds agree with its inputs'. Returns False if some bounds become empty.
+    """
+    for _ in range(100):
+        changed = False
+        for field, (constant, coefficients) in forms.items():
+            terms = {
+                name: sorted((a * bounds[name][0], a * bounds[name][1]))
+                for name, a in coefficients.items()
+            }
+            total_lo = constant + sum(lo for lo, _ in terms.values())
+            total_hi = constant + sum(hi for _, hi in terms.values())
+            narrowed = {field: (total_lo, total_hi)}
+            d_lo, d_hi = bounds[field]
+            for name, a in coefficients.items():
+                others = [term for other, term in terms.items() if other != name]
+                lo = (d_lo - constant - sum(hi for _, hi in others)) / a
+                hi = (d_hi - constant - sum(lo for lo, _ in others)) / a
+                narrowed[name] = (min(lo, hi), max(lo, hi))
+            for name, (lo, hi) in narrowed.items():
+                old_lo, old_hi = bounds[name]
+                new = (max(old_lo, _ceil(lo)), min(old_hi, _floor(hi)))
+                if new[0] > new[1]:
+                    return False
+                if new != (old_lo, old_hi):
+                    bounds[name] = new
+                    changed = True
+        if not changed:
+            return True
+    return True
+
+
+class RuleSpace:
+    """The rule space of a RuleBase, partitioned into regions (see module docs)."""
+
+    def __init__(self, rule_base):
+        self.rule_base = rule_base
+        self.rules = list(rule_base)
+        self._fired = {}  # mask of matched rules -> fired rules
+
+        values = {}
+        for rule in self.rules:
+            for condition in rule.conditions:
+                found = values.setdefault(condition.field, [])
+                found.extend(condition.value if condition.op == "in" else (condition.value,))
+        self._values = values
+
+        # Fields connected through derived fields are analysed as one group
+        groups = []
+        for field in values:
+            linked = {field, *DERIVED_FIELDS[field][0]} if field in DERIVED_FIELDS else {field}
+            for group in [g for g in groups if g & linked]:
+                groups.remove(group)
+                linked |= group
+            groups.append(linked)
+        self.groups = [self._regions(sorted(group)) for group in groups]
+
+    def _is_categorical(self, field):
+        return field in CHOICES or any(
+            isinstance(value, (str, bool)) for value in self._values.get(field, ())
+        )
+
+    def _cells(self, field):
+        values = self._values.get(field, [])
+        if self._is_categorical(field):
+            cells = list(dict.fromkeys([*CHOICES.get(field, ()), *values]))
+            if not all(isinstance(value, bool) for value in cells):
+                cells.append(OTHER)
+            return cells
+        low = -math.inf if field in DERIVED_FIELDS else 0
+        return _numeric_cells(values, low)
+
+    def _mask(self, assignment):
+        """Bits of the rules whose conditions on the assigned fields all hold."""
+        mask = 0
+        for i, rule in enumerate(self.rules):
+            if all(
+                condition.check_value(assignment[condition.field])
+                for condition in rule.conditions
+                if condition.field in assignment
+            ):
+                mask |= 1 << i
+        return mask
+
+    def _regions(self, fields):
+        """
+        [(assignment, mask, weight)] for a group of fields: an example value per
+        field, the rules matching on these fields, and the number of interval
+        combinations collapsed into the region.
+        """
+        derived = [field for field in fields if field in DERIVED_FIELDS]
+        forms = {field: _linear_form(field) for field in derived}
+        base = [field for field in fields if field not in DERIVED_FIELDS]
+        categorical = any(self._is_categorical(field) for field in fields)
+
+        regions = {}
+        for cells in itertools.product(*(self._cells(field) for field in fields)):
+            cells = dict(zip(fields, cells))
+            if categorical:
+                assignment = cells
+            else:
+                assignment = self._witness(cells, base, forms)
+                if assignment is None:
+                    continue
+            mask = self._mask(assignment)
+            # Numeric regions only matter through the rules they match
+            key = tuple(sorted(assignment.items(), key=str)) if categorical else mask
+            if key in regions:
+                regions[key][2] += 1
+            else:
+                regions[key] = [assignment, mask, 1]
+        return [tuple(region) for region in regions.values()]
+
+    def _witness(self, cells, base, forms):
+        """A whole-number profile inside every cell, or None if there is none."""
+        bounds = dict(cells)
+        if not _propagate(bounds, forms):
+            return None
+        assignment = {}
+        for field in base:
+            lo, hi = bounds[field]
+            value = lo if not math.isinf(lo) else (hi if not math.isinf(hi) else 0)
+            bounds[field] = (value, value)
+            if not _propagate(bounds, forms):
+                return None
+            assignment[field] = value
+        for field, (constant, coefficients) in forms.items():
+            value = constant + sum(a * assignment[name] for name, a in coefficients.items())
+            lo, hi = cells[field]
+            if not lo <= value <= hi:
+                return None
+            assignment[field] = value
+        return assignment
+
+    def fired_for(self, mask):
+        """The rules fired in a region with the given mask of matched rules."""
+        if mask not in self._fired:
+            matched = [rule for i, rule in enumerate(self.rules) if mask >> i & 1]
+            self._fired[mask] = tuple(select_fired(matched))
+        return self._fired[mask]
+
+    def regions(self):
+        """Yield (example profile, mask, weight) for every region of the space."""
+        full = (1 << len(self.rules)) - 1
+        for combination in itertools.product(*self.groups):
+            profile = {}
+            mask = full
+            weight = 1
+            for assignment, group_mask, group_weight in combination:
+                profile.update(assignment)
+                mask &= group_mask
+                weight *= group_weight
+            yield profile, mask, weight
+
+    def analyze(self):
+        """The analysis as a JSON-serializable dict (see module docs)."""
+        matched = Counter()
+        fired = Counter()
+        shadowed = Counter()
+        examples = {}
+        ties = {}
+        coverage = {}
+        default = 0
+        total = 0
+        for profile, mask, weight in self.regions():
+            total += weight
+            winners = self.fired_for(mask)
+            winner_ids = {rule.id for rule in winners}
+            for i, rule in enumerate(self.rules):
+                if not mask >> i & 1:
+                    continue
+                matched[rule.id] += weight
+                if rule.id in winner_ids:
+                    fired[rule.id] += weight
+                elif winners:
+                    pair = (rule.id, winners[0].id)
+                    shadowed[pair] += weight
+                    examples.setdefault(pair, profile)
+                    if rule.exclusive and rule.salience == winners[0].salience:
+                        ties.setdefault(tuple(sorted(pair)), profile)
+            if all(not rule.conditions for rule in winners):
+                default += weight
+            # The region's plan is decided by the first rule to fire
+            region = " / ".join(str(profile.get(field, "any")) for field in COVERAGE_FIELDS)
+            coverage.setdefault(region, Counter())[winners[0].id if winners else "none"] += weight
+
+        by_id = self.rule_base.by_id
+        return {
+            "rules_version": self.rule_base.version,
+            "regions": total,
+            "rules": [
+                {
+                    "rule_id": rule.id,
+                    "matched_share": round(matched[rule.id] / total, 4) if total else 0,
+                    "fired_share": round(fired[rule.id] / total, 4) if total else 0,
+                }
+                for rule in self.rules
+            ],
+            "dead_rules": [
+                {
+                    "rule_id": rule.id,
+                    "reason": "unsatisfiable" if not matched[rule.id] else "shadowed",
+                }
+                for rule in self.rules
+                if not fired[rule.id]
+            ],
+            "salience_ties": [
+                {"rules": list(pair), "salience": by_id[pair[0]].salience, "example": example}
+                for pair, example in ties.items()
+            ],
+            "shadowed": [
+                {
+                    "rule_id": loser,
+                    "by": winner,
+                    "share": round(weight / matched[loser], 4),
+                    "where": describe_conditions(
+                        by_id[loser].conditions + by_id[winner].conditions
+                    ),
+                    "example": examples[(loser, winner)],
+                }
+                for (loser, winner), weight in sorted(
+                    shadowed.items(),
+                    key=lambda item: (-by_id[item[0][0]].salience, -item[1]),
+                )
+            ],
+            "default_share": round(default / total, 4) if total else 0,
+            "coverage": {
+                region: {
+                    outcome: round(weight / sum(outcomes.values()), 4)
+                    for outcome, weight in outcomes.most_common()
+                }
+                for region, outcomes in sorted(coverage.items())
+            },
+        }
+
+    def dead_rules(self):
+        """Ids of the rules that no profile can fire."""
+        # Only the distinct masks matter, so they are combined a group at a time
+        masks = {(1 << len(self.rules)) - 1}
+        for group in self.groups:
+            group_masks = {mask for _, mask, _ in group}
+            masks = {mask & group_mask for mask in masks for group_mask in group_masks}
+        fired = set()
+        for mask in masks:
+            fired.update(rule.id for rule in self.fired_for(mask))
+        return {rule.id for rule in self.rules} - fired
+
+
+def live_rules(rule_base):
+    """(the rules of rule_base that some profile can fire, in file order; ids of the others)."""
+    dead = RuleSpace(rule_base).dead_rules()
+    return [rule for rule in rule_base if rule.id not in dead], dead
+
+
+def describe_conditions(conditions):
+    """A conjunction of conditions, with the numeric ones on a field merged into one interval."""
+    parts = []
+    intervals = {}
+    for condition in conditions:
+        value = condition.value
+        if condition.op in ("<", "<=", ">", ">=", "==") and not isinstance(value, (str, bool)):
+            lo, hi = intervals.get(condition.field, (-math.inf, math.inf))
+            if condition.op in ("<", "<=", "=="):
+                hi = min(hi, math.ceil(value) - 1 if condition.op == "<" else math.floor(value))
+            if condition.op in (">", ">=", "=="):
+                lo = max(lo, math.floor(value) + 1 if condition.op == ">" else math.ceil(value))
+            intervals[condition.field] = (lo, hi)
+        elif (condition.field, condition.op, value) not in parts:
+            parts.append((condition.field, condition.op, value))
+
+    described = [f"{field} {op} {value}" for field, op, value in parts]
+    for field, (lo, hi) in intervals.items():
+        if lo > hi:
+            described.append(f"{field} never")
+        elif lo == hi:
+            described.append(f"{field} = {lo}")
+        elif math.isinf(lo):
+            described.append(f"{field} <= {hi}")
+        elif math.isinf(hi):
+            described.append(f"{field} >= {lo}")
+        else:
+            described.append(f"{field} {lo}-{hi}")
+    return ", ".join(described)
+
+
+def format_report(report, rule_base):
+    """The analysis as plain text."""
+
+    def name(rule_id):
+        rule = rule_base.by_id.get(rule_id)
+        return f"{rule.number} {rule.id} ({rule.salience})" if rule else rule_id
+
+    lines = [
+        f"Rule space of rules version {report['rules_version']}: "
+        f"{len(rule_base)} rules, {report['regions']:,} regions",
+        "",
+        "Dead rules (fire for no profile):",
+    ]
+    lines += [
+        f"  {name(dead['rule_id'])}: {dead['reason']}" for dead in report["dead_rules"]
+    ] or ["  none"]
+
+    lines += ["", "Salience ties between exclusive rules that can match together:"]
+    lines += [
+        f"  {' and '.join(name(rule_id) for rule_id in tie['rules'])}"
+        for tie in report["salience_ties"]
+    ] or ["  none"]
+
+    lines += ["", "Rules (share of all regions where the rule matches / fires):"]
+    lines += [
+        f"  {name(entry['rule_id']):<45} {entry['matched_share']:>6.1%} / {entry['fired_share']:>6.1%}"
+        for entry in report["rules"]
+    ]
+
+    # Losing to the non-exclusive rules (which gate every plan) or a default rule
+    # losing to anything is by design; the salience ladder is what needs review
+    lines += ["", "Shadowed regions between exclusive rules (the rule matches, another fires instead):"]
+    ladder = [
+        entry
+        for entry in report["shadowed"]
+        if rule_base.by_id[entry["rule_id"]].conditions
+        and rule_base.by_id[entry["rule_id"]].exclusive
+        and rule_base.by_id[entry["by"]].exclusive
+    ]
+    for entry in ladder:
+        lines.append(
+            f"  {name(entry['rule_id'])} by {name(entry['by'])}: "
+            f"{entry['share']:.1%} of its regions"
+        )
+        lines.append(f"      where {entry['where']}")
+    if not ladder:
+        lines.append("  none")
+
+    lines += [
+        "",
+        f"Regions left to rules without conditions: {report['default_share']:.1%}",
+        "",
+        f"Coverage by {' / '.join(COVERAGE_FIELDS)} (rule deciding the plan, share of regions):",
+    ]
+    for region, outcomes in report["coverage"].items():
+        if OTHER in region:
+            continue
+        shares = ", ".join(
+            f"{outcome} {share:.0%}" for outcome, share in list(outcomes.items())[:COVERAGE_TOP]
+        )
+        lines.append(f"  {region}: {shares}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the rule space for dead and shadowed rules")
+    parser.add_argument("rules", nargs="?", default=f"../{RULES_PATH}", help="rules.json to analyze")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    rule_base = load_rulebase(args.rules)
+    report = RuleSpace(rule_base).analyze()
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(format_report(report, rule_base))
+
+
+if __name__ == "__main__":
+    main()
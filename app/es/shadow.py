@@ -0,0 +1,118 @@
+"""
+Shadow mode: replay live requests on a second inference backend.
+
+ShadowRunner.submit() is called after the serving backend has answered. A
+sampled share of requests is queued and rerun on the shadow backend in a
+background thread, off the request path; its results are compared with the
+serving backend's (fired rules, confidences, plans, alternative plans and
+activated rules, see backends.compare_results()) and its run time is divided
+by the serving run's.
+
+Outcomes, mismatches per field and the latency ratio go to the metrics
+(rupeelogic_shadow_*). Each mismatch is also logged and appended as a JSON line,
+with the profile and both sides of every differing field, to a file that
+replays can be debugged from. Shadow runs are left out of the engine and rule
+fire metrics, and when the queue is full further requests are dropped rather
+than held.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import SHADOW_LATENCY_RATIO, SHADOW_MISMATCHES, SHADOW_RUNS, muted
+from es.backends import compare_results
+from es.RupeeLogicEngine import RULE_BASE
+
+logger = logging.getLogger(__name__)
+
+# Replays waiting or running at once; more are dropped
+MAX_PENDING = 32
+
+
+class ShadowRunner:
+    """Reruns a sample_rate share of requests on backend and records how its results differ."""
+
+    def __init__(self, backend, sample_rate, serving_name, log_path=None):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.serving_name = serving_name
+        self.log_path = log_path
+        self._pending = 0
+        self._lock = threading.Lock()
+        # A single worker keeps shadow runs from competing with each other for the CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rupeelogic-shadow")
+
+    def submit(self, user_data, results, seconds):
+        """
+        Queue a replay of user_data if it is sampled. results and seconds are the
+        serving backend's results and run time; results must not change afterwards.
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            if self._pending >= MAX_PENDING:
+                SHADOW_RUNS.inc(backend=self.backend.name, outcome="dropped")
+                return
+            self._pending += 1
+        self._executor.submit(self._replay, dict(user_data), results, seconds)
+
+    def _replay(self, user_data, results, seconds):
+        try:
+            start = time.perf_counter()
+            try:
+                with muted():
+                    shadow = self.backend.run(user_data)
+            except Exception:
+                logger.exception("Shadow backend %s failed", self.backend.name)
+                SHADOW_RUNS.inc(backend=self.backend.name, outcome="error")
+                return
+            shadow_seconds = time.perf_counter() - start
+            if seconds > 0:
+                SHADOW_LATENCY_RATIO.observe(shadow_seconds / seconds, backend=self.backend.name)
+
+            differences = compare_results(results, shadow)
+            if not differences:
+                SHADOW_RUNS.inc(backend=self.backend.name, outcome="match")
+                return
+            SHADOW_RUNS.inc(backend=self.backend.name, outcome="mismatch")
+            for difference in differences:
+                SHADOW_MISMATCHES.inc(backend=self.backend.name, field=difference["field"])
+            logger.warning(
+                "Shadow backend %s disagrees with %s on %s",
+                self.backend.name,
+                self.serving_name,
+                ", ".join(difference["field"] for difference in differences),
+            )
+            self._log_mismatch(user_data, differences, seconds, shadow_seconds)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _log_mismatch(self, user_data, differences, seconds, shadow_seconds):
+        if not self.log_path:
+            return
+        record = {
+            "time": time.time(),
+            "rules_version": RULE_BASE.version,
+            "serving_backend": self.serving_name,
+            "shadow_backend": self.backend.name,
+            "profile": user_data,
+            # expected is the serving backend's value, actual the shadow's
+            "differences": differences,
+            "serving_seconds": seconds,
+            "shadow_seconds": shadow_seconds,
+        }
+        line = json.dumps(record, default=str) + "\n"
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning("Could not write shadow mismatch: %s", e)
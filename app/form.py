@@ -1,9 +1,12 @@
 import streamlit as st
-import json
 import pandas as pd
-import plotly.express as px
 
-from es.RupeeLogicEngine import RupeeLogicEngine, UserProfile, InvestmentGoal, Allocation
+from es.RupeeLogicEngine import explain_fired_rules, what_would_change
+from es.counterfactual import describe_counterfactual
+from core.figure_cache import figure_cache
+from core.knowledge_base import knowledge_base
+from core.profiling import profile_request
+from core.recommendation import run_engine
 
 # Set page config
 st.set_page_config(
@@ -14,15 +17,8 @@ st.set_page_config(
 )
 
 
-@st.cache_data
-def load_kb():
-    """Loads the knowledge base and asset details."""
-    with open("app/data/knowledge_base.json", "r") as f:
-        return json.load(f)
-
-
-# Load data
-kb = load_kb()
+# Load data (hot-reloaded by the registry when the file changes)
+kb = knowledge_base.data
 asset_details = kb.get("asset_classes", {})
 
 # --- Header ---
@@ -146,9 +142,10 @@ else:
 
 if submitted:
 
+    # ?profile=sampling|deterministic profiles this submission (see core/profiling.py)
     with st.spinner(
         "Analyzing your financial profile and generating recommendations..."
-    ):
+    ), profile_request("form", st.query_params.get("profile")) as profile:
 
         # ====== BACKEND DEFAULT VALUES ======
         # Apply defaults for any fields the user didn't fill
@@ -200,30 +197,25 @@ if submitted:
         if defaults_used:
             st.info(f"**ℹ️ Default values applied for:** {', '.join(defaults_used)}")
 
-        # 1. Initialize Engine
-        engine = RupeeLogicEngine()
-        engine.reset()
-
-        # 2. Declare User Facts (using final values with defaults applied)
-        engine.declare(
-            UserProfile(
-                age=final_age,
-                monthly_income=final_monthly_income,
-                monthly_expenses=final_monthly_expenses,
-                current_savings=final_current_savings,
-                has_high_interest_debt=has_high_interest_debt,
-                risk_tolerance=final_risk_tolerance,
-            )
-        )
-        engine.declare(
-            InvestmentGoal(goal_type=final_goal_type, time_horizon=final_time_years)
+        # 1. Run the expert system (using final values with defaults applied)
+        final_user_data = {
+            "age": final_age,
+            "monthly_income": final_monthly_income,
+            "monthly_expenses": final_monthly_expenses,
+            "current_savings": final_current_savings,
+            "has_high_interest_debt": has_high_interest_debt,
+            "goal_type": final_goal_type,
+            "time_horizon": final_time_years,
+            "risk_tolerance": final_risk_tolerance,
+        }
+        engine = run_engine(final_user_data)
+        profile.tag(
+            rules_fired=[fired.rule_id for fired in engine.fired_rules],
+            user_data=final_user_data,
         )
 
-        # 3. Run Engine
-        engine.run()
-
-        # 4. Get Results
-        allocations = [f for f in engine.facts.values() if isinstance(f, Allocation)]
+        # 2. Get Results
+        allocations = engine.primary_allocations()
         alternative_allocations = engine.alternative_plans  # Get alternative plans
         fired_rules = engine.fired_rules  # Get the list of fired rules
 
@@ -370,10 +362,8 @@ if submitted:
                     asset_info = item["asset_info"]
                     alloc = item["allocation"]
 
-                    amount_from_savings = (
-                        alloc["percent"] / 100
-                    ) * final_current_savings
-                    amount_monthly = (alloc["percent"] / 100) * monthly_investable
+                    amount_from_savings = alloc["lump_sum"]
+                    amount_monthly = alloc["monthly"]
 
                     # Use different colored boxes for variety
                     if idx % 3 == 1:
@@ -425,17 +415,15 @@ if submitted:
                 with st.expander("📊 **View Detailed Table & Charts**", expanded=True):
                     st.markdown("#### 💼 Asset Allocation Table")
                     formatted_df_primary = df_primary.copy()
-                    formatted_df_primary["Amount from Savings (LKR)"] = (
-                        formatted_df_primary["Allocation (%)"].apply(
-                            lambda x: f"{(x/100 * final_current_savings):,.0f}"
-                        )
-                    )
+                    formatted_df_primary["Amount from Savings (LKR)"] = [
+                        f"{item['allocation']['lump_sum']:,.0f}"
+                        for item in primary_detail_data
+                    ]
                     if monthly_investable > 0:
-                        formatted_df_primary["Monthly Investment (LKR)"] = (
-                            formatted_df_primary["Allocation (%)"].apply(
-                                lambda x: f"{(x/100 * monthly_investable):,.0f}"
-                            )
-                        )
+                        formatted_df_primary["Monthly Investment (LKR)"] = [
+                            f"{item['allocation']['monthly']:,.0f}"
+                            for item in primary_detail_data
+                        ]
                     formatted_df_primary["Allocation (%)"] = formatted_df_primary[
                         "Allocation (%)"
                     ].apply(lambda x: f"{x}%")
@@ -451,25 +439,11 @@ if submitted:
 
                     with col_chart:
                         st.markdown("#### 📊 Portfolio Visualization")
-                        fig_primary = px.pie(
-                            df_primary,
-                            values="Allocation (%)",
-                            names="Asset Class",
-                            title="",
-                            hole=0.4,
-                            color_discrete_sequence=px.colors.qualitative.Bold,
-                        )
-                        fig_primary.update_traces(
-                            textposition="outside",
-                            textinfo="label+percent",
-                            textfont_size=14,
-                            marker=dict(line=dict(color="white", width=2)),
-                        )
-                        fig_primary.update_layout(
-                            showlegend=False,
+                        fig_primary = figure_cache.allocation_pie(
+                            df_primary["Asset Class"],
+                            df_primary["Allocation (%)"],
+                            palette="Bold",
                             height=450,
-                            font=dict(size=13, family="Arial"),
-                            margin=dict(t=30, b=30, l=30, r=30),
                         )
                         st.plotly_chart(fig_primary, use_container_width=True)
 
@@ -636,12 +610,8 @@ if submitted:
                             asset_info = item["asset_info"]
                             alloc = item["allocation"]
 
-                            amount_from_savings = (
-                                alloc["percent"] / 100
-                            ) * final_current_savings
-                            amount_monthly = (
-                                alloc["percent"] / 100
-                            ) * monthly_investable
+                            amount_from_savings = alloc["lump_sum"]
+                            amount_monthly = alloc["monthly"]
 
                             st.info(
                                 f"""
@@ -663,17 +633,15 @@ if submitted:
                         with st.expander("📊 **View Table & Charts**", expanded=False):
                             st.markdown("#### Asset Allocation Table")
                             formatted_df_alt = df_alt.copy()
-                            formatted_df_alt["Amount from Savings (LKR)"] = (
-                                formatted_df_alt["Allocation (%)"].apply(
-                                    lambda x: f"{(x/100 * final_current_savings):,.0f}"
-                                )
-                            )
+                            formatted_df_alt["Amount from Savings (LKR)"] = [
+                                f"{item['allocation']['lump_sum']:,.0f}"
+                                for item in alt_detail_data
+                            ]
                             if monthly_investable > 0:
-                                formatted_df_alt[
-                                    "Monthly Investment (LKR)"
-                                ] = formatted_df_alt["Allocation (%)"].apply(
-                                    lambda x: f"{(x/100 * monthly_investable):,.0f}"
-                                )
+                                formatted_df_alt["Monthly Investment (LKR)"] = [
+                                    f"{item['allocation']['monthly']:,.0f}"
+                                    for item in alt_detail_data
+                                ]
                             formatted_df_alt["Allocation (%)"] = formatted_df_alt[
                                 "Allocation (%)"
                             ].apply(lambda x: f"{x}%")
@@ -691,25 +659,11 @@ if submitted:
 
                             with col_alt_chart:
                                 st.markdown("#### 📊 Portfolio Visualization")
-                                fig_alt = px.pie(
-                                    df_alt,
-                                    values="Allocation (%)",
-                                    names="Asset Class",
-                                    title="",
-                                    hole=0.4,
-                                    color_discrete_sequence=px.colors.qualitative.Pastel,
-                                )
-                                fig_alt.update_traces(
-                                    textposition="outside",
-                                    textinfo="label+percent",
-                                    textfont_size=14,
-                                    marker=dict(line=dict(color="white", width=2)),
-                                )
-                                fig_alt.update_layout(
-                                    showlegend=False,
+                                fig_alt = figure_cache.allocation_pie(
+                                    df_alt["Asset Class"],
+                                    df_alt["Allocation (%)"],
+                                    palette="Pastel",
                                     height=400,
-                                    font=dict(size=13, family="Arial"),
-                                    margin=dict(t=30, b=30, l=30, r=30),
                                 )
                                 st.plotly_chart(fig_alt, use_container_width=True)
 
@@ -751,6 +705,54 @@ if submitted:
                 st.markdown("---")
                 st.markdown("")
 
+            # ========== ALL MATCHING STRATEGIES (TOP-K) ==========
+            # Every rule that matched in this run, not just the one that won
+            ranked_plans = engine.ranked_plans(k=3)
+            if len(ranked_plans) > 1:
+                st.markdown("## 🧭 STRATEGIES THAT MATCHED YOUR PROFILE")
+                st.markdown(
+                    "Each of these expert rules applies to you; they are ranked by rule priority, then confidence:"
+                )
+                st.markdown("")
+
+                for rank, plan in enumerate(ranked_plans, 1):
+                    badge = " ✅ Recommended" if plan["fired"] else ""
+                    with st.expander(
+                        f"**{rank}. {plan['plan_name']}**{badge} - Priority {plan['salience']}, {plan['confidence']}% confidence",
+                        expanded=False,
+                    ):
+                        ranked_rows = []
+                        for alloc in plan["allocations"]:
+                            asset_info = asset_details.get(alloc["asset_class"], {})
+                            row = {
+                                "Asset Class": asset_info.get("name", alloc["asset_class"]),
+                                "Allocation (%)": f"{alloc['percent']}%",
+                                "Amount from Savings (LKR)": f"{alloc['lump_sum']:,.0f}",
+                            }
+                            if monthly_investable > 0:
+                                row["Monthly Investment (LKR)"] = f"{alloc['monthly']:,.0f}"
+                            ranked_rows.append(row)
+                        st.dataframe(
+                            pd.DataFrame(ranked_rows),
+                            use_container_width=True,
+                            hide_index=True,
+                        )
+
+                st.markdown("---")
+                st.markdown("")
+
+            # ========== WHAT WOULD CHANGE MY PLAN ==========
+            # Worked out from the rule thresholds, without running the engine again
+            counterfactuals = what_would_change(final_user_data)
+            if counterfactuals:
+                with st.expander("🔀 **What would change my plan?**", expanded=False):
+                    st.markdown(
+                        "The smallest changes to your profile that would lead to a different recommendation:"
+                    )
+                    for counterfactual in counterfactuals:
+                        st.markdown(f"- {describe_counterfactual(counterfactual)}")
+                st.markdown("")
+
             # ========== OVERALL SUMMARY ==========
             st.markdown("## 📊 Investment Summary")
 
@@ -855,7 +857,7 @@ if submitted:
                     st.markdown("")
 
                     # Display fired rules in a clean format
-                    for idx, rule in enumerate(fired_rules, 1):
+                    for idx, rule in enumerate(explain_fired_rules(fired_rules), 1):
                         col1, col2, col3 = st.columns([1, 3, 2])
 
                         with col1:
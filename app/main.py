@@ -1,5 +1,10 @@
 import streamlit as st
 
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from core.knowledge_base import knowledge_base
+from core.metrics import start_exporter, track_session
+
 # Configure the page
 st.set_page_config(
     page_title="RupeeLogic - Investment Advisor",
@@ -156,6 +161,14 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Pick up knowledge base edits without restarting the worker
+knowledge_base.start_watching()
+
+# Prometheus metrics endpoint/file, if configured (see RUPEELOGIC_METRICS_*)
+start_exporter()
+ctx = get_script_run_ctx()
+track_session(ctx.session_id if ctx else None, st.session_state.to_dict())
+
 # Define pages
 form_page = st.Page("form.py", title="Form Mode", icon="📝", default=True)
 chat_page = st.Page("chat.py", title="Chat Mode", icon="💬")
@@ -0,0 +1,37 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app imports its packages from app/ and reads its data relative to the repo root
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.chdir(ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+GOAL_TYPES = ("Wealth Building", "Retirement", "Child Education", "Home Purchase", "Emergency Fund")
+
+
+def random_profiles(count, seed=42):
+    """Complete profiles spread around the thresholds in rules.json."""
+    rnd = random.Random(seed)
+    return [
+        {
+            "age": rnd.choice([18, 24, 25, 29, 30, 35, 40, 45, 50, 55, 60, 80]),
+            "monthly_income": rnd.choice([20000, 80000, 149999, 150000, 200000, 400000]),
+            "monthly_expenses": rnd.choice([10000, 25000, 60000, 75000, 150000, 250000]),
+            "current_savings": rnd.choice([0, 50000, 100000, 500000, 2000000]),
+            "has_high_interest_debt": rnd.random() < 0.15,
+            "risk_tolerance": rnd.choice(["Low", "Moderate", "High"]),
+            "goal_type": rnd.choice(GOAL_TYPES),
+            "time_horizon": rnd.choice([1, 2, 3, 5, 7, 10, 15, 20]),
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture
+def profiles():
+    return random_profiles(300)
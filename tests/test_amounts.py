@@ -0,0 +1,53 @@
+from es.amounts import plan_amounts, split_amount
+
+
+def plan(*shares):
+    return [{"asset_class": asset, "percent": percent} for asset, percent in shares]
+
+
+def test_amounts_round_down_to_the_step_and_add_up():
+    allocations = plan(("savings_account", 33), ("money_market_funds", 33), ("gold", 34))
+    amounts = split_amount(allocations, 100_050)
+
+    assert all(amount % 100 == 0 for amount in amounts)
+    assert sum(amounts) == 100_000
+    # 1000 units split 330/330/340 exactly
+    assert amounts == [33_000, 33_000, 34_000]
+
+
+def test_largest_remainders_get_the_leftover_units():
+    allocations = plan(("savings_account", 1), ("savings_account", 1), ("savings_account", 1))
+    assert split_amount(allocations, 1_000) == [400, 300, 300]
+
+
+def test_shares_below_their_minimum_are_redistributed():
+    # 20% of 200,000 is below the 100,000 treasury bill minimum
+    allocations = plan(("fixed_deposits", 80), ("treasury_bills", 20))
+    assert split_amount(allocations, 200_000) == [200_000, 0]
+
+
+def test_share_furthest_below_its_minimum_is_dropped_first():
+    # Both are short at first; dropping real estate lets the treasury bills through
+    allocations = plan(("fixed_deposits", 40), ("treasury_bills", 30), ("real_estate", 30))
+    assert split_amount(allocations, 400_000) == [228_600, 171_400, 0]
+
+
+def test_unaffordable_plans_go_to_the_largest_affordable_allocation():
+    allocations = plan(("treasury_bills", 60), ("fixed_deposits", 30), ("gold", 10))
+    assert split_amount(allocations, 15_000) == [0, 15_000, 0]
+
+
+def test_nothing_affordable_stays_uninvested():
+    allocations = plan(("treasury_bills", 50), ("real_estate", 50))
+    assert split_amount(allocations, 50_000) == [0, 0]
+    assert split_amount(allocations, -5_000) == [0, 0]
+
+
+def test_assets_without_a_fixed_minimum_are_always_affordable():
+    allocations = plan(("epf_contribution", 50), ("budget_management", 50))
+    assert split_amount(allocations, 250) == [100, 100]
+
+
+def test_plan_amounts_pairs_lump_sum_and_monthly():
+    allocations = plan(("savings_account", 50), ("money_market_funds", 50))
+    assert plan_amounts(allocations, 20_000, 10_000) == ((10_000, 5_000), (10_000, 5_000))
@@ -0,0 +1,81 @@
+import json
+import types
+
+import pytest
+
+from core import recommendation
+from core.metrics import SHADOW_MISMATCHES, SHADOW_RUNS, muted
+from es.backends import ExpertaBackend, IndexedBackend, InferenceBackend, compare_results
+from es.shadow import ShadowRunner
+
+
+def test_indexed_backend_agrees_with_experta(profiles):
+    experta, indexed = ExpertaBackend(), IndexedBackend()
+    for profile in profiles:
+        assert compare_results(experta.run(profile), indexed.run(profile)) == []
+
+
+class ZeroConfidenceBackend(IndexedBackend):
+    """Gets the first fired rule's confidence wrong."""
+
+    name = "zero_confidence"
+
+    def run(self, user_data):
+        results = super().run(user_data)
+        results.fired_rules[0] = results.fired_rules[0]._replace(confidence=0)
+        return results
+
+
+def test_shadow_runner_records_mismatches(profiles, tmp_path):
+    log_path = tmp_path / "mismatches.jsonl"
+    runner = ShadowRunner(ZeroConfidenceBackend(), 1.0, "indexed", str(log_path))
+    for profile in profiles[:3]:
+        runner.submit(profile, IndexedBackend().run(profile), 0.001)
+    runner._executor.shutdown(wait=True)
+
+    assert SHADOW_RUNS._values[("zero_confidence", "mismatch")] == 3
+    assert SHADOW_MISMATCHES._values[("zero_confidence", "confidences")] == 3
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [record["profile"] for record in records] == profiles[:3]
+    assert records[0]["differences"][0]["actual"] != records[0]["differences"][0]["expected"]
+
+
+class FailingBackend(IndexedBackend):
+    name = "failing"
+
+    def run(self, user_data):
+        raise RuntimeError("shadow backend down")
+
+
+def test_shadow_runner_skips_unsampled_requests(profiles):
+    runner = ShadowRunner(FailingBackend(), 0.0, "indexed")
+    runner.submit(profiles[0], IndexedBackend().run(profiles[0]), 0.001)
+    runner._executor.shutdown(wait=True)
+    assert ("failing", "error") not in SHADOW_RUNS._values
+
+
+def test_shadow_runner_counts_backend_errors(profiles):
+    runner = ShadowRunner(FailingBackend(), 1.0, "indexed")
+    runner.submit(profiles[0], IndexedBackend().run(profiles[0]), 0.001)
+    runner._executor.shutdown(wait=True)
+    assert SHADOW_RUNS._values[("failing", "error")] == 1
+    assert runner._pending == 0
+
+
+def test_muted_runs_are_not_shadowed(profiles, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(recommendation, "shadow_runner", types.SimpleNamespace(submit=lambda *args: submitted.append(args)))
+
+    with muted():
+        recommendation.run_engine(profiles[0])
+    assert submitted == []
+    recommendation.run_engine(profiles[0])
+    assert len(submitted) == 1
+
+
+def test_backends_must_implement_run():
+    class Incomplete(InferenceBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
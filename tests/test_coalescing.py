@@ -0,0 +1,133 @@
+import threading
+import time
+import types
+
+import pytest
+
+from core.config import LLMUnavailable, QuotaExceeded, SingleFlight, config, request_key
+from core.metrics import LLM_TOKENS
+
+
+def request(content):
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": content}],
+        "temperature": 0.5,
+    }
+
+
+def test_request_key_hashes_the_exact_messages():
+    assert request_key(request("a\n  b")) == request_key(request("a\n  b"))
+    assert request_key(request("a\n  b")) != request_key(request("a\nb"))
+    assert request_key({**request("a"), "timeout": 5}) == request_key(request("a"))
+    assert request_key({**request("a"), "temperature": 0}) != request_key(request("a"))
+
+
+def run_concurrently(flight, calls):
+    """Start the first call, then the others while it is in flight; return results or errors."""
+    results = [None] * len(calls)
+    started = threading.Event()
+
+    def run(i):
+        try:
+            results[i] = flight.do("key", calls[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+    calls[0].started = started
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    calls[0].release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+class Leader:
+    """A call that blocks until released, then returns or raises outcome."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.release = threading.Event()
+        self.started = None
+
+    def __call__(self):
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def test_waiters_share_the_leaders_result():
+    flight = SingleFlight()
+    own_calls = []
+    waiter = lambda: own_calls.append(1) or "own"
+    results = run_concurrently(flight, [Leader("shared"), waiter, waiter])
+    assert results == ["shared", "shared", "shared"]
+    assert flight.coalesced == 2 and not own_calls
+
+
+def test_waiters_share_errors_about_the_call():
+    flight = SingleFlight(private_errors=(QuotaExceeded,))
+    error = LLMUnavailable("LLM circuit is open")
+    results = run_concurrently(flight, [Leader(error), lambda: "own"])
+    assert results == [error, error]
+
+
+def test_waiters_retry_after_a_private_error():
+    flight = SingleFlight(private_errors=(QuotaExceeded,))
+    error = QuotaExceeded("Session LLM quota exceeded")
+    results = run_concurrently(flight, [Leader(error), lambda: "own"])
+    assert results == [error, "own"]
+
+
+def test_nothing_is_kept_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError()))
+    assert flight._inflight == {}
+
+
+class FakeCompletions:
+    """Chat completions that block until released and report fixed token usage."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def create(self, **request):
+        self.calls += 1
+        self.release.wait(5)
+        message = types.SimpleNamespace(content="answer")
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message)],
+            usage=types.SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+        )
+
+
+def test_coalesced_callers_count_tokens_once(monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(config, "client", types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    messages = [{"role": "user", "content": f"tokens {time.time()}"}]
+    before = LLM_TOKENS._values.get(("coalescing_test", "prompt"), 0)
+
+    threads = [
+        threading.Thread(target=config.chat_llm, args=(messages,), kwargs={"call_type": "coalescing_test"})
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    completions.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert completions.calls == 1
+    assert LLM_TOKENS._values[("coalescing_test", "prompt")] - before == 100
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from core.recommendation import asks_what_would_change, run_engine
+from es.backends import result_signature
+from es.RupeeLogicEngine import _counterfactual_stats, what_would_change
+from es.rulebase import whole_numbers
+
+
+def fractional(profile):
+    return {
+        **profile,
+        "age": profile["age"] + 0.4,
+        "monthly_income": profile["monthly_income"] + 0.5,
+        "current_savings": profile["current_savings"] - 0.3,
+    }
+
+
+def test_whole_numbers_rounds_only_numeric_floats():
+    profile = {"age": 30.6, "monthly_income": 150000.4, "has_high_interest_debt": True, "goal_type": "Retirement"}
+    assert whole_numbers(profile) == {
+        "age": 31,
+        "monthly_income": 150000,
+        "has_high_interest_debt": True,
+        "goal_type": "Retirement",
+    }
+
+
+def test_fractional_profiles_are_treated_as_rounded(profiles):
+    for profile in profiles[:50]:
+        rounded = whole_numbers(fractional(profile))
+        assert result_signature(run_engine(fractional(profile))) == result_signature(run_engine(rounded))
+        assert what_would_change(fractional(profile)) == what_would_change(rounded)
+
+
+def test_cached_counterfactuals_are_independent_copies(profiles):
+    profile = next(profile for profile in profiles if what_would_change(profile))
+    first = what_would_change(profile)
+    first[0]["changes"] = "edited"
+    assert what_would_change(profile)[0]["changes"] != "edited"
+
+
+def test_each_suggested_change_fires_its_target_rule(profiles):
+    checked = 0
+    for profile in profiles[:25]:
+        for counterfactual in what_would_change(profile, limit=None):
+            changed = {**profile, **{change["field"]: change["to"] for change in counterfactual["changes"]}}
+            fired = [record.rule_id for record in run_engine(changed).fired_rules]
+            assert counterfactual["rule_id"] in fired
+            assert fired == counterfactual["rule_ids"]
+            checked += 1
+    assert checked
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What would I need to change to get a different plan?",
+        "what do I have to change?",
+        "What would it take to get an aggressive growth portfolio?",
+        "How can I get a different recommendation?",
+    ],
+)
+def test_explicit_what_would_change_questions_are_recognised(question):
+    assert asks_what_would_change(question)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Can you explain the other plan?",
+        "Why is the other portfolio riskier?",
+        "Do I qualify for a tax rebate on EPF?",
+        "What would change if I invest in gold?",
+        "Is there a better portfolio for someone like me?",
+    ],
+)
+def test_ordinary_follow_ups_are_left_to_the_llm(question):
+    assert not asks_what_would_change(question)
+
+
+def test_cache_counters_count_every_call_across_threads(profiles):
+    before = _counterfactual_stats()
+    threads = [
+        threading.Thread(target=lambda: [what_would_change(profile) for profile in profiles[:20]])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    after = _counterfactual_stats()
+    assert (after["hits"] + after["misses"]) - (before["hits"] + before["misses"]) == 8 * 20
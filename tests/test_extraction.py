@@ -0,0 +1,64 @@
+import pytest
+
+from core.extraction import apply_extracted, coerce_field, describe_rejected, missing_fields
+
+
+@pytest.mark.parametrize(
+    "field, value, expected",
+    [
+        ("monthly_income", "150,000", 150000),
+        ("monthly_income", "LKR 200k", 200000),
+        ("monthly_income", 150000.5, 150000),
+        ("current_savings", "1.5m", 1500000),
+        ("age", 30.4, 30),
+        ("time_horizon", "10", 10),
+        ("has_high_interest_debt", "no", False),
+        ("has_high_interest_debt", True, True),
+        ("risk_tolerance", "high", "High"),
+        ("goal_type", " home purchase ", "Home Purchase"),
+    ],
+)
+def test_coerce_field_converts_to_engine_types(field, value, expected):
+    assert coerce_field(field, value) == expected
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("monthly_income", "a lot"),
+        ("monthly_income", True),
+        ("monthly_expenses", -5000),
+        ("age", 12),
+        ("age", 95),
+        ("time_horizon", 0),
+        ("has_high_interest_debt", "maybe"),
+        ("risk_tolerance", "Very High"),
+        ("goal_type", "Vacation"),
+    ],
+)
+def test_coerce_field_rejects_invalid_values(field, value):
+    with pytest.raises(ValueError):
+        coerce_field(field, value)
+
+
+def test_apply_extracted_stores_valid_values_and_rejects_the_rest():
+    user_data = dict.fromkeys(
+        ["age", "monthly_income", "risk_tolerance", "goal_type"], None
+    )
+    updated, rejected = apply_extracted(
+        user_data,
+        {"age": "30", "monthly_income": "lots", "risk_tolerance": "Extreme", "unknown": 1},
+    )
+    assert updated == ["age"]
+    assert set(rejected) == {"monthly_income", "risk_tolerance"}
+    assert user_data["age"] == 30
+    assert user_data["monthly_income"] is None
+    assert "monthly_income" in missing_fields(user_data)
+    assert "risk tolerance" in describe_rejected(rejected)
+
+
+def test_apply_extracted_accepts_corrections():
+    user_data = {"monthly_income": 150000}
+    updated, rejected = apply_extracted(user_data, {"monthly_income": "200k"})
+    assert updated == ["monthly_income"] and not rejected
+    assert user_data["monthly_income"] == 200000
@@ -0,0 +1,25 @@
+import json
+
+from core.figure_cache import FigureCache
+
+
+def test_hits_return_equal_independent_figures():
+    cache = FigureCache()
+    first = cache.allocation_pie(["Equity", "Bonds"], [60, 40])
+    first.update_layout(height=100)
+    second = cache.allocation_pie(["Equity", "Bonds"], [60, 40])
+
+    assert cache.stats()["hits"] == 1
+    assert second.layout.height == 450
+    built = FigureCache._build_pie(["Equity", "Bonds"], [60, 40], "Bold", 450)
+    assert json.loads(second.to_json()) == json.loads(built.to_json())
+
+
+def test_least_recently_used_figures_are_evicted():
+    cache = FigureCache(max_entries=2)
+    for equity in (50, 60, 70):
+        cache.allocation_pie(["Equity", "Bonds"], [equity, 100 - equity])
+    cache.allocation_pie(["Equity", "Bonds"], [50, 50])
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["hits"] == 0
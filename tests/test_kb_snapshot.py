@@ -0,0 +1,55 @@
+import json
+from collections.abc import Mapping
+
+import pytest
+
+from core.knowledge_base import KnowledgeBaseError, parse_lkr_amount, parse_return_range
+from core.kb_snapshot import KnowledgeBaseSnapshot, compile_snapshot
+
+SOURCE = "app/data/knowledge_base.json"
+
+
+def plain(value):
+    if isinstance(value, Mapping):
+        return {key: plain(item) for key, item in value.items()}
+    return value
+
+
+def test_snapshot_round_trips_the_knowledge_base(tmp_path):
+    output = tmp_path / "kb.bin"
+    fingerprint = compile_snapshot(SOURCE, str(output))
+    snapshot = KnowledgeBaseSnapshot(str(output))
+
+    with open(SOURCE, encoding="utf-8") as f:
+        kb = json.load(f)
+    assert snapshot.fingerprint == fingerprint
+    assert plain(snapshot) == kb
+    for asset, details in kb["asset_classes"].items():
+        assert snapshot.min_investment_lkr(asset) == parse_lkr_amount(details["min_investment"])
+        assert snapshot.return_range(asset) == parse_return_range(details["typical_return"])
+
+
+def test_snapshot_keeps_fields_outside_the_columns(tmp_path):
+    with open(SOURCE, encoding="utf-8") as f:
+        kb = json.load(f)
+    asset = next(iter(kb["asset_classes"]))
+    details = kb["asset_classes"][asset]
+    details["notes"] = "Ünïcode ✓"
+    details["name"] = ["not", "a", "string"]
+    details["provider_links"] = [{"name": "Bank", "url": "https://example.com", "rating": 5}]
+    del details["examples"]
+    source = tmp_path / "kb.json"
+    source.write_text(json.dumps(kb), encoding="utf-8")
+
+    compile_snapshot(str(source), str(tmp_path / "kb.bin"))
+    snapshot = KnowledgeBaseSnapshot(str(tmp_path / "kb.bin"))
+
+    assert plain(snapshot["asset_classes"][asset]) == details
+    assert "examples" not in snapshot["asset_classes"][asset]
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "kb.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(KnowledgeBaseError):
+        KnowledgeBaseSnapshot(str(path))
@@ -0,0 +1,92 @@
+import json
+import shutil
+import time
+
+import pytest
+
+from core.knowledge_base import KnowledgeBaseRegistry
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    shutil.copytree("app/data", tmp_path / "data")
+    return tmp_path / "data" / "knowledge_base.json"
+
+
+def edit(path, change):
+    kb = json.loads(path.read_text(encoding="utf-8"))
+    change(kb)
+    path.write_text(json.dumps(kb), encoding="utf-8")
+
+
+def rename_savings(kb):
+    kb["asset_classes"]["savings_account"]["name"] = "Savings"
+
+
+def test_reload_bumps_version_and_fingerprint_only_on_change(kb_path):
+    registry = KnowledgeBaseRegistry(str(kb_path))
+    version, fingerprint, _ = registry.snapshot()
+    assert version == 1
+
+    assert not registry.reload()
+    assert registry.snapshot()[:2] == (1, fingerprint)
+
+    edit(kb_path, rename_savings)
+    assert registry.reload()
+    assert registry.version == 2
+    assert registry.fingerprint != fingerprint
+    assert registry.data["asset_classes"]["savings_account"]["name"] == "Savings"
+
+
+@pytest.mark.parametrize(
+    "broken",
+    [
+        "{not json",
+        json.dumps({"asset_classes": {}}),
+        json.dumps({"asset_classes": {"gold": {"name": "Gold"}}}),
+    ],
+)
+def test_invalid_file_keeps_the_previous_version(kb_path, broken):
+    registry = KnowledgeBaseRegistry(str(kb_path))
+    before = registry.snapshot()
+    kb_path.write_text(broken, encoding="utf-8")
+
+    assert not registry.reload()
+    assert registry.snapshot() is before
+
+
+def test_subscribers_are_told_the_new_version(kb_path):
+    registry = KnowledgeBaseRegistry(str(kb_path))
+    registry.snapshot()
+    cache = {"entry": "stale"}
+    seen = []
+
+    def failing(version):
+        raise RuntimeError("listener bug")
+
+    registry.subscribe(failing)
+    registry.subscribe(lambda version: (seen.append(version), cache.clear()))
+
+    registry.reload()
+    assert seen == [] and cache
+    edit(kb_path, rename_savings)
+    registry.reload()
+    assert seen == [2]
+    assert cache == {}
+
+
+def test_watcher_reloads_on_file_change(kb_path):
+    registry = KnowledgeBaseRegistry(str(kb_path))
+    registry.snapshot()
+    seen = []
+    registry.subscribe(seen.append)
+    registry.start_watching()
+    try:
+        edit(kb_path, rename_savings)
+        deadline = time.monotonic() + 5
+        while not seen and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        registry.stop_watching()
+    assert seen and registry.version >= 2
+    assert registry.data["asset_classes"]["savings_account"]["name"] == "Savings"
@@ -0,0 +1,65 @@
+import pytest
+
+from core.metrics import Counter, Histogram, MetricsRegistry, muted
+
+
+def test_muted_drops_updates_and_restores_state_when_nested():
+    counter = Counter("test_muted_total", "Test counter.")
+    with muted():
+        with muted():
+            counter.inc()
+        # Leaving the inner block keeps the outer one muted
+        counter.inc()
+    counter.inc()
+    assert counter._values == {(): 1}
+
+
+def test_counter_and_gauge_render_as_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_requests_total", "Requests.", ("page",))
+    gauge = registry.gauge("test_sessions", "Sessions.")
+    counter.inc(page="form")
+    counter.inc(2, page='chat "beta"')
+    gauge.set(3)
+
+    assert registry.render().splitlines() == [
+        "# HELP test_requests_total Requests.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{page="chat \\"beta\\""} 2',
+        'test_requests_total{page="form"} 1',
+        "# HELP test_sessions Sessions.",
+        "# TYPE test_sessions gauge",
+        "test_sessions 3",
+    ]
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("test_seconds", "Durations.", ("phase",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, phase="run")
+
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{phase="run",le="0.1"} 2',
+        'test_seconds_bucket{phase="run",le="1.0"} 3',
+        'test_seconds_bucket{phase="run",le="+Inf"} 4',
+        'test_seconds_sum{phase="run"} 5.65',
+        'test_seconds_count{phase="run"} 4',
+    ]
+
+
+def test_collectors_run_before_render_and_failures_are_skipped():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("test_entries", "Entries.")
+
+    def failing():
+        raise RuntimeError("collector bug")
+
+    registry.add_collector(failing)
+    registry.add_collector(lambda: gauge.set(7))
+    assert "test_entries 7" in registry.render().splitlines()
+
+
+def test_labels_must_match_the_metric():
+    counter = Counter("test_labelled_total", "Labelled.", ("page",))
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
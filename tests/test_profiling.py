@@ -0,0 +1,83 @@
+import json
+import time
+
+import pytest
+
+from core.profiling import profile_request, profile_signature, requested_mode
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def written(directory):
+    collapsed = list(directory.glob("*.collapsed"))
+    assert len(collapsed) == 1
+    metadata = json.loads(collapsed[0].with_suffix(".json").read_text(encoding="utf-8"))
+    stacks = {}
+    for line in collapsed[0].read_text(encoding="utf-8").splitlines():
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    return collapsed[0].name, metadata, stacks
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("RUPEELOGIC_PROFILE_DIR", str(tmp_path))
+    monkeypatch.delenv("RUPEELOGIC_PROFILE", raising=False)
+    return tmp_path
+
+
+def test_mode_comes_from_the_environment_or_an_allowed_query(monkeypatch):
+    monkeypatch.delenv("RUPEELOGIC_PROFILE", raising=False)
+    monkeypatch.delenv("RUPEELOGIC_PROFILE_QUERY", raising=False)
+    assert requested_mode("1") is None
+    monkeypatch.setenv("RUPEELOGIC_PROFILE_QUERY", "true")
+    assert requested_mode("deterministic") == "deterministic"
+    assert requested_mode("bogus") is None
+    monkeypatch.setenv("RUPEELOGIC_PROFILE", "true")
+    assert requested_mode() == "sampling"
+
+
+def test_unprofiled_requests_write_nothing(profile_dir):
+    with profile_request("form") as profile:
+        profile.tag(rules_fired=["x"])
+    assert list(profile_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("mode", ["sampling", "deterministic"])
+def test_profiles_are_written_as_collapsed_stacks_with_tags(profile_dir, monkeypatch, mode):
+    monkeypatch.setenv("RUPEELOGIC_PROFILE", mode)
+    monkeypatch.setenv("RUPEELOGIC_PROFILE_INTERVAL_MS", "1")
+    user_data = {"age": 30, "goal_type": "Retirement", "risk_tolerance": "Low"}
+    with profile_request("chat") as profile:
+        busy(0.05)
+        profile.tag(rules_fired=["short_term_goal"], user_data=user_data, stage="followup")
+
+    name, metadata, stacks = written(profile_dir)
+    assert name.endswith(f"-chat-short_term_goal-{profile_signature(user_data)}.collapsed")
+    assert metadata["mode"] == mode
+    assert metadata["unit"] == ("samples" if mode == "sampling" else "microseconds")
+    assert metadata["rules_fired"] == ["short_term_goal"]
+    assert metadata["stage"] == "followup"
+    assert metadata["goal_type"] == "Retirement"
+    # Stacks start at the profiled code and include the work it did
+    assert all(stack.startswith("test_profiles_are_written") for stack in stacks)
+    assert any("busy (" in stack for stack in stacks)
+    assert all(count > 0 for count in stacks.values())
+
+
+def test_profile_is_written_when_the_request_fails(profile_dir, monkeypatch):
+    monkeypatch.setenv("RUPEELOGIC_PROFILE", "deterministic")
+    with pytest.raises(RuntimeError):
+        with profile_request("form"):
+            raise RuntimeError("stopped")
+    name, _, _ = written(profile_dir)
+    assert "-form-none-nosig" in name
+
+
+def test_signature_is_stable_and_input_dependent():
+    assert profile_signature({"a": 1, "b": 2}) == profile_signature({"b": 2, "a": 1})
+    assert profile_signature({"a": 1}) != profile_signature({"a": 2})
@@ -0,0 +1,29 @@
+from core.recommendation import build_recommendation
+from core.report import render_report
+
+PROFILE = {
+    "age": 30,
+    "monthly_income": 200000,
+    "monthly_expenses": 60000,
+    "current_savings": 2000000,
+    "has_high_interest_debt": False,
+    "risk_tolerance": "High",
+    "goal_type": "Wealth Building",
+    "time_horizon": 10,
+}
+
+
+def test_report_lists_examples_given_as_a_list():
+    context = build_recommendation(PROFILE)
+    item = context["primary_plan"][0]
+    item["examples"] = ["Fund A", "Fund B"]
+    report = render_report(context)
+    assert f"**{item['asset_class']}:** Fund A, Fund B" in report
+    assert "['Fund A'" not in report
+
+
+def test_report_keeps_examples_given_as_text():
+    context = build_recommendation(PROFILE)
+    item = context["primary_plan"][0]
+    item["examples"] = "Fund A or Fund B"
+    assert f"**{item['asset_class']}:** Fund A or Fund B" in render_report(context)
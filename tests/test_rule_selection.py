@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from es.backends import ExpertaBackend, IndexedBackend
+from es.rulebase import RULES_PATH, load_rulebase, select_fired
+from es.RupeeLogicEngine import InvestmentGoal, RupeeLogicEngine, UserProfile, _experta_rule
+
+
+def engine_fired(engine_class, profile):
+    engine = engine_class()
+    engine.reset()
+    engine.declare(
+        UserProfile(
+            age=profile["age"],
+            monthly_income=profile["monthly_income"],
+            monthly_expenses=profile["monthly_expenses"],
+            current_savings=profile["current_savings"],
+            has_high_interest_debt=profile["has_high_interest_debt"],
+            risk_tolerance=profile["risk_tolerance"],
+        )
+    )
+    engine.declare(
+        InvestmentGoal(goal_type=profile["goal_type"], time_horizon=profile["time_horizon"])
+    )
+    engine.run()
+    return [record.rule_id for record in engine.fired_rules]
+
+
+def selected(rule_base, profile):
+    return [rule.id for rule in select_fired([r for r in rule_base if r.matches(profile)])]
+
+
+def test_select_fired_matches_engine(profiles):
+    rule_base = load_rulebase()
+    for profile in profiles:
+        assert engine_fired(RupeeLogicEngine, profile) == selected(rule_base, profile)
+
+
+@pytest.fixture
+def overlapping_rule_base(tmp_path):
+    """rules.json with exclusive rules above some of the non-exclusive ones."""
+    with open(RULES_PATH, encoding="utf-8") as f:
+        spec = json.load(f)
+    saliences = {"short_term_goal": 120, "debt_payoff_priority": 40, "aggressive_growth": 99}
+    for rule in spec["rules"]:
+        rule["salience"] = saliences.get(rule["id"], rule["salience"])
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    return load_rulebase(str(path))
+
+
+def test_select_fired_follows_engine_with_overlapping_saliences(overlapping_rule_base, profiles):
+    # Same rule names as RupeeLogicEngine's, so these override its rules
+    engine_class = type(
+        "OverlappingEngine",
+        (RupeeLogicEngine,),
+        {f"rule_{rule.id}": _experta_rule(rule) for rule in overlapping_rule_base},
+    )
+    short_term = {
+        "age": 30,
+        "monthly_income": 100000,
+        "monthly_expenses": 60000,
+        "current_savings": 0,
+        "has_high_interest_debt": False,
+        "risk_tolerance": "Moderate",
+        "goal_type": "Home Purchase",
+        "time_horizon": 2,
+    }
+    assert selected(overlapping_rule_base, short_term)[:2] == [
+        "short_term_goal",
+        "emergency_fund_priority",
+    ]
+    for profile in [short_term] + profiles:
+        assert engine_fired(engine_class, profile) == selected(overlapping_rule_base, profile)
+
+
+def test_ranked_plans_orders_flags_and_cuts_off(profiles):
+    ranked_any = False
+    for profile in profiles[:100]:
+        results = ExpertaBackend().run(profile)
+        plans = results.ranked_plans()
+        fired = [record.rule_id for record in results.fired_rules]
+
+        assert sorted(plan["rule_id"] for plan in plans) == sorted(rule.id for rule in results.activated_rules)
+        keys = [(-plan["salience"], -plan["confidence"]) for plan in plans]
+        assert keys == sorted(keys)
+        assert {plan["rule_id"] for plan in plans if plan["fired"]} == set(fired)
+        assert results.ranked_plans(k=2) == plans[:2]
+        ranked_any = ranked_any or any(not plan["fired"] for plan in plans)
+    # Some profiles match rules that do not fire (e.g. exclusive ones)
+    assert ranked_any
+
+
+def test_ranked_plans_agree_between_backends(profiles):
+    experta, indexed = ExpertaBackend(), IndexedBackend()
+    for profile in profiles[:100]:
+        assert experta.run(profile).ranked_plans() == indexed.run(profile).ranked_plans()
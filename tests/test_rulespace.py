@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from es.rule_index import rule_index
+from es.rulebase import RULES_PATH, load_rulebase
+from es.RupeeLogicEngine import LIVE_RULES, RULE_BASE, RupeeLogicEngine
+from es.rulespace import RuleSpace, live_rules
+
+NEVER = {
+    "id": "never_matches",
+    "salience": 90,
+    "exclusive": True,
+    "when": [
+        {"field": "age", "op": ">=", "value": 60},
+        {"field": "age", "op": "<", "value": 30},
+    ],
+}
+# Wherever it matches, short_term_goal (salience 80, time_horizon < 3) wins
+SHADOWED = {
+    "id": "always_shadowed",
+    "salience": 40,
+    "exclusive": True,
+    "when": [
+        {"field": "age", "op": ">=", "value": 55},
+        {"field": "risk_tolerance", "op": "==", "value": "High"},
+        {"field": "time_horizon", "op": "<", "value": 2},
+    ],
+}
+
+
+@pytest.fixture
+def rule_base_with_dead_rules(tmp_path):
+    with open(RULES_PATH, encoding="utf-8") as f:
+        spec = json.load(f)
+    template = spec["rules"][-1]
+    for extra in (NEVER, SHADOWED):
+        spec["rules"].append({**template, "number": extra["id"], "name": extra["id"], **extra})
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    return load_rulebase(str(path))
+
+
+def test_dead_rules_are_reported_with_their_reason(rule_base_with_dead_rules):
+    space = RuleSpace(rule_base_with_dead_rules)
+    assert space.dead_rules() == {"never_matches", "always_shadowed"}
+
+    reasons = {dead["rule_id"]: dead["reason"] for dead in space.analyze()["dead_rules"]}
+    assert reasons == {"never_matches": "unsatisfiable", "always_shadowed": "shadowed"}
+
+
+def test_only_live_rules_are_kept(rule_base_with_dead_rules):
+    live, dead = live_rules(rule_base_with_dead_rules)
+    assert dead == {"never_matches", "always_shadowed"}
+    assert [rule.id for rule in live] == [rule.id for rule in RULE_BASE]
+
+
+def test_engine_and_index_load_only_live_rules():
+    live, dead = live_rules(RULE_BASE)
+    assert LIVE_RULES == live
+    for rule in RULE_BASE:
+        assert hasattr(RupeeLogicEngine, f"rule_{rule.id}") == (rule.id not in dead)
+    assert sorted(rule.id for rule in rule_index.rules) == sorted(rule.id for rule in live)
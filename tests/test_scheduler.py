@@ -0,0 +1,161 @@
+import threading
+import time
+
+import httpx
+import pytest
+from openai import APIConnectionError, APITimeoutError
+
+from core.config import CircuitBreaker, LLMScheduler, LLMUnavailable, QuotaExceeded, TokenBucket
+
+
+def scheduler(breaker=None, **limits):
+    settings = {
+        "max_concurrency": 2,
+        "rate": 1000,
+        "burst": 1000,
+        "session_quota": 0,
+        "quota_window": 60,
+        "max_attempts": 2,
+        "queue_timeout": 0.05,
+        **limits,
+    }
+    return LLMScheduler(breaker=breaker or CircuitBreaker(threshold=2, cooldown=60), **settings)
+
+
+def connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.example.com"))
+
+
+def test_token_bucket_waits_for_a_token_up_to_the_timeout():
+    bucket = TokenBucket(rate=20, capacity=1)
+    assert bucket.acquire(0)
+    assert not bucket.acquire(0.01)
+    assert bucket.acquire(0.2)
+
+
+def test_session_quota_raises_quota_exceeded_per_session():
+    llm = scheduler(session_quota=2)
+    for _ in range(2):
+        assert llm.run(lambda: "ok", session_id="a") == "ok"
+    with pytest.raises(QuotaExceeded):
+        llm.run(lambda: "ok", session_id="a")
+    assert llm.run(lambda: "ok", session_id="b") == "ok"
+
+
+def test_quota_refusal_releases_a_half_open_trial():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    llm = scheduler(breaker, session_quota=1)
+    llm.run(lambda: "ok", session_id="a")
+    breaker.record_failure()
+
+    with pytest.raises(QuotaExceeded):
+        llm.run(lambda: "ok", session_id="a")
+    # The trial slot was given back, so another session can probe the provider
+    assert llm.run(lambda: "ok", session_id="b") == "ok"
+    assert not breaker.is_open
+
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise connection_error()
+        return "ok"
+
+    assert scheduler().run(flaky) == "ok"
+    assert len(attempts) == 2
+
+
+def test_breaker_opens_after_repeated_failures_and_half_opens_after_cooldown():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.1)
+    llm = scheduler(breaker, max_attempts=1)
+
+    def failing():
+        raise connection_error()
+
+    for _ in range(2):
+        with pytest.raises(APIConnectionError):
+            llm.run(failing)
+    assert llm.circuit_open
+    with pytest.raises(LLMUnavailable):
+        llm.run(lambda: "ok")
+
+    time.sleep(0.1)
+    # One trial at a time while half-open; a failed trial opens the circuit again
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert llm.circuit_open
+
+    time.sleep(0.1)
+    assert llm.run(lambda: "ok") == "ok"
+    assert not llm.circuit_open
+
+
+def test_request_errors_do_not_count_as_provider_failures():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    llm = scheduler(breaker)
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        llm.run(bad_request)
+    assert not llm.circuit_open
+
+
+def test_calls_that_cannot_get_a_slot_in_time_are_refused():
+    llm = scheduler(max_concurrency=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    thread = threading.Thread(target=llm.run, args=(slow,))
+    thread.start()
+    started.wait(5)
+    try:
+        with pytest.raises(LLMUnavailable, match="busy"):
+            llm.run(lambda: "ok")
+    finally:
+        release.set()
+        thread.join()
+    assert llm.run(lambda: "ok") == "ok"
+
+
+def test_calls_over_the_rate_limit_are_refused():
+    llm = scheduler(rate=0.01, burst=1)
+    assert llm.run(lambda: "ok") == "ok"
+    with pytest.raises(LLMUnavailable, match="rate limit"):
+        llm.run(lambda: "ok")
+
+
+def test_a_deadline_bounds_the_whole_request_across_retries():
+    llm = scheduler(max_attempts=5)
+    deadline = time.monotonic() + 0.3
+    attempts = []
+
+    def slow_timeout():
+        attempts.append(1)
+        time.sleep(min(0.2, max(deadline - time.monotonic(), 0)))
+        raise APITimeoutError(request=httpx.Request("POST", "https://api.example.com"))
+
+    start = time.monotonic()
+    with pytest.raises(APITimeoutError):
+        llm.run(slow_timeout, deadline=deadline)
+    assert time.monotonic() - start < 0.5
+    assert len(attempts) < 5
+
+
+def test_queueing_stops_at_the_deadline():
+    llm = scheduler(rate=0.01, burst=1, queue_timeout=10)
+    llm.run(lambda: "ok")
+    start = time.monotonic()
+    with pytest.raises(LLMUnavailable):
+        llm.run(lambda: "ok", deadline=time.monotonic() + 0.1)
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,34 @@
+from core.session_store import SessionLinks
+
+SID = "0" * 32
+
+
+def test_link_round_trips_until_it_expires():
+    links = SessionLinks(b"secret", ttl=600)
+    link = links.issue(SID, "browser-a", now=1000)
+    assert links.verify(link, "browser-a", now=1500) == SID
+    assert links.verify(link, "browser-a", now=1600) is None
+
+
+def test_link_is_tied_to_the_browser_and_secret():
+    link = SessionLinks(b"secret", ttl=600).issue(SID, "browser-a", now=1000)
+    assert SessionLinks(b"secret", ttl=600).verify(link, "browser-b", now=1000) is None
+    assert SessionLinks(b"other", ttl=600).verify(link, "browser-a", now=1000) is None
+
+
+def test_forged_or_malformed_links_are_rejected():
+    links = SessionLinks(b"secret", ttl=600)
+    sid, expires, signature = links.issue(SID, "browser-a", now=1000).split(".")
+    assert links.verify(f"{sid}.{int(expires) + 3600}.{signature}", "browser-a", now=1000) is None
+    assert links.verify(f"{'1' * 32}.{expires}.{signature}", "browser-a", now=1000) is None
+    for link in (None, "", SID, "a.b.c", f"{SID}.{expires}"):
+        assert links.verify(link, "browser-a", now=1000) is None
+
+
+def test_needs_refresh_once_a_minute():
+    links = SessionLinks(b"secret", ttl=600)
+    link = links.issue(SID, "browser-a", now=1000)
+    assert not links.needs_refresh(link, SID, "browser-a", now=1030)
+    assert links.needs_refresh(link, SID, "browser-a", now=1061)
+    assert links.needs_refresh(link, "1" * 32, "browser-a", now=1000)
+    assert links.needs_refresh(None, SID, "browser-a", now=1000)
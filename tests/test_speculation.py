@@ -0,0 +1,65 @@
+import threading
+
+from core.metrics import RULE_FIRES
+from core.speculation import SpeculativeRecommendations, _stats
+
+PROFILE = {
+    "age": 30,
+    "monthly_income": 200000,
+    "monthly_expenses": 120000,
+    "current_savings": 1500000,
+    "has_high_interest_debt": False,
+    "goal_type": "Retirement",
+    "time_horizon": 10,
+    "risk_tolerance": None,
+}
+
+
+def test_take_returns_the_speculated_completion():
+    speculation = SpeculativeRecommendations()
+    assert speculation.start(PROFILE) == 3
+
+    context, report = speculation.take({**PROFILE, "risk_tolerance": "Low"})
+    assert context["user_profile"]["risk_tolerance"] == "Low"
+    assert report
+
+
+def test_cancel_forgets_all_candidates():
+    speculation = SpeculativeRecommendations()
+    speculation.start(PROFILE)
+    speculation.cancel()
+
+    assert speculation.take({**PROFILE, "risk_tolerance": "Low"}) is None
+
+
+def test_only_categorical_gaps_are_speculated():
+    speculation = SpeculativeRecommendations()
+    assert speculation.start({**PROFILE, "age": None}) == 0
+    assert speculation.start({**PROFILE, "risk_tolerance": "Low"}) == 0
+
+
+def test_only_the_taken_candidate_counts_rule_fires():
+    before = dict(RULE_FIRES._values)
+    speculation = SpeculativeRecommendations()
+    speculation.start(PROFILE)
+    context, _ = speculation.take({**PROFILE, "risk_tolerance": "Low"})
+
+    fires = {key: value - before.get(key, 0) for key, value in RULE_FIRES._values.items()}
+    assert {key for key, value in fires.items() if value} == {(rule_id,) for rule_id, _ in context["fired_rules"]}
+    assert all(fires[(rule_id,)] == 1 for rule_id, _ in context["fired_rules"])
+
+
+def test_take_outcomes_are_counted_across_threads():
+    before = _stats()
+
+    def miss():
+        for _ in range(200):
+            SpeculativeRecommendations().take(PROFILE)
+
+    threads = [threading.Thread(target=miss) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _stats()["misses"] - before["misses"] == 8 * 200
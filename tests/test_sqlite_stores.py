@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from core.llm_cache import LLMResponseCache
+from core.session_store import ChatSessions, SessionStore, SQLiteSessionStore
+from core.sqlite_connections import SQLiteConnections
+from core.transcripts import TranscriptStore
+
+
+def test_connections_are_per_thread_and_create_the_directory(tmp_path):
+    connections = SQLiteConnections(str(tmp_path / "nested" / "db.sqlite"), "CREATE TABLE IF NOT EXISTS t (x);")
+    main = connections()
+    assert connections() is main
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+    assert main.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_llm_cache_evicts_least_recently_used(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=10)
+    cache.put("a", "kb1", "model", "12345")
+    cache.put("b", "kb1", "model", "12345")
+    assert cache.get("a", "kb1") == "12345"
+    cache.put("c", "kb1", "model", "12345")
+    assert cache.get("b", "kb1") is None
+    assert cache.get("a", "kb1") == "12345"
+    assert cache.get("a", "kb2") is None
+
+
+def test_transcripts_round_trip(tmp_path):
+    store = TranscriptStore(str(tmp_path / "transcripts.sqlite"))
+    messages = [{"role": "user", "content": str(i)} for i in range(5)]
+    assert store.append("s1", 0, messages)
+    assert store.load("s1", 1, 3) == messages[1:3]
+    store.delete("s1")
+    assert store.load("s1", 0, 5) == []
+
+
+def test_session_snapshots_round_trip(tmp_path):
+    sessions = ChatSessions(SQLiteSessionStore(str(tmp_path / "sessions.sqlite")))
+    state = {"user_data": {"age": 30}, "messages": [{"role": "user", "content": "hi"}]}
+    sessions.save("sid", state)
+    restored = {}
+    assert sessions.rehydrate("sid", restored)
+    assert restored["user_data"] == {"age": 30}
+    assert restored["messages"] == state["messages"]
+    sessions.delete("sid", restored)
+    assert not sessions.rehydrate("sid", {})
+
+
+def test_session_stores_must_implement_the_interface():
+    class LoadOnly(SessionStore):
+        def load(self, sid):
+            return None
+
+    with pytest.raises(TypeError):
+        LoadOnly()
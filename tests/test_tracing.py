@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from core.tracing import NOOP_SPAN, FileExporter, Tracer, format_traces
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+
+def test_spans_form_a_tree_under_the_turn():
+    exporter = ListExporter()
+    tracer = Tracer(1.0, exporter)
+    with tracer.trace("chat_turn", "session-1", stage="followup"):
+        with tracer.span("engine.run") as span:
+            span.set_attribute("rules_fired", ["short_term_goal"])
+            with tracer.span("engine.record"):
+                pass
+        with tracer.span("llm.request", call_type="followup"):
+            pass
+
+    spans = {span["name"]: span for span in exporter.spans}
+    root = spans["chat_turn"]
+    assert root["parent_id"] is None
+    assert spans["engine.run"]["parent_id"] == root["span_id"]
+    assert spans["engine.record"]["parent_id"] == spans["engine.run"]["span_id"]
+    assert spans["llm.request"]["parent_id"] == root["span_id"]
+    assert {span["trace_id"] for span in exporter.spans} == {root["trace_id"]}
+    assert {span["session_id"] for span in exporter.spans} == {"session-1"}
+    assert spans["engine.run"]["attributes"] == {"rules_fired": ["short_term_goal"]}
+    # Children finish, and are exported, before their parents
+    assert [span["name"] for span in exporter.spans][-1] == "chat_turn"
+
+
+def test_errors_are_recorded_on_the_span():
+    exporter = ListExporter()
+    tracer = Tracer(1.0, exporter)
+    with pytest.raises(KeyError):
+        with tracer.trace("chat_turn", "session-1"):
+            with tracer.span("extraction"):
+                raise KeyError("age")
+    assert [span["attributes"].get("error") for span in exporter.spans] == ["KeyError", "KeyError"]
+
+
+def test_unsampled_sessions_and_spans_outside_a_trace_are_noops():
+    exporter = ListExporter()
+    with Tracer(1.0, exporter).span("engine.run") as span:
+        assert span is NOOP_SPAN
+    with Tracer(0.0, exporter).trace("chat_turn", "session-1") as span:
+        assert span is NOOP_SPAN
+    assert exporter.spans == []
+
+
+def test_sampling_is_decided_per_session():
+    tracer = Tracer(0.5, ListExporter())
+    sessions = [f"session-{i}" for i in range(400)]
+    decisions = [tracer.sampled(session) for session in sessions]
+    assert decisions == [tracer.sampled(session) for session in sessions]
+    assert 120 < sum(decisions) < 280
+    assert not Tracer(1.0, None).sampled("session-1")
+
+
+def test_exported_file_prints_as_an_indented_tree(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracer = Tracer(1.0, FileExporter(str(path)))
+    with tracer.trace("chat_turn", "session-1"):
+        with tracer.span("engine.run", rules=2):
+            pass
+
+    spans = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    lines = format_traces(spans).splitlines()
+    assert lines[0].endswith("session session-1")
+    assert lines[1].startswith("  chat_turn")
+    assert lines[2].startswith("    engine.run")
+    assert lines[2].endswith("rules=2")
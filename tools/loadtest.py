@@ -0,0 +1,364 @@
+"""
+Multi-session load test for the Streamlit pages.
+
+Drives form.py and chat.py headlessly with Streamlit's AppTest, one AppTest per
+simulated user session, against the local mock LLM (tools/mock_openai.py), and
+reports per-page rerun latency percentiles, CPU use, memory per session and
+throughput. Run from the repository root:
+
+    python tools/loadtest.py --sessions 40 --concurrency 8
+    python tools/loadtest.py --pages chat --mock-latency-ms 800 --mock-error-rate 0.05
+    python tools/loadtest.py --base-url http://127.0.0.1:8001/v1 --json results.json
+
+Every session keeps its AppTest alive until the run ends, so the resident
+memory growth divided by the number of sessions approximates the cost of one
+idle session holding a finished recommendation.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+PAGES = {
+    "form": os.path.join(APP_DIR, "form.py"),
+    "chat": os.path.join(APP_DIR, "chat.py"),
+}
+
+GOALS = ["Wealth Building", "Retirement", "Child Education", "Home Purchase", "Emergency Fund"]
+TIMELINES = [
+    "1-2 years (Short-term)",
+    "3-5 years (Medium-term)",
+    "6-10 years (Long-term)",
+    "More than 10 years (Very Long-term)",
+]
+RISKS = ["Low", "Moderate", "High"]
+FOLLOW_UPS = [
+    "Why is this plan good for me?",
+    "Where can I open a fixed deposit?",
+    "What happens if I increase my risk tolerance?",
+]
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak RSS; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def random_profile(rng):
+    income = rng.choice([60000, 100000, 150000, 250000, 400000])
+    return {
+        "age": rng.randint(20, 65),
+        "monthly_income": income,
+        "monthly_expenses": int(income * rng.uniform(0.4, 0.95)),
+        "current_savings": rng.choice([0, 50000, 300000, 1000000, 5000000]),
+        "has_high_interest_debt": rng.random() < 0.1,
+        "goal_type": rng.choice(GOALS),
+        "time_horizon": rng.choice([2, 4, 8, 15]),
+        "risk_tolerance": rng.choice(RISKS),
+    }
+
+
+class Recorder:
+    """Thread-safe collection of rerun timings and failures per page."""
+
+    def __init__(self):
+        self.latencies = {page: [] for page in PAGES}
+        self.errors = {page: 0 for page in PAGES}
+        self.sessions = {page: 0 for page in PAGES}
+        self._lock = threading.Lock()
+
+    def rerun(self, page, at, action):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[page].append(elapsed)
+            if at.exception:
+                self.errors[page] += 1
+
+    def session_done(self, page):
+        with self._lock:
+            self.sessions[page] += 1
+
+
+def share_streamlit_runtime():
+    """
+    Let AppTests run concurrently in one process, like sessions on one server.
+
+    AppTest installs a mock Runtime singleton and the "global.appTest" config
+    option before each run and resets both afterwards, so a run finishing in
+    one thread breaks runs still going in others. Install one shared mock
+    runtime and set the option once instead, and point AppTest at a Runtime
+    subclass so its per-run set/clear no longer touches the real singleton.
+    Scripts are compiled once into a shared ScriptCache, as on a real server;
+    compiling them concurrently trips a CPython AST race.
+    """
+    import contextlib
+    from unittest.mock import MagicMock
+
+    from streamlit import config as st_config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import (
+        MemoryCacheStorageManager,
+    )
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("Runtime", (Runtime,), {})
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    st_config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+
+
+def form_session(rng, recorder, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(PAGES["form"], default_timeout=timeout)
+    recorder.rerun("form", at, at.run)
+
+    profile = random_profile(rng)
+    # Leave some fields empty so the page's defaults are exercised too
+    for index, field in enumerate(
+        ["age", "monthly_income", "monthly_expenses", "current_savings"]
+    ):
+        if rng.random() < 0.8:
+            widget = at.number_input[index]
+            widget.set_value(min(max(profile[field], widget.min), widget.max))
+    if profile["has_high_interest_debt"]:
+        at.checkbox[0].check()
+    if rng.random() < 0.8:
+        at.selectbox[0].set_value(profile["goal_type"])
+    if rng.random() < 0.8:
+        at.selectbox[1].set_value(rng.choice(TIMELINES))
+    if rng.random() < 0.8:
+        at.selectbox[2].set_value(profile["risk_tolerance"])
+    at.button[0].click()
+    recorder.rerun("form", at, at.run)
+    recorder.session_done("form")
+    return at
+
+
+def chat_session(rng, recorder, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(PAGES["chat"], default_timeout=timeout)
+    recorder.rerun("chat", at, at.run)
+
+    profile = random_profile(rng)
+    fields = list(profile)
+    # Mostly give the numbers first and the categorical answers last (the speculative path)
+    if rng.random() < 0.7:
+        turns = [fields[:5] + ["time_horizon"], ["goal_type", "risk_tolerance"]]
+    else:
+        rng.shuffle(fields)
+        turns = [fields[:4], fields[4:]]
+
+    for turn in turns:
+        if not at.chat_input:
+            # The previous rerun failed; it is already counted as an error
+            return at
+        message = ", ".join(
+            f"{field}: {str(profile[field]).lower() if isinstance(profile[field], bool) else profile[field]}"
+            for field in turn
+        )
+        at.chat_input[0].set_value(message)
+        recorder.rerun("chat", at, at.run)
+        # Users take a moment to type the next answer
+        time.sleep(rng.uniform(0, 0.05))
+
+    if not at.chat_input:
+        return at
+    at.chat_input[0].set_value(rng.choice(FOLLOW_UPS))
+    recorder.rerun("chat", at, at.run)
+    recorder.session_done("chat")
+    return at
+
+
+SCENARIOS = {"form": form_session, "chat": chat_session}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(recorder, wall, cpu, rss_growth, sessions_total):
+    pages = {}
+    for page, latencies in recorder.latencies.items():
+        if not latencies:
+            continue
+        pages[page] = {
+            "sessions": recorder.sessions[page],
+            "reruns": len(latencies),
+            "errors": recorder.errors[page],
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+        }
+    reruns = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "cpu_cores_used": cpu / wall if wall else 0.0,
+        "cpu_ms_per_rerun": cpu / reruns * 1000 if reruns else 0.0,
+        "reruns_per_s": reruns / wall if wall else 0.0,
+        "sessions_per_s": sessions_total / wall if wall else 0.0,
+        "memory_per_session_kib": rss_growth / sessions_total / 1024 if sessions_total else 0.0,
+        "pages": pages,
+    }
+
+
+def print_report(summary):
+    print()
+    print(f"{'page':<6}{'sessions':>9}{'reruns':>8}{'errors':>8}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for page, stats in summary["pages"].items():
+        print(
+            f"{page:<6}{stats['sessions']:>9}{stats['reruns']:>8}{stats['errors']:>8}"
+            f"{stats['p50_ms']:>9.0f}{stats['p90_ms']:>9.0f}{stats['p95_ms']:>9.0f}"
+            f"{stats['p99_ms']:>9.0f}{stats['max_ms']:>9.0f}"
+        )
+    print()
+    print(f"wall time            {summary['wall_s']:.1f} s")
+    print(f"throughput           {summary['reruns_per_s']:.1f} reruns/s, "
+          f"{summary['sessions_per_s']:.2f} sessions/s")
+    print(f"CPU                  {summary['cpu_s']:.1f} s ({summary['cpu_cores_used']:.2f} cores), "
+          f"{summary['cpu_ms_per_rerun']:.1f} ms per rerun")
+    print(f"memory per session   {summary['memory_per_session_kib']:.0f} KiB")
+
+
+def start_mock(args):
+    sys.path.insert(0, os.path.join(ROOT, "tools"))
+    import mock_openai
+
+    mock_args = mock_openai.build_parser().parse_args(
+        [
+            "--port", "0",
+            "--latency", args.mock_latency,
+            "--latency-ms", str(args.mock_latency_ms),
+            "--error-rate", str(args.mock_error_rate),
+            "--rate-limit-rate", str(args.mock_rate_limit_rate),
+            "--seed", str(args.seed),
+        ]
+    )
+    server = mock_openai.serve(mock_args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RupeeLogic Streamlit pages")
+    parser.add_argument("--sessions", type=int, default=20, help="Simulated sessions in total")
+    parser.add_argument("--concurrency", type=int, default=4, help="Sessions running at once")
+    parser.add_argument("--pages", default="form,chat", help="Comma-separated pages to mix")
+    parser.add_argument("--chat-share", type=float, default=0.5, help="Share of chat sessions")
+    parser.add_argument("--base-url", help="Use this LLM endpoint instead of starting the mock")
+    parser.add_argument("--mock-latency", default="lognormal", choices=("fixed", "uniform", "lognormal"))
+    parser.add_argument("--mock-latency-ms", type=float, default=300)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds allowed per rerun")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    pages = [page.strip() for page in args.pages.split(",") if page.strip()]
+    unknown = set(pages) - set(PAGES)
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(sorted(unknown))}")
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server, base_url = start_mock(args)
+
+    # Must be set before the app modules (and core.config) are imported
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ.setdefault("RUPEELOGIC_LLM_CACHE", "")
+    os.chdir(ROOT)
+    sys.path.insert(0, APP_DIR)
+
+    rng = random.Random(args.seed)
+    plan = []
+    for _ in range(args.sessions):
+        if len(pages) == 1:
+            plan.append(pages[0])
+        else:
+            plan.append("chat" if rng.random() < args.chat_share else "form")
+    seeds = [rng.randrange(2**32) for _ in plan]
+
+    share_streamlit_runtime()
+
+    # Warm up imports and caches so they are not counted against the sessions
+    warm = Recorder()
+    warm_sessions = [SCENARIOS[page](random.Random(0), warm, args.timeout) for page in set(plan)]
+
+    recorder = Recorder()
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(SCENARIOS[page], random.Random(seed), recorder, args.timeout)
+            for page, seed in zip(plan, seeds)
+        ]
+        live_sessions = [future.result() for future in futures]
+
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    rss_growth = max(rss_bytes() - rss_before, 0)
+
+    summary = summarize(recorder, wall, cpu, rss_growth, len(live_sessions))
+    summary["config"] = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "pages": pages,
+        "llm": base_url,
+    }
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    del warm_sessions, live_sessions
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Lets Chat Mode run offline, and under controlled latency and failures, for
+development, CI and load tests. Only POST /v1/chat/completions (plus GET
+/v1/models) is implemented, including JSON mode and streaming (SSE).
+
+    python tools/mock_openai.py --port 8001 --latency lognormal --latency-ms 400
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock streamlit run app/main.py
+
+Responses come from a script file when one of its rules matches, otherwise
+from built-in rules that understand RupeeLogic's prompts:
+
+- JSON mode (profile extraction): fields listed under "Missing fields" in the
+  system prompt are read from "field: value" / "field=value" pairs in the user
+  message, e.g. "age: 30, monthly_income=200000, risk_tolerance: High".
+- Report polish: the report after "Report:" is returned unchanged.
+- Anything else: a short canned answer.
+
+A script file is a JSON list of rules, tried in order against the last user
+message (and the system prompt when "role" is "system"):
+
+    [{"match": "retire", "response": "Retirement plans ..."},
+     {"match": ".*", "role": "system", "json": {"extracted_data": {}, "message_to_user": "Hi"}}]
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIELD_PATTERN = re.compile(r"\b([a-z_]+)\s*[:=]\s*([^,;\n]+)")
+
+
+def _coerce(value):
+    value = value.strip().strip("\"'")
+    lowered = value.lower()
+    if lowered in ("true", "yes"):
+        return True
+    if lowered in ("false", "no"):
+        return False
+    number = value.replace(",", "")
+    if re.fullmatch(r"-?\d+", number):
+        return int(number)
+    if re.fullmatch(r"-?\d+\.\d+", number):
+        return float(number)
+    return value
+
+
+def _missing_fields(system_prompt):
+    """Field names listed under "Missing fields:" in the extraction prompt."""
+    _, _, section = system_prompt.partition("Missing fields:")
+    return re.findall(r"^\s*- ([a-z_]+):", section, flags=re.MULTILINE)
+
+
+def extraction_response(system_prompt, user_message):
+    missing = _missing_fields(system_prompt)
+    extracted = {
+        field: _coerce(value)
+        for field, value in FIELD_PATTERN.findall(user_message)
+        if field in missing
+    }
+    still_missing = [field for field in missing if field not in extracted]
+    if still_missing:
+        message = "Thanks! Could you also tell me your " + ", ".join(
+            field.replace("_", " ") for field in still_missing
+        ) + "?"
+    else:
+        message = "Thanks, I have everything I need. Generating your recommendations now."
+    return json.dumps({"extracted_data": extracted, "message_to_user": message})
+
+
+def builtin_response(messages, json_mode):
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    if json_mode:
+        return extraction_response(system, user)
+    _, found, report = user.partition("Report:")
+    if found:
+        return report.strip()
+    return (
+        "Based on your recommendation, this allocation balances growth and safety "
+        "for your goal. Review it yearly and keep your emergency fund in place."
+    )
+
+
+class Behaviour:
+    """Latency, failure and scripted-response settings shared by all request threads."""
+
+    def __init__(self, args):
+        self.latency = args.latency
+        self.latency_ms = args.latency_ms
+        self.latency_sigma = args.latency_sigma
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.rpm = args.rpm
+        self.stream_chunk_ms = args.stream_chunk_ms
+        self.rules = []
+        if args.script:
+            with open(args.script, "r", encoding="utf-8") as f:
+                self.rules = [
+                    {**rule, "pattern": re.compile(rule["match"], re.IGNORECASE | re.DOTALL)}
+                    for rule in json.load(f)
+                ]
+        self._random = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self._window = []
+
+    def delay(self):
+        with self._lock:
+            if self.latency == "fixed":
+                ms = self.latency_ms
+            elif self.latency == "uniform":
+                ms = self._random.uniform(0, 2 * self.latency_ms)
+            else:
+                # latency_ms is the median; sigma controls the tail
+                ms = self._random.lognormvariate(math.log(max(self.latency_ms, 1)), self.latency_sigma)
+        time.sleep(ms / 1000)
+
+    def failure(self):
+        """Return an (HTTP status, message) to inject, or None to answer normally."""
+        with self._lock:
+            now = time.monotonic()
+            if self.rpm:
+                self._window = [t for t in self._window if now - t < 60]
+                if len(self._window) >= self.rpm:
+                    return 429, "Rate limit reached for requests"
+                self._window.append(now)
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429, "Rate limit reached for requests"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, "The server had an error while processing your request"
+        return None
+
+    def respond(self, messages, json_mode):
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        for rule in self.rules:
+            target = system if rule.get("role") == "system" else user
+            if rule["pattern"].search(target):
+                if "json" in rule:
+                    return json.dumps(rule["json"])
+                return rule["response"]
+        return builtin_response(messages, json_mode)
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    behaviour = None  # set by serve()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        behaviour = self.behaviour
+        failure = behaviour.failure()
+        behaviour.delay()
+        if failure is not None:
+            status, message = failure
+            error_type = "rate_limit_error" if status == 429 else "server_error"
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json(status, {"error": {"message": message, "type": error_type}}, headers)
+            return
+
+        messages = request.get("messages", [])
+        json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+        content = behaviour.respond(messages, json_mode)
+        model = request.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        usage = {
+            "prompt_tokens": sum(_tokens(m.get("content") or "") for m in messages),
+            "completion_tokens": _tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            self._stream(completion_id, model, content)
+            return
+
+        self._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(self, completion_id, model, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        chunk({"role": "assistant", "content": ""})
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            chunk({"content": piece})
+            if self.behaviour.stream_chunk_ms:
+                time.sleep(self.behaviour.stream_chunk_ms / 1000)
+        chunk({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve(args):
+    """Start the server; returns it so callers (tests, load runs) can shut it down."""
+    handler = type("Handler", (MockOpenAIHandler,), {"behaviour": Behaviour(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--script", help="JSON file of scripted response rules")
+    parser.add_argument(
+        "--latency", choices=("fixed", "uniform", "lognormal"), default="lognormal"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=300, help="Fixed/mean/median latency in ms"
+    )
+    parser.add_argument(
+        "--latency-sigma", type=float, default=0.5, help="Lognormal spread (tail weight)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500s")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="Share of random HTTP 429s"
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)"
+    )
+    parser.add_argument(
+        "--stream-chunk-ms", type=float, default=0, help="Delay between streamed chunks"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = serve(args)
+    print(f"Mock OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()